@@ -1,8 +1,11 @@
 # FILE: ai.py (VERSIÓN FINAL CON MODELO CORREGIDO)
+import logging
 import os
 import json
 import google.generativeai as genai
 
+log = logging.getLogger("gastos.ai")
+
 SYSTEM_PROMPT = """
 Tu tarea es actuar como un servicio de extracción de datos. Analiza el texto del usuario sobre un gasto y devuelve SIEMPRE un objeto JSON con los siguientes campos: "amount" (number), "category" (string), "note" (string, opcional), "date" (string en formato YYYY-MM-DD), "payment_method" (string, opcional).
 
@@ -15,37 +18,66 @@ Reglas estrictas:
 - Si no puedes determinar un campo, déjalo como null, pero siempre incluye todos los campos en el JSON.
 """
 
-def ai_parse_expense(text: str, today_iso: str):
-    """
-    Usa Google Gemini con modo JSON para un parseo confiable.
-    """
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        return None, "La API Key de Google no está configurada."
+_model = None
 
-    try:
-        genai.configure(api_key=api_key)
 
+def get_model():
+    # El cliente se configura y el modelo se construye una sola vez por proceso
+    global _model
+    if _model is None:
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            return None
+        genai.configure(api_key=api_key)
         # CORRECCIÓN: Usamos el modelo 'gemini-pro' que es de disponibilidad general
-        model = genai.GenerativeModel(
+        _model = genai.GenerativeModel(
             'gemini-pro',
             generation_config={"response_mime_type": "application/json"}
         )
+    return _model
+
+
+def _prompt(text, today_iso):
+    return SYSTEM_PROMPT.format(today_iso=today_iso) + "\n\nTexto del usuario a analizar: " + text
+
 
-        full_prompt = SYSTEM_PROMPT.format(today_iso=today_iso) + "\n\nTexto del usuario a analizar: " + text
+def _result(raw, today_iso):
+    parsed_json = json.loads(raw)
 
-        response = model.generate_content(full_prompt)
+    if not parsed_json.get("amount") or not parsed_json.get("category"):
+        return None, "La IA no pudo determinar el monto o la categoría."
 
-        parsed_json = json.loads(response.text)
+    if "date" not in parsed_json or not parsed_json.get("date"):
+        parsed_json["date"] = today_iso
 
-        if not parsed_json.get("amount") or not parsed_json.get("category"):
-            return None, "La IA no pudo determinar el monto o la categoría."
+    return parsed_json, None
 
-        if "date" not in parsed_json or not parsed_json.get("date"):
-            parsed_json["date"] = today_iso
 
-        return parsed_json, None
+def ai_parse_expense(text: str, today_iso: str):
+    """
+    Usa Google Gemini con modo JSON para un parseo confiable.
+    """
+    model = get_model()
+    if model is None:
+        return None, "La API Key de Google no está configurada."
+
+    try:
+        response = model.generate_content(_prompt(text, today_iso))
+        return _result(response.text, today_iso)
+    except Exception as e:
+        log.warning("error en la llamada a Gemini", extra={"error": str(e)})
+        return None, f"Error de IA: {e}"
+
 
+async def ai_parse_expense_async(text: str, today_iso: str):
+    # Misma lógica sin bloquear el event loop (la usa pipeline.py)
+    model = get_model()
+    if model is None:
+        return None, "La API Key de Google no está configurada."
+
+    try:
+        response = await model.generate_content_async(_prompt(text, today_iso))
+        return _result(response.text, today_iso)
     except Exception as e:
-        print(f"Error en la llamada a Gemini: {e}")
-        return None, f"Error de IA: {e}"
\ No newline at end of file
+        log.warning("error en la llamada a Gemini", extra={"error": str(e)})
+        return None, f"Error de IA: {e}"
@@ -1,8 +1,10 @@
 # FILE: ai_openai.py
+import logging
 import os
 import openai
 import json
-from datetime import datetime
+
+log = logging.getLogger("gastos.ai")
 
 SYSTEM_PROMPT = """
 Tu tarea es actuar como un servicio de extracción de datos. Analiza el texto del usuario sobre un gasto y devuelve SIEMPRE un objeto JSON con los siguientes campos: "amount" (number), "category" (string), "note" (string, opcional), "date" (string en formato YYYY-MM-DD), "payment_method" (string, opcional).
@@ -16,30 +18,71 @@ Reglas estrictas:
 - Si no puedes determinar un campo, déjalo como null, pero siempre incluye todos los campos en el JSON.
 """
 
+MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")  # o "gpt-4" si tienes acceso
+
+_client = None
+_async_client = None
+
+
+def get_client():
+    # Clientes únicos por proceso: reutilizan su pool de conexiones HTTP
+    global _client
+    if _client is None and os.getenv("OPENAI_API_KEY"):
+        _client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
+
+
+def get_async_client():
+    global _async_client
+    if _async_client is None and os.getenv("OPENAI_API_KEY"):
+        _async_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _async_client
+
+
+def _messages(text, today_iso):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT.format(today_iso=today_iso)},
+        {"role": "user", "content": text}
+    ]
+
+
+def _result(response, today_iso):
+    # La respuesta estará en response.choices[0].message.content como JSON
+    parsed_json = json.loads(response.choices[0].message.content)
+    if not parsed_json.get("amount") or not parsed_json.get("category"):
+        return None, "La IA no pudo determinar el monto o la categoría."
+    if "date" not in parsed_json or not parsed_json.get("date"):
+        parsed_json["date"] = today_iso
+    return parsed_json, None
+
+
 def ai_parse_expense_openai(text: str, today_iso: str):
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+    client = get_client()
+    if client is None:
         return None, "La API Key de OpenAI no está configurada."
+    try:
+        response = client.chat.completions.create(
+            model=MODEL,
+            messages=_messages(text, today_iso),
+            response_format={"type": "json_object"}
+        )
+        return _result(response, today_iso)
+    except Exception as e:
+        log.warning("error en la llamada a OpenAI", extra={"error": str(e)})
+        return None, f"Error de IA: {e}"
 
-    openai.api_key = api_key
 
+async def ai_parse_expense_openai_async(text: str, today_iso: str):
+    client = get_async_client()
+    if client is None:
+        return None, "La API Key de OpenAI no está configurada."
     try:
-        prompt = SYSTEM_PROMPT.format(today_iso=today_iso)
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",  # o "gpt-4" si tienes acceso
-            messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": text}
-            ],
+        response = await client.chat.completions.create(
+            model=MODEL,
+            messages=_messages(text, today_iso),
             response_format={"type": "json_object"}
         )
-        # La respuesta estará en response.choices[0].message.content como JSON
-        parsed_json = json.loads(response.choices[0].message.content)
-        if not parsed_json.get("amount") or not parsed_json.get("category"):
-            return None, "La IA no pudo determinar el monto o la categoría."
-        if "date" not in parsed_json or not parsed_json.get("date"):
-            parsed_json["date"] = today_iso
-        return parsed_json, None
+        return _result(response, today_iso)
     except Exception as e:
-        print(f"Error en la llamada a OpenAI: {e}")
-        return None, f"Error de IA: {e}"
\ No newline at end of file
+        log.warning("error en la llamada a OpenAI", extra={"error": str(e)})
+        return None, f"Error de IA: {e}"
@@ -0,0 +1,136 @@
+# Cliente HTTP asíncrono del bot hacia la API.
+#
+# Un único httpx.AsyncClient por proceso: reutiliza conexiones keep-alive
+# (TLS incluido) entre mensajes y nunca bloquea el event loop del bot.
+# Los reintentos con backoff cubren el arranque en frío de Render, que mientras
+# despierta responde 502/503/504 o directamente rechaza la conexión.
+import asyncio
+import os
+import random
+import re
+from datetime import date, timedelta
+from urllib.parse import quote
+
+import httpx
+
+API_URL = os.getenv("API_URL", "https://entrega-topicos-backend.onrender.com")
+
+# connect es generoso porque un cold start de Render tarda varios segundos
+TIMEOUT = httpx.Timeout(connect=10.0, read=30.0, write=10.0, pool=5.0)
+LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60)
+RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+RETRY_STATUS = {502, 503, 504}
+
+
+class ApiError(Exception):
+    def __init__(self, detail, status_code=None):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+def _detail(response):
+    # Mostrar el error exacto que devuelve la API (si es JSON, el "detail")
+    try:
+        return response.json().get("detail", response.text)
+    except Exception:
+        return response.text
+
+
+class ApiClient:
+    def __init__(self, base_url=API_URL, retries=RETRIES):
+        self.retries = retries
+        self._client = httpx.AsyncClient(base_url=base_url, timeout=TIMEOUT, limits=LIMITS)
+
+    async def close(self):
+        await self._client.aclose()
+
+    async def request(self, method, path, **kwargs):
+        # Un POST solo se reintenta si sabemos que no llegó a procesarse: la
+        # conexión no se pudo abrir o el proxy de Render respondió sin pasar
+        # el pedido a la app. Un timeout de lectura no se reintenta porque el
+        # gasto pudo haberse registrado igual.
+        attempt = 0
+        while True:
+            try:
+                response = await self._client.request(method, path, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                if attempt >= self.retries:
+                    raise ApiError(f"No se pudo conectar con la API: {e.__class__.__name__}") from e
+            except httpx.HTTPError as e:
+                raise ApiError(f"Error de comunicación con la API: {e.__class__.__name__}") from e
+            else:
+                if response.status_code not in RETRY_STATUS or attempt >= self.retries:
+                    if response.status_code >= 400:
+                        raise ApiError(_detail(response), response.status_code)
+                    return response
+            # Backoff exponencial con jitter
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+            await asyncio.sleep(delay / 2 + random.uniform(0, delay / 2))
+            attempt += 1
+
+    async def get(self, path, **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request("POST", path, **kwargs)
+
+    async def download(self, path, fileobj, max_bytes=None, **kwargs):
+        # Descarga en streaming a `fileobj` sin tener la respuesta entera en
+        # memoria. Devuelve (bytes escritos, nombre de archivo sugerido).
+        try:
+            async with self._client.stream("GET", path, **kwargs) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    raise ApiError(_detail(response), response.status_code)
+                size = 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise ApiError(f"El archivo supera el máximo de {max_bytes // (1024 * 1024)} MB")
+                    fileobj.write(chunk)
+                disposition = response.headers.get("content-disposition", "")
+        except httpx.HTTPError as e:
+            raise ApiError(f"Error de comunicación con la API: {e.__class__.__name__}") from e
+        m = re.search(r'filename="([^"]+)"', disposition)
+        return size, m.group(1) if m else None
+
+    async def digest(self, user_id, start, end, top=5, timeout=None):
+        # start/end: fechas ISO con fin exclusivo (como period_week/period_month)
+        last_day = (date.fromisoformat(end) - timedelta(days=1)).isoformat()
+        response = await self.get(
+            f"/api/users/{user_id}/digest",
+            params={"start": start, "end": last_day, "top": top},
+            **({"timeout": timeout} if timeout else {}),
+        )
+        return response.json()
+
+    async def export(self, user_id, fileobj, fmt="csv", start=None, end=None, max_bytes=None):
+        # Exportación gzip a `fileobj`; start/end: fechas ISO con fin exclusivo,
+        # sin ellas el historial completo. Devuelve (bytes, nombre de archivo).
+        params = {"format": fmt, "gzip": "true", "period": "all"}
+        if start:
+            params.update(start=start, end=(date.fromisoformat(end) - timedelta(days=1)).isoformat())
+        return await self.download(f"/api/users/{user_id}/export", fileobj, max_bytes=max_bytes, params=params)
+
+    async def budgets(self, user_id):
+        response = await self.get(f"/api/users/{user_id}/budgets")
+        return response.json()
+
+    async def set_budget(self, user_id, category, amount):
+        response = await self.request("PUT", f"/api/users/{user_id}/budgets/{quote(category, safe='')}", json={"amount": amount})
+        return response.json()
+
+    async def delete_budget(self, user_id, category):
+        response = await self.request("DELETE", f"/api/users/{user_id}/budgets/{quote(category, safe='')}")
+        return response.json()
+
+    async def create_expense(self, expense):
+        response = await self.post("/api/expenses", json=expense)
+        return response.json()
+
+    async def create_expenses(self, expenses):
+        response = await self.post("/api/expenses/batch", json={"expenses": expenses})
+        return response.json()
@@ -0,0 +1,110 @@
+# Paridad y throughput del parser de gastos.
+#
+# Uso (desde backend/):
+#   python -m bench.bench_parser                       # paridad + tiempos
+#   python -m bench.bench_parser --check               # solo paridad (sale 1 si falla)
+#   git show <rev>:backend/parser.py > /tmp/old_parser.py
+#   python -m bench.bench_parser --baseline /tmp/old_parser.py > after.json
+#
+# El corpus (parser_corpus.jsonl) tiene la salida exacta esperada para cada
+# mensaje. Los casos "legacy" se grabaron con el parser anterior y tienen que
+# dar idéntico; los "new" cubren los formatos agregados después.
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import sys
+import time
+from pathlib import Path
+
+import parser as expense_parser
+
+CORPUS = Path(__file__).with_name("parser_corpus.jsonl")
+
+
+def load_corpus(path=CORPUS):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check(cases):
+    mismatches = []
+    for case in cases:
+        if case["kind"] == "one":
+            parsed, err = expense_parser.parse_gasto_args(case["text"], case["today"])
+            got, want = (parsed, err), (case["expected"], case["error"])
+        else:
+            parsed, errors = expense_parser.parse_many(case["text"], case["today"])
+            got, want = ([list(e) for e in parsed], [list(e) for e in errors]), (case["expected"], case["errors"])
+        if got != want:
+            mismatches.append({"text": case["text"], "got": got, "want": want})
+    return mismatches
+
+
+def _time(fn, texts, today, iterations):
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        for text in texts:
+            fn(text, today)
+    elapsed = time.perf_counter() - t0
+    calls = iterations * len(texts)
+    return {"calls": calls, "us_per_call": round(elapsed / calls * 1e6, 3), "calls_per_s": round(calls / elapsed)}
+
+
+def _load_baseline(path):
+    spec = importlib.util.spec_from_file_location("baseline_parser", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench(cases, iterations, baseline=None):
+    singles = [c for c in cases if c["kind"] == "one"]
+    texts = [c["text"] for c in singles]
+    today = singles[0]["today"]
+    result = {"parse_gasto_args": _time(expense_parser.parse_gasto_args, texts, today, iterations)}
+
+    # Un mensaje con todo el corpus, una línea por gasto
+    message = "\n".join(t for t in texts if "\n" not in t)
+    many = _time(expense_parser.parse_many, [message], today, iterations)
+    many["lines"] = message.count("\n") + 1
+    result["parse_many"] = many
+
+    if baseline:
+        # El parser viejo imprime en cada llamada; se descarta esa salida. Se
+        # compara solo sobre los casos legacy, que ambos entienden igual.
+        old = _load_baseline(baseline)
+        legacy = [c["text"] for c in singles if c["origin"] == "legacy"]
+        with contextlib.redirect_stdout(io.StringIO()):
+            before = _time(old.parse_gasto_args, legacy, today, iterations)
+        after = _time(expense_parser.parse_gasto_args, legacy, today, iterations)
+        result["legacy_subset"] = {
+            "baseline": before,
+            "current": after,
+            "speedup": round(before["us_per_call"] / after["us_per_call"], 2),
+        }
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", default=str(CORPUS))
+    ap.add_argument("--iterations", type=int, default=200)
+    ap.add_argument("--baseline", help="archivo parser.py anterior para comparar tiempos")
+    ap.add_argument("--check", action="store_true", help="solo verificar paridad")
+    args = ap.parse_args()
+
+    cases = load_corpus(args.corpus)
+    mismatches = check(cases)
+    for m in mismatches:
+        print(json.dumps(m, ensure_ascii=False), file=sys.stderr)
+    result = {"cases": len(cases), "mismatches": len(mismatches)}
+    if not args.check:
+        result.update(bench(cases, args.iterations, args.baseline))
+    print(json.dumps(result, indent=2))
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# Prueba offline del pipeline de parseo con el modelo stub (sin red).
+#
+# Uso (desde backend/):
+#   python -m bench.bench_pipeline --latency 0.05 --concurrency 4 --repeat 5
+#
+# Verifica que los mensajes con formato pasen por el parser local con la misma
+# salida que parser.parse_gasto_args, que el modelo solo se llame para el
+# resto, que las repeticiones salgan del caché y que nunca haya más llamadas
+# simultáneas al modelo que las permitidas. Sale 1 si algo no se cumple.
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from bench.bench_parser import load_corpus
+from parser import parse_gasto_args
+from pipeline import ParsePipeline, StubModel, confidence
+
+FREE_TEXT = [
+    "gasté 1.500 en el super con débito",
+    "pagué 15 mil de alquiler ayer",
+    "cena con amigos 3000",
+    "me salió 2500 el uber",
+    "compré zapatillas por 80 mil con crédito",
+    "gaste 1200 en la farmacia",
+]
+
+
+async def run(latency, concurrency, repeat):
+    today = "2024-06-15"
+    model = StubModel(latency=latency)
+    pipeline = ParsePipeline(model, concurrency=concurrency)
+    formatted = [c["text"] for c in load_corpus() if c["kind"] == "one"]
+
+    failures = []
+    for text in formatted:
+        local = parse_gasto_args(text, today)
+        if local[0] and confidence(local[0]) >= pipeline.threshold:
+            got = await pipeline.parse(text, today)
+            if got != local:
+                failures.append({"text": text, "got": got, "want": local})
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        # Todas las frases a la vez: la primera ronda va al modelo, el resto al caché
+        results = await asyncio.gather(*(pipeline.parse(t, today) for t in FREE_TEXT))
+        failures += [{"text": t, "error": err} for t, (parsed, err) in zip(FREE_TEXT, results) if not parsed]
+    elapsed = time.perf_counter() - t0
+
+    stats = pipeline.stats()
+    if model.peak_in_flight > concurrency:
+        failures.append({"error": f"{model.peak_in_flight} llamadas simultáneas (máximo {concurrency})"})
+    if model.calls > len(FREE_TEXT) + sum(1 for t in formatted if not parse_gasto_args(t, today)[0]):
+        failures.append({"error": f"demasiadas llamadas al modelo: {model.calls}"})
+    return {
+        "formatted_messages": len(formatted),
+        "free_text_messages": len(FREE_TEXT) * repeat,
+        "model_calls": model.calls,
+        "peak_in_flight": model.peak_in_flight,
+        "free_text_elapsed_s": round(elapsed, 3),
+        "stats": stats,
+        "failures": failures,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--latency", type=float, default=0.05, help="demora simulada del modelo (s)")
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    result = asyncio.run(run(args.latency, args.concurrency, args.repeat))
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(1 if result["failures"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# Arranque en frío de la API: qué cuesta importar webapp y cuánto tarda un
+# proceso nuevo en responder.
+#
+# Uso (desde backend/, con DATABASE_URL apuntando a una base local migrada):
+#   python -m bench.coldstart                          # perfil de imports + 5 arranques
+#   python -m bench.coldstart --runs 10 --path /api/users/bench-00000/home --out after.json
+#   python -m bench.coldstart --compare before.json after.json
+#
+# El perfil sale de `python -X importtime -c "import webapp"`: tiempo propio
+# de cada módulo sumado por paquete de primer nivel. Cada arranque levanta
+# uvicorn y pide --path en loop desde el spawn hasta la primera respuesta
+# (first_byte_ms, lo que siente el primer usuario después de un deploy o de
+# que Render despierte el servicio); después mide un pedido ya en caliente.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from bench.load import git_revision
+
+
+def _importtime(module):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True, check=True, env={**os.environ, "LOG_LEVEL": "OFF"}).stderr
+    packages, total_us = {}, 0
+    for line in out.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # "import time: <propio> | <acumulado> | <sangría><módulo>"
+        self_us, cumulative, name = line.split(":", 1)[1].split("|")
+        name = name.strip()
+        if name == module:
+            total_us = int(cumulative)
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+    return total_us, packages
+
+
+def import_profile(module="webapp", top=15, runs=5):
+    # Mediana de varias corridas: con una sola el ruido es del orden de lo medido
+    samples = [_importtime(module) for _ in range(runs)]
+    names = set().union(*(packages for _, packages in samples))
+    medians = {name: statistics.median(packages.get(name, 0) for _, packages in samples) for name in names}
+    ranking = sorted(medians.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "total_ms": round(statistics.median(total for total, _ in samples) / 1000, 1),
+        "by_package_ms": {k: round(v / 1000, 1) for k, v in ranking},
+    }
+
+
+def boot_once(port, path, env, timeout=30.0):
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "webapp:app", "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, "LOG_LEVEL": "ERROR", **env}, stdout=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}{path}"
+    try:
+        with httpx.Client(timeout=5) as client:
+            while True:
+                if time.perf_counter() - t0 > timeout:
+                    raise RuntimeError(f"{path} no respondió en {timeout:.0f} s")
+                if proc.poll() is not None:
+                    raise RuntimeError(f"uvicorn terminó con código {proc.returncode}")
+                try:
+                    r = client.get(url)
+                except httpx.TransportError:
+                    time.sleep(0.005)
+                    continue
+                first_byte = time.perf_counter() - t0
+                break
+            t1 = time.perf_counter()
+            client.get(url)
+            warm = time.perf_counter() - t1
+        return {"status": r.status_code, "first_byte_ms": round(first_byte * 1000, 1), "warm_ms": round(warm * 1000, 1)}
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def run(args):
+    env = dict(item.split("=", 1) for item in args.server_env)
+    boots = [boot_once(args.port, args.path, env) for _ in range(args.runs)]
+    result = {
+        "meta": {"revision": git_revision(), "path": args.path, "runs": args.runs},
+        "imports": import_profile(top=args.top, runs=args.import_runs),
+        "boots": boots,
+    }
+    for key in ("first_byte_ms", "warm_ms"):
+        values = [b[key] for b in boots]
+        result[key] = {"median": round(statistics.median(values), 1), "min": min(values), "max": max(values)}
+    return result
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    return {
+        "before": before["meta"]["revision"],
+        "after": after["meta"]["revision"],
+        "import_total_ms": [before["imports"]["total_ms"], after["imports"]["total_ms"]],
+        **{f"{key}_median": [before[key]["median"], after[key]["median"]] for key in ("first_byte_ms", "warm_ms")},
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--path", default="/api/users/bench-00000/home", help="primer pedido después de arrancar")
+    ap.add_argument("--port", type=int, default=8078)
+    ap.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE")
+    ap.add_argument("--top", type=int, default=15, help="paquetes en el perfil de imports")
+    ap.add_argument("--import-runs", type=int, default=5, help="corridas de -X importtime")
+    ap.add_argument("--out", help="guardar el resultado en este archivo")
+    ap.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = ap.parse_args()
+    result = compare(*args.compare) if args.compare else run(args)
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# Mide el throughput de la API con pedidos concurrentes.
+#
+# Uso (con el servidor corriendo, p. ej. `uvicorn webapp:app --workers 1`):
+#   python -m bench.concurrency --url http://localhost:8000 --user 8323618720 \
+#       --concurrency 50 --requests 1000 --label async > after.json
+#
+# Para comparar antes/después se corre el mismo comando contra cada commit
+# con el mismo número de workers y la misma base.
+#
+# Referencia (asyncpg, [user-002]): 1 CPU compartida con el generador, 1
+# worker, Postgres local, 10.200 gastos (200 del usuario, la lista completa
+# por pedido), --concurrency 50 --requests 2000, mediana de 3 corridas:
+#   psycopg2 en el event loop:  183 req/s   p50 268 ms   p95 280 ms   p99 530 ms
+#   asyncpg:                    200 req/s   p50 250 ms   p95 424 ms   p99 591 ms
+# Con la respuesta dominada por serializar 200 filas la ganancia es chica
+# (+9%); la cola larga crece porque el loop intercala más pedidos a la vez.
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[k]
+
+
+async def run(url, paths, concurrency, total, timeout):
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(paths[i % len(paths)])
+
+    async def worker(client):
+        nonlocal errors
+        while True:
+            try:
+                path = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            t0 = time.perf_counter()
+            try:
+                r = await client.get(path)
+                if r.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - t0)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+        },
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://localhost:8000")
+    ap.add_argument("--user", default="8323618720")
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--requests", type=int, default=1000)
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--label", default="")
+    ap.add_argument("--path", action="append", help="rutas a pedir (por defecto la lista del usuario)")
+    args = ap.parse_args()
+
+    paths = args.path or [f"/api/expenses/{args.user}"]
+    result = asyncio.run(run(args.url, paths, args.concurrency, args.requests, args.timeout))
+    result.update({"label": args.label, "paths": paths})
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+# Generador de historiales sintéticos para benchmarks.
+#
+# Uso (desde backend/, con DATABASE_URL apuntando a una base local migrada):
+#   python -m bench.ledger --users 50 --expenses 200000 --months 24 --seed 1
+#   python -m bench.ledger --users 50 --expenses 200000 --reset   # borra los bench-* antes
+#
+# Los usuarios se llaman "<prefix>00000", "<prefix>00001"... y los tamaños
+# siguen una cola larga (pocos usuarios con muchos gastos, la mayoría con
+# pocos), como en producción. Cada historial mezcla gastos sueltos con hora
+# del día y montos por categoría, servicios mensuales fijos y planes de cuotas
+# con tarjeta (las N cuotas, incluidas las futuras, como las carga /cuotas).
+# Con la misma semilla y los mismos parámetros se genera exactamente lo mismo.
+#
+# La carga va por COPY en bloques de --chunk filas (una transacción por
+# bloque, --jobs conexiones en paralelo); los triggers del rollup y del
+# registro de cambios corren igual que con INSERT, así que la base queda
+# consistente (python rollup.py verify).
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import asyncpg
+import pytz
+from dateutil.relativedelta import relativedelta
+
+BA_TZ = pytz.timezone("America/Argentina/Buenos_Aires")
+PREFIX = "bench-"
+
+# categoría -> (peso, monto mediano en ARS, dispersión lognormal, notas)
+CATEGORIES = {
+    "supermercado": (24, 18000, 0.7, ["coto", "carrefour", "dia", "chino de la esquina", "jumbo"]),
+    "comida": (22, 6500, 0.6, ["almuerzo", "delivery", "café", "cena con amigos", "panadería"]),
+    "transporte": (14, 2500, 0.8, ["sube", "uber", "nafta", "peaje", "taxi"]),
+    "ocio": (9, 12000, 0.8, ["cine", "recital", "bar", "streaming", "salida"]),
+    "salud": (6, 15000, 0.9, ["farmacia", "consulta", "dentista", "análisis"]),
+    "hogar": (6, 25000, 1.0, ["ferretería", "limpieza", "bazar", "plomero"]),
+    "ropa": (5, 40000, 0.7, ["zapatillas", "campera", "remeras", "jean"]),
+    "tecnología": (3, 90000, 0.9, ["auriculares", "cargador", "mouse", "monitor"]),
+    "educación": (3, 30000, 0.6, ["libros", "curso", "fotocopias"]),
+    "otros": (8, 8000, 1.0, ["regalo", "kiosco", "varios", "propina"]),
+}
+# Servicios mensuales: (nota, monto, día del mes)
+RECURRING = [("alquiler", 350000, 5), ("luz", 28000, 12), ("internet", 22000, 15), ("celular", 15000, 20)]
+PAYMENT_METHODS = (
+    ("débito", 30), ("efectivo", 18), ("mercadopago", 22), ("crédito", 15),
+    ("transferencia", 8), ("modo", 4), (None, 3),
+)
+# Hora del día (BA): casi nada de madrugada, picos al mediodía y a la noche
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 1, 2, 4, 6, 7, 8, 9, 12, 11, 8, 7, 7, 8, 10, 12, 12, 10, 6, 3]
+INSTALLMENT_COUNTS = ((3, 30), (6, 35), (12, 30), (18, 5))
+# Un plan de cuotas cada tantos gastos sueltos
+EXPENSES_PER_PLAN = 120
+
+EXPENSE_COLUMNS = (
+    "user_id", "ts", "amount", "currency", "category", "note", "raw_msg",
+    "payment_method", "installment_plan_id", "installment_details",
+)
+PLAN_COLUMNS = ("id", "user_id", "description", "category", "payment_method", "total", "installments", "start_ts")
+
+
+def user_name(prefix, index):
+    return f"{prefix}{index:05d}"
+
+
+def user_sizes(rng, users, expenses):
+    # Pareto normalizado para que la suma sea exactamente `expenses`
+    weights = [rng.paretovariate(1.3) for _ in range(users)]
+    total = sum(weights)
+    sizes = [max(1, int(expenses * w / total)) for w in weights]
+    sizes[max(range(users), key=lambda i: weights[i])] += expenses - sum(sizes)
+    return sizes
+
+
+def _money(value):
+    return Decimal(str(round(max(value, 50.0), -1) if value >= 1000 else round(max(value, 50.0), 2)))
+
+
+def _raw(amount, category, note):
+    return f"/gasto {amount} {category} \"{note}\""
+
+
+class LedgerGenerator:
+    def __init__(self, seed=1, months=24, end=None):
+        self.rng = random.Random(seed)
+        self.end = end or BA_TZ.localize(datetime.combine(datetime.now(BA_TZ).date(), datetime.min.time()))
+        self.start = self.end - relativedelta(months=months)
+        self._categories = list(CATEGORIES)
+        self._category_weights = [CATEGORIES[c][0] for c in self._categories]
+        self._methods = [m for m, _ in PAYMENT_METHODS]
+        self._method_weights = [w for _, w in PAYMENT_METHODS]
+
+    def _ts(self, day):
+        hour = self.rng.choices(range(24), HOUR_WEIGHTS)[0]
+        return BA_TZ.normalize(day + timedelta(hours=hour, minutes=self.rng.randrange(60), seconds=self.rng.randrange(60)))
+
+    def _expense(self, user_id, ts, amount, category, note, method, plan_id=None, details=None):
+        return (user_id, ts, amount, "ARS", category, note, _raw(amount, category, note), method, plan_id, details)
+
+    def _plan(self, user_id):
+        rng = self.rng
+        count = rng.choices([n for n, _ in INSTALLMENT_COUNTS], [w for _, w in INSTALLMENT_COUNTS])[0]
+        category = rng.choice(("tecnología", "hogar", "ropa", "educación"))
+        note = rng.choice(CATEGORIES[category][3])
+        total = _money(rng.lognormvariate(0, 0.6) * 300000)
+        first = self._ts(self.start + timedelta(days=rng.randrange((self.end - self.start).days)))
+        plan_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{user_id}/{rng.getrandbits(64)}"))
+        share = (total / count).quantize(Decimal("0.01"))
+        plan = (plan_id, user_id, note, category, "crédito", share * count, count, first)
+        rows = [
+            self._expense(user_id, BA_TZ.normalize(first + relativedelta(months=i)), share, category, note,
+                          "crédito", plan_id, f"{i + 1}/{count}")
+            for i in range(count)
+        ]
+        return plan, rows
+
+    def user(self, user_id, size):
+        # Devuelve (planes, gastos) de un usuario con ~size gastos
+        rng = self.rng
+        days = (self.end - self.start).days
+        plans, rows = [], []
+        recurring = [r for r in RECURRING if rng.random() < 0.6] if size >= 50 else []
+        month = self.start.replace(day=1)
+        while recurring and month < self.end and len(rows) < size // 4:
+            for note, amount, day in recurring:
+                day_ts = BA_TZ.localize(datetime(month.year, month.month, day, 10))
+                if self.start <= day_ts < self.end:
+                    value = _money(amount * rng.uniform(0.9, 1.1))
+                    rows.append(self._expense(user_id, day_ts, value, "servicios", note, "débito"))
+            month += relativedelta(months=1)
+        for _ in range(size // EXPENSES_PER_PLAN):
+            plan, cuotas = self._plan(user_id)
+            plans.append(plan)
+            rows.extend(cuotas)
+        while len(rows) < size:
+            category = rng.choices(self._categories, self._category_weights)[0]
+            _, median, sigma, notes = CATEGORIES[category]
+            day = self.start + timedelta(days=rng.randrange(days))
+            amount = _money(rng.lognormvariate(0, sigma) * median)
+            method = rng.choices(self._methods, self._method_weights)[0]
+            rows.append(self._expense(user_id, self._ts(day), amount, category, rng.choice(notes), method))
+        return plans, rows
+
+
+async def reset(con, prefix=PREFIX):
+    pattern = prefix.replace("%", r"\%").replace("_", r"\_") + "%"
+    async with con.transaction():
+        # Las cuotas caen por la FK; después los gastos sueltos
+        await con.execute("DELETE FROM installment_plans WHERE user_id LIKE $1", pattern)
+        deleted = await con.execute("DELETE FROM expenses WHERE user_id LIKE $1", pattern)
+    return int(deleted.rsplit(" ", 1)[-1])
+
+
+async def populate(dsn, users, expenses, months=24, seed=1, prefix=PREFIX, chunk=20000, jobs=4, clear=False):
+    # La generación es secuencial (determinista); los bloques se copian en
+    # paralelo por `jobs` conexiones. Un bloque tiene usuarios enteros, así que
+    # dos conexiones nunca tocan la misma fila de ledger_versions.
+    gen = LedgerGenerator(seed=seed, months=months)
+    sizes = user_sizes(gen.rng, users, expenses)
+    pool = await asyncpg.create_pool(dsn, min_size=jobs, max_size=jobs)
+    stats = {"users": users, "expenses": 0, "plans": 0, "deleted": 0}
+    queue = asyncio.Queue(maxsize=jobs * 2)
+    t0 = time.perf_counter()
+
+    async def copier():
+        while (block := await queue.get()) is not None:
+            plans, rows = block
+            async with pool.acquire() as con, con.transaction():
+                if plans:
+                    await con.copy_records_to_table("installment_plans", records=plans, columns=PLAN_COLUMNS)
+                await con.copy_records_to_table("expenses", records=rows, columns=EXPENSE_COLUMNS)
+            stats["plans"] += len(plans)
+            stats["expenses"] += len(rows)
+
+    try:
+        if clear:
+            async with pool.acquire() as con:
+                stats["deleted"] = await reset(con, prefix)
+        workers = [asyncio.create_task(copier()) for _ in range(jobs)]
+        plans, rows = [], []
+        for index, size in enumerate(sizes):
+            user_plans, user_rows = gen.user(user_name(prefix, index), size)
+            plans.extend(user_plans)
+            rows.extend(user_rows)
+            if len(rows) >= chunk:
+                await queue.put((plans, rows))
+                plans, rows = [], []
+        if rows:
+            await queue.put((plans, rows))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+        async with pool.acquire() as con:
+            await con.execute("ANALYZE expenses")
+            await con.execute("ANALYZE installment_plans")
+    finally:
+        await pool.close()
+    elapsed = time.perf_counter() - t0
+    stats.update({
+        "seed": seed, "months": months, "prefix": prefix,
+        "largest_user": max(sizes), "elapsed_s": round(elapsed, 2),
+        "rows_per_s": round(stats["expenses"] / elapsed) if elapsed else 0,
+    })
+    return stats
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dsn", default=os.getenv("DATABASE_URL"))
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--expenses", type=int, default=100000, help="gastos sueltos + cuotas, en total")
+    ap.add_argument("--months", type=int, default=24, help="largo del historial")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--prefix", default=PREFIX)
+    ap.add_argument("--chunk", type=int, default=20000, help="filas por COPY")
+    ap.add_argument("--jobs", type=int, default=4, help="conexiones copiando en paralelo")
+    ap.add_argument("--reset", action="store_true", help="borrar antes los usuarios con el prefijo")
+    args = ap.parse_args()
+    stats = asyncio.run(populate(args.dsn, args.users, args.expenses, args.months, args.seed,
+                                 args.prefix, args.chunk, args.jobs, args.reset))
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+# Prueba de carga de los caminos calientes del backend sobre un historial
+# sintético (bench.ledger). Resultado en JSON para comparar entre commits.
+#
+# Uso (desde backend/, con DATABASE_URL y la base cargada con bench.ledger):
+#   python -m bench.load --spawn --users 50 --concurrency 20 --requests 500 --out after.json
+#   python -m bench.load --url http://localhost:8000 --server-pid 1234 --scenario list --scenario export
+#   python -m bench.load --compare before.json after.json
+#
+# Escenarios (por defecto todos, en este orden):
+#   post_expense  POST /api/expenses
+#   list          GET /api/expenses/{user_id}
+#   export        GET /api/users/{user_id}/export (CSV completo, se lee el cuerpo entero)
+#   dashboard     GET / (web original)
+#   parser        parser.parse_gasto_args en proceso, sobre el corpus de bench_parser
+#   bot           updates simulados de /gasto por los handlers del bot: outbox
+#                 local + flusher contra la API; latencia hasta la respuesta al
+#                 usuario y drain_s hasta que el outbox queda vacío
+#
+# Con --spawn se levanta `uvicorn webapp:app` (un worker) para poder medir el
+# pico de memoria del servidor; --server-env KEY=VALUE le pasa variables (p.
+# ej. READ_CACHE_SIZE=0 para medir las lecturas sin caché). Los escenarios
+# corren de a uno; las escrituras quedan bajo los usuarios del benchmark y se
+# borran con `python -m bench.ledger --reset`.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import httpx
+
+from bench.bench_parser import load_corpus
+from bench.concurrency import percentile
+from bench.ledger import PREFIX, user_name
+
+SCENARIOS = ("post_expense", "list", "export", "dashboard", "parser", "bot")
+CATEGORIES = ("comida", "supermercado", "transporte", "ocio", "salud", "hogar")
+METHODS = ("débito", "efectivo", "mercadopago", "crédito")
+
+
+def summarize(latencies, errors, elapsed, **extra):
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p95": round(percentile(latencies, 95) * 1000, 3),
+            "p99": round(percentile(latencies, 99) * 1000, 3),
+            "max": round(max(latencies, default=0.0) * 1000, 3),
+        },
+        **extra,
+    }
+
+
+async def drive(call, total, concurrency):
+    # call(i) -> awaitable que devuelve True si salió bien
+    latencies, errors = [], 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            t0 = time.perf_counter()
+            try:
+                ok = await call(i)
+            except (httpx.HTTPError, OSError):
+                ok = False
+            latencies.append(time.perf_counter() - t0)
+            errors += not ok
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - t0
+
+
+# --- ESCENARIOS ---
+def expense_payload(rng, user_id):
+    category = rng.choice(CATEGORIES)
+    amount = round(rng.lognormvariate(0, 0.8) * 8000, 2)
+    return {
+        "user_id": user_id,
+        "ts": datetime.now(timezone.utc).isoformat(),
+        "amount": amount,
+        "category": category,
+        "note": "bench",
+        "raw_msg": f"/gasto {amount} {category}",
+        "payment_method": rng.choice(METHODS),
+    }
+
+
+async def scenario_post_expense(client, users, args, rng):
+    async def call(i):
+        r = await client.post("/api/expenses", json=expense_payload(rng, users[i % len(users)]))
+        return r.status_code < 400
+
+    return summarize(*await drive(call, args.requests, args.concurrency))
+
+
+async def scenario_list(client, users, args, rng):
+    async def call(i):
+        r = await client.get(f"/api/expenses/{users[i % len(users)]}")
+        return r.status_code < 400
+
+    return summarize(*await drive(call, args.requests, args.concurrency))
+
+
+async def scenario_export(client, users, args, rng):
+    sizes = []
+
+    async def call(i):
+        size = 0
+        async with client.stream("GET", f"/api/users/{users[i % len(users)]}/export", params={"format": "csv"}) as r:
+            async for chunk in r.aiter_bytes():
+                size += len(chunk)
+        sizes.append(size)
+        return r.status_code < 400
+
+    # Las exportaciones son largas: una décima parte de los pedidos
+    total = max(1, args.requests // 10)
+    return summarize(*await drive(call, total, args.concurrency), bytes_total=sum(sizes))
+
+
+async def scenario_dashboard(client, users, args, rng):
+    async def call(i):
+        r = await client.get("/")
+        return r.status_code < 400
+
+    return summarize(*await drive(call, args.requests, args.concurrency))
+
+
+async def scenario_parser(client, users, args, rng):
+    from parser import parse_gasto_args
+
+    cases = [c for c in load_corpus() if c["kind"] == "one"]
+    today = cases[0]["today"]
+    texts = [c["text"] for c in cases]
+    calls = args.requests * 100
+    latencies = []
+    t0 = time.perf_counter()
+    for i in range(calls):
+        c0 = time.perf_counter()
+        parse_gasto_args(texts[i % len(texts)], today)
+        latencies.append(time.perf_counter() - c0)
+    return summarize(latencies, 0, time.perf_counter() - t0)
+
+
+class _Message:
+    def __init__(self, text, replies):
+        self.text = text
+        self._replies = replies
+
+    async def reply_text(self, text, **kwargs):
+        self._replies.append(text)
+
+
+async def scenario_bot(client, users, args, rng):
+    # Los handlers reales de main.py con un Update mínimo; las respuestas a
+    # Telegram se descartan. Las updates de un mismo usuario van en orden
+    # (PerUserUpdateProcessor), las de distintos usuarios en paralelo.
+    import main as bot
+    from api_client import ApiClient
+    from outbox import Outbox, OutboxFlusher
+
+    texts = [c["text"] for c in load_corpus() if c["kind"] == "one" and c.get("expected")]
+    api = ApiClient(base_url=args.url)
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = Outbox(os.path.join(tmp, "outbox.db"))
+        flusher = OutboxFlusher(outbox, api, interval=0.5)
+        application = SimpleNamespace(bot_data={"api": api, "outbox": outbox, "flusher": flusher})
+        processor = bot.PerUserUpdateProcessor(args.concurrency)
+        flusher.start()
+        latencies, errors = [], 0
+
+        async def handle(i):
+            nonlocal errors
+            replies = []
+            text = "/gasto " + texts[i % len(texts)]
+            update = SimpleNamespace(
+                effective_user=SimpleNamespace(id=users[i % len(users)]),
+                effective_chat=SimpleNamespace(id=i),
+                message=_Message(text, replies),
+            )
+            context = SimpleNamespace(args=text.split()[1:], application=application)
+            t0 = time.perf_counter()
+            await processor.process_update(update, bot.gasto_cmd(update, context))
+            latencies.append(time.perf_counter() - t0)
+            errors += not (replies and replies[0].startswith("✅"))
+
+        try:
+            t0 = time.perf_counter()
+            await asyncio.gather(*(handle(i) for i in range(args.requests)))
+            elapsed = time.perf_counter() - t0
+            while (await outbox.stats())["pending"]:
+                flusher.wake()
+                await asyncio.sleep(0.05)
+            drain = time.perf_counter() - t0
+            stats = await outbox.stats()
+        finally:
+            await flusher.stop()
+            await api.close()
+            outbox.close()
+    return summarize(latencies, errors, elapsed, drain_s=round(drain, 3), outbox=stats)
+
+
+# --- SERVIDOR Y MEMORIA ---
+def peak_rss_kb(pid):
+    # VmHWM: pico de memoria residente del proceso (Linux)
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def spawn_server(port, env):
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "webapp:app", "--port", str(port), "--workers", "1", "--log-level", "warning"],
+        # Los logs (p. ej. de consultas lentas) salen por stderr y ensucian la medición
+        env={**os.environ, "LOG_LEVEL": "ERROR", **env}, stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/readyz", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("el servidor no respondió en 30 s")
+
+
+def git_revision():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True).stdout.strip())
+        return rev + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def dataset(prefix):
+    # Tamaño de la base de prueba (si hay DATABASE_URL)
+    if not os.getenv("DATABASE_URL"):
+        return None
+    import asyncpg
+
+    con = await asyncpg.connect(os.getenv("DATABASE_URL"))
+    try:
+        row = await con.fetchrow(
+            "SELECT COUNT(*) AS expenses, COUNT(DISTINCT user_id) AS users, "
+            "COUNT(DISTINCT installment_plan_id) AS plans FROM expenses WHERE user_id LIKE $1",
+            prefix + "%",
+        )
+        return dict(row)
+    finally:
+        await con.close()
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    users = [user_name(args.prefix, i) for i in range(args.users)]
+    rng.shuffle(users)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        for name in args.scenario or SCENARIOS:
+            results[name] = await globals()[f"scenario_{name}"](client, users, args, rng)
+            print(f"[bench] {name}: {results[name]['throughput_per_s']}/s "
+                  f"p95={results[name]['latency_ms']['p95']}ms errores={results[name]['errors']}", file=sys.stderr)
+    return results
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    rows = {}
+    for name, new in after["scenarios"].items():
+        old = before["scenarios"].get(name)
+        if old is None:
+            continue
+        ratio = new["throughput_per_s"] / old["throughput_per_s"] if old["throughput_per_s"] else None
+        rows[name] = {
+            "throughput_per_s": [old["throughput_per_s"], new["throughput_per_s"]],
+            "throughput_ratio": round(ratio, 3) if ratio else None,
+            **{f"{p}_ms": [old["latency_ms"][p], new["latency_ms"][p]] for p in ("p50", "p95", "p99")},
+        }
+    rss = {k: [before["rss_kb"].get(k), after["rss_kb"].get(k)] for k in after["rss_kb"]}
+    return {"before": before["meta"]["revision"], "after": after["meta"]["revision"], "scenarios": rows, "rss_kb": rss}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--spawn", action="store_true", help="levantar uvicorn para la prueba")
+    ap.add_argument("--port", type=int, default=8077, help="puerto con --spawn")
+    ap.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE")
+    ap.add_argument("--server-pid", type=int, help="pid del servidor ya levantado, para su RSS")
+    ap.add_argument("--scenario", action="append", choices=SCENARIOS)
+    ap.add_argument("--users", type=int, default=50, help="los mismos que en bench.ledger")
+    ap.add_argument("--prefix", default=PREFIX)
+    ap.add_argument("--concurrency", type=int, default=20)
+    ap.add_argument("--requests", type=int, default=500, help="pedidos por escenario")
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--label", default="")
+    ap.add_argument("--out", help="archivo de resultados (por defecto stdout)")
+    ap.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = ap.parse_args()
+
+    if args.compare:
+        print(json.dumps(compare(*args.compare), indent=2, ensure_ascii=False))
+        return
+
+    # Antes de correr: los escenarios de escritura agregan filas
+    data = asyncio.run(dataset(args.prefix))
+    server = None
+    if args.spawn:
+        args.url = f"http://127.0.0.1:{args.port}"
+        server = spawn_server(args.port, dict(kv.split("=", 1) for kv in args.server_env))
+        args.server_pid = server.pid
+    try:
+        results = asyncio.run(run(args))
+        server_rss = peak_rss_kb(args.server_pid) if args.server_pid else None
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    output = {
+        "meta": {
+            "label": args.label,
+            "revision": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "config": {k: getattr(args, k) for k in ("users", "concurrency", "requests", "seed", "server_env")},
+            "dataset": data,
+        },
+        "scenarios": results,
+        # ru_maxrss está en KB en Linux
+        "rss_kb": {"driver": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "server": server_rss},
+    }
+    text = json.dumps(output, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# Extractos CSV sintéticos para probar la importación (importer.py).
+#
+# Uso (desde backend/):
+#   python -m bench.statements --profile tarjeta --rows 50000 --out tarjeta.csv
+#   python -m bench.statements --profile mercadopago --rows 100000 --post http://127.0.0.1:8000 --user import-bench
+#
+# Los movimientos salen de bench.ledger (mismas categorías, montos y horarios)
+# y se escriben con el formato de cada perfil: separador, encoding, formato de
+# fecha y signo. --errors mete filas rotas (fecha o monto inválido) cada
+# tantas filas para ver los errores por fila. Con --post se sube el archivo y
+# se muestran los eventos NDJSON a medida que llegan; subirlo dos veces tiene
+# que dar todo duplicado en la segunda.
+import argparse
+import csv
+import io
+import json
+import random
+import time
+
+import httpx
+
+from bench.ledger import LedgerGenerator
+from importer import PROFILES
+
+
+def rows_for(profile_name, rows, seed=1, error_every=0):
+    gen = LedgerGenerator(seed=seed, months=6)
+    _, expenses = gen.user("statement", rows)
+    rng = random.Random(seed)
+    for i, (_, ts, amount, _, category, note, _, method, _, details) in enumerate(sorted(expenses, key=lambda e: e[1])):
+        value = f"{amount:.2f}".replace(".", ",")
+        broken = error_every and i % error_every == error_every - 1
+        if profile_name == "mercadopago":
+            date = "31-02-2024" if broken else ts.strftime("%d-%m-%Y")
+            yield [date, f"Pago {note}", str(rng.getrandbits(40)), f"-{value}", "0,00"]
+            if rng.random() < 0.05:
+                # Ingresos (se saltean)
+                yield [ts.strftime("%d-%m-%Y"), "Transferencia recibida", str(rng.getrandbits(40)), "15000,00", "0,00"]
+        elif profile_name == "tarjeta":
+            date = ts.strftime("%d/%m/%Y")
+            yield [date, note.upper(), details or "", "x" if broken else value, ""]
+        else:
+            date = ts.strftime("%Y-%m-%d")
+            yield [date, "sin monto" if broken else f"{amount:.2f}", note, category, method or ""]
+
+
+HEADERS = {
+    "generico": ["fecha", "monto", "descripcion", "categoria", "medio_pago"],
+    "mercadopago": ["RELEASE_DATE", "TRANSACTION_TYPE", "REFERENCE_ID", "TRANSACTION_NET_AMOUNT", "PARTIAL_BALANCE"],
+    "tarjeta": ["Fecha", "Descripción", "Cuotas", "Pesos", "Dólares"],
+}
+
+
+def build(profile_name, rows, seed=1, error_every=0):
+    profile = PROFILES[profile_name]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=profile["delimiter"])
+    writer.writerow(HEADERS[profile_name])
+    writer.writerows(rows_for(profile_name, rows, seed, error_every))
+    return buffer.getvalue().encode(profile["encoding"].replace("-sig", ""), errors="replace")
+
+
+def post(url, user, profile_name, body):
+    t0 = time.perf_counter()
+    last = None
+    with httpx.stream("POST", f"{url}/api/users/{user}/import", params={"profile": profile_name},
+                      content=body, headers={"Content-Type": "text/csv"}, timeout=None) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            last = json.loads(line)
+            print(line)
+    elapsed = time.perf_counter() - t0
+    if last and last.get("rows"):
+        print(json.dumps({"elapsed_s": round(elapsed, 2), "rows_per_s": round(last["rows"] / elapsed)}))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--profile", choices=sorted(HEADERS), default="generico")
+    ap.add_argument("--rows", type=int, default=10000)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--errors", type=int, default=0, metavar="N", help="una fila rota cada N")
+    ap.add_argument("--out", help="guardar el CSV")
+    ap.add_argument("--post", metavar="URL", help="subir el CSV a la API")
+    ap.add_argument("--user", default="import-bench")
+    args = ap.parse_args()
+    body = build(args.profile, args.rows, args.seed, args.errors)
+    if args.out:
+        with open(args.out, "wb") as f:
+            f.write(body)
+    if args.post:
+        post(args.post, args.user, args.profile, body)
+    elif not args.out:
+        print(body.decode(PROFILES[args.profile]["encoding"].replace("-sig", ""))[:2000])
+
+
+if __name__ == "__main__":
+    main()
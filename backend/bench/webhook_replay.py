@@ -0,0 +1,137 @@
+# Reproduce updates grabadas de Telegram contra el endpoint del webhook, en
+# proceso y sin red: la app FastAPI corre con BOT_MODE=webhook y BOT_OFFLINE=1,
+# así que las respuestas del bot quedan registradas en vez de ir a Telegram.
+#
+# Uso (desde backend/, con DATABASE_URL apuntando a una base local migrada):
+#   python -m bench.webhook_replay                      # respuestas en JSON
+#   python -m bench.webhook_replay --check              # sale 1 si algo no coincide
+#   python -m bench.webhook_replay --updates otras.jsonl --keep
+#
+# Cada línea del archivo es {"update": <update de Telegram>, "expect": <prefijo
+# de la respuesta o null si el bot no responde>} y opcionalmente "then": [...],
+# mensajes que llegan después sin ser respuesta directa (p. ej. los avisos de
+# presupuesto que manda el outbox al guardar el gasto). Los mensajes de un
+# mismo chat tienen que llegar en el orden de las updates. Al final se espera a que
+# el outbox quede vacío y, salvo --keep, se borran los gastos de los usuarios
+# de las updates.
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+UPDATES = Path(__file__).with_name("telegram_updates.jsonl")
+SECRET = "replay-secret"
+
+
+def load_updates(path=UPDATES):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def sent_messages(calls):
+    return sum(call["method"] in ("sendMessage", "sendDocument") for call in calls)
+
+
+def check(fixtures, calls):
+    replies = {}
+    for call in calls:
+        if call["method"] in ("sendMessage", "sendDocument"):
+            replies.setdefault(call["chat_id"], []).append(call["text"] or "")
+    expected = {}
+    for fixture in fixtures:
+        chat = expected.setdefault(fixture["update"]["message"]["chat"]["id"], [])
+        if fixture["expect"] is not None:
+            chat.append(fixture["expect"])
+        chat.extend(fixture.get("then", []))
+    failures = []
+    for chat_id in set(replies) | set(expected):
+        got, want = replies.get(chat_id, []), expected.get(chat_id, [])
+        if len(got) != len(want) or not all(g.startswith(w) for g, w in zip(got, want)):
+            failures.append({"chat_id": chat_id, "got": got, "want": want})
+    return failures
+
+
+async def replay(fixtures, keep=False, timeout=30.0):
+    import httpx
+
+    import db_async
+    import webapp
+
+    user_ids = sorted({str(f["update"]["message"]["from"]["id"]) for f in fixtures})
+    async with webapp.app.router.lifespan_context(webapp.app):
+        bot = webapp.app.state.bot
+        transport = httpx.ASGITransport(app=webapp.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay") as client:
+            path = webapp.TELEGRAM_WEBHOOK_PATH
+            rejected = await client.post(path, json=fixtures[0]["update"],
+                                         headers={"X-Telegram-Bot-Api-Secret-Token": "incorrecto"})
+            statuses = []
+            t0 = time.perf_counter()
+            for fixture in fixtures:
+                r = await client.post(path, json=fixture["update"], headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+                statuses.append(r.status_code)
+            await asyncio.wait_for(bot.join(), timeout)
+            handled = time.perf_counter() - t0
+
+        outbox = bot.app.bot_data["outbox"]
+        flusher = bot.app.bot_data["flusher"]
+        deadline = time.monotonic() + timeout
+        while (await outbox.stats())["pending"] and time.monotonic() < deadline:
+            flusher.wake()
+            await asyncio.sleep(0.05)
+        # Los avisos ("then") salen del flusher después de vaciar el outbox
+        expected = sum((f["expect"] is not None) + len(f.get("then", [])) for f in fixtures)
+        while sent_messages(bot.request.calls) < expected and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        outbox_stats = await outbox.stats()
+
+        pool = await db_async.get_pool()
+        stored = await pool.fetchval("SELECT COUNT(*) FROM expenses WHERE user_id = ANY($1::text[])", user_ids)
+        if not keep:
+            for table in ("installment_plans", "budgets", "budget_alerts"):
+                await pool.execute(f"DELETE FROM {table} WHERE user_id = ANY($1::text[])", user_ids)
+            await pool.execute("DELETE FROM expenses WHERE user_id = ANY($1::text[])", user_ids)
+    return {
+        "updates": len(fixtures),
+        "statuses": statuses,
+        "bad_secret_status": rejected.status_code,
+        "handled_s": round(handled, 3),
+        "outbox": outbox_stats,
+        "stored_expenses": stored,
+        "calls": bot.request.calls,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--updates", default=UPDATES)
+    ap.add_argument("--check", action="store_true")
+    ap.add_argument("--keep", action="store_true", help="no borrar los gastos creados")
+    args = ap.parse_args()
+
+    # Antes de importar webapp/main: la configuración se lee al importar
+    tmp = tempfile.mkdtemp()
+    os.environ.update({
+        "BOT_MODE": "webhook", "BOT_OFFLINE": "1", "TELEGRAM_WEBHOOK_SECRET": SECRET, "TELEGRAM_WEBHOOK_URL": "",
+        "BOT_OUTBOX_PATH": os.path.join(tmp, "outbox.db"), "BOT_OUTBOX_FLUSH_INTERVAL": "0.2",
+    })
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    fixtures = load_updates(args.updates)
+    result = asyncio.run(replay(fixtures, args.keep))
+    failures = check(fixtures, result["calls"])
+    if result["bad_secret_status"] != 403:
+        failures.append({"error": f"token secreto incorrecto respondió {result['bad_secret_status']}"})
+    if any(s != 200 for s in result["statuses"]) or result["outbox"]["pending"] or result["outbox"]["dead"]:
+        failures.append({"error": "updates rechazadas o gastos sin guardar", "outbox": result["outbox"]})
+    result["failures"] = failures
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.check:
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
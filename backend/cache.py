@@ -0,0 +1,182 @@
+# Cachés en memoria.
+#
+# TTLCache: LRU con vencimiento (TTL) por entrada; la usan el pipeline de
+# parseo y, como primer nivel, el caché de lecturas de la API.
+#
+# ReadCache: caché de respuestas por usuario. Cada usuario tiene una versión
+# que se incrementa en cada escritura (alta, baja, modificación); la versión
+# es parte de la clave, así que después de una escritura las entradas viejas
+# quedan inalcanzables y se van por LRU/TTL. Con varios workers se configura un
+# backend compartido (READ_CACHE_URL) para que las versiones y los valores sean
+# los mismos en todos los procesos:
+#   READ_CACHE_URL=""           solo memoria del proceso
+#   READ_CACHE_URL="local"      LocalSharedBackend (sustituto en memoria, para pruebas)
+#   READ_CACHE_URL="redis://…"  Redis (requiere el paquete redis)
+import json
+import os
+import time
+from collections import OrderedDict
+
+READ_CACHE_URL = os.getenv("READ_CACHE_URL", "")
+READ_CACHE_SIZE = int(os.getenv("READ_CACHE_SIZE", "2048"))
+READ_CACHE_TTL = float(os.getenv("READ_CACHE_TTL", "300"))
+
+
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # clave -> (vence, valor)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key, value, ttl=None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            "size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses,
+            "evictions": self.evictions, "expirations": self.expirations,
+        }
+
+
+# --- BACKENDS COMPARTIDOS ---
+# Interfaz: get(key) -> str | None, set(key, value, ttl), incr(key) -> int.
+class LocalSharedBackend:
+    # Sustituto en memoria de un backend compartido: mismo contrato que Redis
+    # (valores serializados, TTL, incr atómico) pero dentro del proceso.
+    def __init__(self):
+        self._data = {}
+
+    async def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires is not None and expires < time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def set(self, key, value, ttl=None):
+        self._data[key] = (time.monotonic() + ttl if ttl else None, value)
+
+    async def incr(self, key):
+        value = int(await self.get(key) or 0) + 1
+        self._data[key] = (None, str(value))
+        return value
+
+
+class RedisBackend:
+    def __init__(self, url):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url, decode_responses=True)
+
+    async def get(self, key):
+        return await self._redis.get(key)
+
+    async def set(self, key, value, ttl=None):
+        await self._redis.set(key, value, ex=int(ttl) if ttl else None)
+
+    async def incr(self, key):
+        return await self._redis.incr(key)
+
+
+def build_shared_backend(url=READ_CACHE_URL):
+    if not url:
+        return None
+    if url == "local":
+        return LocalSharedBackend()
+    return RedisBackend(url)
+
+
+# --- CACHÉ DE LECTURAS ---
+class ReadCache:
+    def __init__(self, maxsize=READ_CACHE_SIZE, ttl=READ_CACHE_TTL, shared=None):
+        self.ttl = ttl
+        self.local = TTLCache(maxsize, ttl)
+        self.shared = shared
+        self._versions = {}  # user_id -> versión (solo sin backend compartido)
+        self.counters = {"hits": 0, "shared_hits": 0, "misses": 0, "invalidations": 0}
+
+    async def version(self, user_id):
+        if self.shared is not None:
+            return int(await self.shared.get(f"ver:{user_id}") or 0)
+        return self._versions.get(user_id, 0)
+
+    async def bump(self, *user_ids):
+        # Llamar después del commit de la escritura: si se sube la versión
+        # antes, una lectura concurrente podría guardar datos viejos bajo la
+        # versión nueva.
+        for user_id in set(user_ids):
+            self.counters["invalidations"] += 1
+            if self.shared is not None:
+                await self.shared.incr(f"ver:{user_id}")
+            else:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    async def get_or_load(self, user_id, key, loader):
+        # Devuelve (valor, hit). loader es una función async sin argumentos.
+        full_key = f"{user_id}:{await self.version(user_id)}:{key}"
+        value = self.local.get(full_key)
+        if value is not None:
+            self.counters["hits"] += 1
+            return value, True
+        if self.shared is not None:
+            raw = await self.shared.get(full_key)
+            if raw is not None:
+                self.counters["shared_hits"] += 1
+                value = json.loads(raw)
+                self.local.set(full_key, value)
+                return value, True
+        self.counters["misses"] += 1
+        value = await loader()
+        self.local.set(full_key, value)
+        if self.shared is not None:
+            await self.shared.set(full_key, json.dumps(value), self.ttl)
+        return value, False
+
+    def stats(self):
+        return {
+            **self.counters,
+            "shared": type(self.shared).__name__ if self.shared is not None else None,
+            "local": self.local.stats(),
+        }
+
+
+_read_cache = None
+
+
+def get_read_cache():
+    global _read_cache
+    if _read_cache is None:
+        _read_cache = ReadCache(shared=build_shared_backend())
+    return _read_cache
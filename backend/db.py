@@ -1,88 +1,197 @@
 import psycopg2
 import os
+import threading
+import time
+from contextlib import contextmanager
+from psycopg2 import pool as pg_pool
 
-def get_con():
-    return psycopg2.connect(os.getenv("DATABASE_URL"))
+from metrics import TimedCursor
 
-def init_db():
-    with get_con() as con:
-        cur = con.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS expenses (
-                id SERIAL PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                ts TEXT NOT NULL,
-                amount REAL NOT NULL,
-                currency TEXT NOT NULL,
-                category TEXT NOT NULL,
-                note TEXT,
-                raw_msg TEXT,
-                payment_method TEXT,
-                installment_plan_id TEXT,
-                installment_details TEXT
-            )
-            """
+# --- POOL DE CONEXIONES ---
+# Un pool por proceso: cada worker de gunicorn crea el suyo la primera vez que
+# lo necesita (las conexiones no se pueden compartir entre procesos tras el fork).
+# El total de conexiones contra Postgres es como máximo workers * DB_POOL_MAX.
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Segundos que se espera una conexión libre antes de fallar
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Si una conexión estuvo ociosa más de estos segundos se valida con SELECT 1
+POOL_CHECK_AFTER = float(os.getenv("DB_POOL_CHECK_AFTER", "30"))
+# Zona horaria de la sesión: las fechas sin offset ('2024-05-01') y los
+# date_trunc se interpretan en hora de Buenos Aires
+DB_TIMEZONE = os.getenv("DB_TIMEZONE", "America/Argentina/Buenos_Aires")
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, dsn, minconn=POOL_MIN, maxconn=POOL_MAX,
+                 timeout=POOL_TIMEOUT, check_after=POOL_CHECK_AFTER):
+        self.pid = os.getpid()
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_after = check_after
+        # TimedCursor mide cada consulta para /metrics (metrics.py)
+        self._pool = pg_pool.ThreadedConnectionPool(
+            minconn, maxconn, dsn, options=f"-c timezone={DB_TIMEZONE}", cursor_factory=TimedCursor,
         )
-        con.commit()
-        cur.close()
+        # ThreadedConnectionPool falla en vez de esperar cuando se agota;
+        # el semáforo hace que los pedidos esperen un lugar hasta `timeout`.
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        # id(conexión) -> último uso, solo de las conexiones ociosas abiertas:
+        # se saca al pedirla y se vuelve a poner al devolverla si sigue abierta
+        self._idle = {}
+        self._stats = {
+            "checkouts": 0,
+            "in_use": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+        }
+        # ThreadedConnectionPool abre minconn conexiones al crearse
+        for con in [self._pool.getconn() for _ in range(minconn)]:
+            self._release(con)
 
-def insert_expense(user_id, ts, amount, currency, category, note, raw_msg, 
-                   payment_method=None, installment_plan_id=None, installment_details=None):
-    print("[DEBUG] insert_expense called with:", user_id, ts, amount, currency, category, note, raw_msg, payment_method, installment_plan_id, installment_details)
-    try:
-        with get_con() as con:
+    def getconn(self):
+        t0 = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise PoolTimeout(f"No hay conexiones libres tras {self.timeout}s")
+        waited = time.monotonic() - t0
+        try:
+            con = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["in_use"] += 1
+            self._stats["wait_time_total"] += waited
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+            if waited > 0.001:
+                self._stats["waits"] += 1
+        return con
+
+    def _checkout(self):
+        # Las conexiones ociosas hace más de check_after se validan con
+        # SELECT 1. Tras un reinicio de Postgres todas las ociosas están
+        # muertas: se descartan hasta dar con una viva o abrir una nueva.
+        while True:
+            con = self._pool.getconn()
+            with self._lock:
+                last_used = self._idle.pop(id(con), None)
+            if not con.closed and (last_used is None or time.monotonic() - last_used < self.check_after):
+                return con
+            if self._alive(con):
+                return con
+            with self._lock:
+                self._stats["health_check_failures"] += 1
+            self._pool.putconn(con, close=True)
+
+    @staticmethod
+    def _alive(con):
+        if con.closed:
+            return False
+        try:
             cur = con.cursor()
-            cur.execute(
-                "INSERT INTO expenses (user_id, ts, amount, currency, category, note, raw_msg, payment_method, installment_plan_id, installment_details) "
-                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
-                (user_id, ts, amount, currency, category, note, raw_msg, 
-                 payment_method, installment_plan_id, installment_details)
-            )
-            con.commit()
+            cur.execute("SELECT 1")
             cur.close()
-        print("[DEBUG] insert_expense: SUCCESS")
-    except Exception as e:
-        print(f"[ERROR] insert_expense: {e}")
+            con.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def _release(self, con, close=False):
+        # Se registra antes de devolverla: después otro hilo ya la puede pedir
+        with self._lock:
+            self._idle[id(con)] = time.monotonic()
+        self._pool.putconn(con, close=close or con.closed)
+        if con.closed:
+            # Cerrada a pedido o porque ya había minconn ociosas
+            with self._lock:
+                self._idle.pop(id(con), None)
+
+    def putconn(self, con, close=False):
+        try:
+            self._release(con, close)
+        finally:
+            with self._lock:
+                self._stats["in_use"] -= 1
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            idle = len(self._idle)
+        stats.update({
+            "pid": self.pid,
+            "min": self.minconn,
+            "max": self.maxconn,
+            "open": stats["in_use"] + idle,
+            "idle": idle,
+        })
+        return stats
+
+    def close(self):
+        self._pool.closeall()
+
 
-def delete_expense(expense_id: int):
-    with get_con() as con:
-        cur = con.cursor()
-        cur.execute("DELETE FROM expenses WHERE id = %s", (expense_id,))
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                # Si heredamos el pool del proceso padre no lo cerramos: esas
+                # conexiones siguen siendo del padre. Solo creamos uno nuevo.
+                _pool = ConnectionPool(os.getenv("DATABASE_URL"))
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid():
+            _pool.close()
+        _pool = None
+
+
+def pool_stats():
+    if _pool is None or _pool.pid != os.getpid():
+        return {"pid": os.getpid(), "min": POOL_MIN, "max": POOL_MAX, "open": 0, "in_use": 0}
+    return _pool.stats()
+
+
+@contextmanager
+def get_con():
+    # Igual que `with psycopg2.connect(...) as con`: commit al salir sin errores,
+    # rollback si hay excepción. La conexión vuelve al pool en vez de cerrarse.
+    pool = get_pool()
+    con = pool.getconn()
+    broken = False
+    try:
+        yield con
         con.commit()
-        cur.close()
-
-def sum_by_period(user_id, start_date, end_date):
-    with get_con() as con:
-        cur = con.cursor()
-        cur.execute(
-            "SELECT SUM(amount) FROM expenses WHERE user_id = %s AND ts BETWEEN %s AND %s",
-            (user_id, start_date, end_date)
-        )
-        result = cur.fetchone()[0]
-        cur.close()
-        return result or 0.0
-
-def top_categories(user_id, start_date, end_date, limit=3):
-    with get_con() as con:
-        cur = con.cursor()
-        cur.execute(
-            "SELECT category, SUM(amount) as total "
-            "FROM expenses WHERE user_id = %s AND ts BETWEEN %s AND %s "
-            "GROUP BY category ORDER BY total DESC LIMIT %s",
-            (user_id, start_date, end_date, limit)
-        )
-        result = cur.fetchall()
-        cur.close()
-        return result
-
-def iter_by_period(user_id, start_date, end_date):
-    with get_con() as con:
-        cur = con.cursor()
-        cur.execute(
-            "SELECT * FROM expenses WHERE user_id = %s AND ts BETWEEN %s AND %s ORDER BY ts DESC",
-            (user_id, start_date, end_date)
-        )
-        result = cur.fetchall()
-        cur.close()
-        return result
\ No newline at end of file
+    except Exception as e:
+        broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        if not broken and not con.closed:
+            con.rollback()
+        raise
+    finally:
+        pool.putconn(con, close=broken)
+
+def init_db():
+    # El esquema lo manejan las migraciones versionadas (migrate.py), que se
+    # corren una vez por deploy. Se mantiene por compatibilidad.
+    from migrate import migrate
+    migrate()
@@ -0,0 +1,964 @@
+import asyncio
+import asyncpg
+import base64
+import os
+import re
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+import pytz
+
+from installments import PLAN_COLUMNS, plans_from_expenses
+from metrics import TimedConnection, query_label
+from rollup import BA_MONTH, split_period
+
+# --- POOL ASYNC ---
+# Versión asyncio de db.py para los handlers de FastAPI: las consultas no
+# bloquean el event loop mientras esperan a Postgres.
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Conexiones que se abren al arrancar, antes del primer pedido (warm_pool)
+POOL_WARM = int(os.getenv("DB_POOL_WARM", "4"))
+DB_TIMEZONE = os.getenv("DB_TIMEZONE", "America/Argentina/Buenos_Aires")
+BA_TZ = pytz.timezone(DB_TIMEZONE)
+
+_pool = None
+
+
+async def init_pool():
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(
+            os.getenv("DATABASE_URL"),
+            min_size=POOL_MIN,
+            max_size=POOL_MAX,
+            timeout=POOL_TIMEOUT,
+            server_settings={"timezone": DB_TIMEZONE},
+            # Mide cada consulta para /metrics (metrics.py)
+            connection_class=TimedConnection,
+        )
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def get_pool():
+    if _pool is None:
+        return await init_pool()
+    return _pool
+
+
+async def warm_pool(size=POOL_WARM):
+    # Abre `size` conexiones juntas y las prueba: sin esto los primeros
+    # pedidos después de un arranque (el home hace varias consultas en
+    # paralelo) pagan cada uno la conexión y el handshake con Postgres.
+    pool = await init_pool()
+    cons = await asyncio.gather(*(pool.acquire() for _ in range(max(1, min(size, POOL_MAX)))))
+    try:
+        await asyncio.gather(*(con.fetchval("SELECT 1") for con in cons))
+    finally:
+        for con in cons:
+            await pool.release(con)
+    return len(cons)
+
+
+@query_label
+async def schema_version():
+    # Última migración aplicada (migrate.py); None si todavía no hay ninguna
+    pool = await get_pool()
+    try:
+        return await pool.fetchval("SELECT MAX(version) FROM schema_migrations")
+    except asyncpg.UndefinedTableError:
+        return None
+
+
+def pool_stats():
+    if _pool is None:
+        return {"min": POOL_MIN, "max": POOL_MAX, "open": 0, "idle": 0, "in_use": 0}
+    size, idle = _pool.get_size(), _pool.get_idle_size()
+    return {"min": POOL_MIN, "max": POOL_MAX, "open": size, "idle": idle, "in_use": size - idle}
+
+
+# --- CONVERSIONES ---
+# asyncpg exige datetime para parámetros TIMESTAMPTZ: aceptamos también fechas
+# ('2024-05-01' o date, medianoche en BA) y strings ISO con o sin offset.
+def to_ts(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value) if "T" in value or " " in value else date.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value if value.tzinfo else BA_TZ.localize(value)
+    if isinstance(value, date):
+        return BA_TZ.localize(datetime.combine(value, time.min))
+    return value
+
+
+def to_amount(value):
+    return value if isinstance(value, Decimal) or value is None else Decimal(str(value))
+
+
+def ts_out(value):
+    # asyncpg devuelve TIMESTAMPTZ en UTC; la API siempre respondió en hora de BA
+    return value.astimezone(BA_TZ).isoformat() if isinstance(value, datetime) else value
+
+
+def row_out(record):
+    row = dict(record)
+    for key, value in row.items():
+        if isinstance(value, datetime):
+            row[key] = ts_out(value)
+        elif isinstance(value, Decimal):
+            row[key] = float(value)
+    return row
+
+
+# --- ESCRITURAS ---
+@query_label
+async def insert_expense(user_id, ts, amount, currency, category, note, raw_msg,
+                         payment_method=None, installment_plan_id=None, installment_details=None,
+                         idempotency_key=None):
+    # Devuelve (id, creado, avisos de presupuesto). Si ya existe un gasto del
+    # usuario con la misma clave de idempotencia no se inserta nada y se
+    # devuelve el id existente.
+    pool = await get_pool()
+    async with pool.acquire() as con:
+        async with con.transaction():
+            if installment_plan_id:
+                await _ensure_plans(con, [{
+                    "user_id": user_id, "ts": to_ts(ts), "amount": amount, "category": category, "note": note,
+                    "payment_method": payment_method, "installment_plan_id": installment_plan_id,
+                    "installment_details": installment_details,
+                }])
+            new_id = await con.fetchval(
+                "INSERT INTO expenses (user_id, ts, amount, currency, category, note, raw_msg, payment_method, installment_plan_id, installment_details, idempotency_key) "
+                "VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11) "
+                "ON CONFLICT (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING RETURNING id",
+                user_id, to_ts(ts), to_amount(amount), currency, category, note, raw_msg,
+                payment_method, installment_plan_id, installment_details, idempotency_key,
+            )
+            if new_id is not None:
+                alerts = await check_budgets(con, _touched([{"user_id": user_id, "category": category, "ts": ts}]))
+                return new_id, True, alerts
+            existing = await con.fetchval(
+                "SELECT id FROM expenses WHERE user_id = $1 AND idempotency_key = $2",
+                user_id, idempotency_key,
+            )
+            return existing, False, []
+
+
+EXPENSE_COLUMNS = (
+    ("user_id", "text"), ("ts", "timestamptz"), ("amount", "numeric"), ("currency", "text"),
+    ("category", "text"), ("note", "text"), ("raw_msg", "text"), ("payment_method", "text"),
+    ("installment_plan_id", "text"), ("installment_details", "text"), ("idempotency_key", "text"),
+)
+
+
+async def _ensure_plans(con, expenses):
+    # Crea los planes de cuotas que referencian las filas (si no existen) para
+    # que el INSERT de las cuotas cumpla la FK. Va en la transacción del INSERT.
+    plans = plans_from_expenses(expenses)
+    if not plans:
+        return
+    names = ", ".join(name for name, _ in PLAN_COLUMNS)
+    unnest = ", ".join(f"${i}::{kind}[]" for i, (_, kind) in enumerate(PLAN_COLUMNS, start=1))
+    await con.execute(
+        f"INSERT INTO installment_plans ({names}) SELECT * FROM unnest({unnest}) ON CONFLICT (id) DO NOTHING",
+        *([plan[name] for plan in plans] for name, _ in PLAN_COLUMNS),
+    )
+
+
+@query_label
+async def insert_expenses(expenses):
+    # Un solo INSERT ... SELECT FROM unnest(arrays): una ida y vuelta y una
+    # transacción para N filas, atómico. Los ids son seriales asignados en el
+    # orden de las filas, así que ordenados corresponden al orden recibido.
+    #
+    # Las filas cuya clave de idempotencia ya existe (o se repite dentro del
+    # lote) se saltean y se devuelve el id del gasto original. Devuelve
+    # (ids en el orden recibido, cantidad de filas insertadas, avisos de
+    # presupuesto).
+    arrays = []
+    for name, _ in EXPENSE_COLUMNS:
+        values = [e.get(name) for e in expenses]
+        if name == "ts":
+            values = [to_ts(v) for v in values]
+        elif name == "amount":
+            values = [to_amount(v) for v in values]
+        arrays.append(values)
+    names = ", ".join(name for name, _ in EXPENSE_COLUMNS)
+    unnest = ", ".join(f"${i}::{kind}[]" for i, (_, kind) in enumerate(EXPENSE_COLUMNS, start=1))
+    pool = await get_pool()
+    async with pool.acquire() as con:
+        async with con.transaction():
+            await _ensure_plans(con, [
+                {**e, "ts": to_ts(e.get("ts"))} for e in expenses if e.get("installment_plan_id")
+            ])
+            rows = await con.fetch(
+                f"INSERT INTO expenses ({names}) SELECT * FROM unnest({unnest}) "
+                "ON CONFLICT (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING "
+                "RETURNING id, user_id, idempotency_key, category, ts",
+                *arrays,
+            )
+            alerts = await check_budgets(con, _touched(rows))
+            by_key = {(r["user_id"], r["idempotency_key"]): r["id"] for r in rows if r["idempotency_key"] is not None}
+            keyed = [(e["user_id"], e["idempotency_key"]) for e in expenses if e.get("idempotency_key") is not None]
+            missing = [k for k in dict.fromkeys(keyed) if k not in by_key]
+            if missing:
+                existing = await con.fetch(
+                    "SELECT e.id, e.user_id, e.idempotency_key FROM expenses e "
+                    "JOIN unnest($1::text[], $2::text[]) AS k(user_id, idempotency_key) "
+                    "USING (user_id, idempotency_key)",
+                    [k[0] for k in missing], [k[1] for k in missing],
+                )
+                by_key.update({(r["user_id"], r["idempotency_key"]): r["id"] for r in existing})
+    # Las filas sin clave siempre se insertan, en orden
+    unkeyed = iter(sorted(r["id"] for r in rows if r["idempotency_key"] is None))
+    ids = [
+        by_key[(e["user_id"], e["idempotency_key"])] if e.get("idempotency_key") is not None else next(unkeyed)
+        for e in expenses
+    ]
+    return ids, len(rows), alerts
+
+
+IMPORT_COLUMNS = (
+    "user_id", "ts", "amount", "currency", "category", "note", "raw_msg",
+    "payment_method", "installment_details", "idempotency_key",
+)
+
+
+@query_label
+async def import_expenses(records):
+    # Carga masiva (importación de extractos, importer.py): COPY a una tabla
+    # temporal y un solo INSERT ... SELECT que saltea las filas cuya clave de
+    # idempotencia (el hash del contenido) ya existe. `records` son tuplas en
+    # el orden de IMPORT_COLUMNS. Una transacción por llamada; los triggers
+    # del rollup y de ledger_versions corren una vez por sentencia.
+    # Devuelve (filas insertadas, avisos de presupuesto).
+    names = ", ".join(IMPORT_COLUMNS)
+    pool = await get_pool()
+    async with pool.acquire() as con:
+        async with con.transaction():
+            await con.execute(
+                f"CREATE TEMP TABLE import_rows ON COMMIT DROP AS SELECT {names} FROM expenses WITH NO DATA"
+            )
+            await con.copy_records_to_table("import_rows", records=records, columns=IMPORT_COLUMNS)
+            rows = await con.fetch(
+                f"INSERT INTO expenses ({names}) SELECT {names} FROM import_rows ORDER BY ts "
+                "ON CONFLICT (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING "
+                "RETURNING user_id, category, ts",
+            )
+            alerts = await check_budgets(con, _touched(rows))
+    return len(rows), alerts
+
+
+@query_label
+async def delete_expense(expense_id: int):
+    # Si el gasto es parte de un plan de cuotas se borra el plan y sus cuotas
+    # caen por la FK en cascada; si no, solo el gasto. Una sola sentencia.
+    # Devuelve los usuarios afectados, o None si el gasto no existe.
+    pool = await get_pool()
+    async with pool.acquire() as con:
+        async with con.transaction():
+            rows = await con.fetch(
+                "WITH target AS (SELECT id, installment_plan_id FROM expenses WHERE id = $1), "
+                "plan AS (DELETE FROM installment_plans p USING target t "
+                "         WHERE p.id = t.installment_plan_id RETURNING p.user_id, p.category), "
+                "single AS (DELETE FROM expenses e USING target t "
+                "           WHERE e.id = t.id AND t.installment_plan_id IS NULL RETURNING e.user_id, e.category) "
+                "SELECT user_id, category FROM plan UNION ALL SELECT user_id, category FROM single",
+                expense_id,
+            )
+            # Una baja solo puede bajar lo gastado: no hay avisos nuevos, pero
+            # se rehabilitan los umbrales que dejaron de cumplirse
+            await check_budgets(con, [(r["user_id"], r["category"]) for r in rows])
+    return {r["user_id"] for r in rows} if rows else None
+
+
+@query_label
+async def delete_plan(plan_id):
+    # Devuelve el user_id del plan borrado (con todas sus cuotas), o None
+    pool = await get_pool()
+    async with pool.acquire() as con:
+        async with con.transaction():
+            row = await con.fetchrow("DELETE FROM installment_plans WHERE id = $1 RETURNING user_id, category", plan_id)
+            if row is None:
+                return None
+            await check_budgets(con, [(row["user_id"], row["category"])])
+    return row["user_id"]
+
+
+@query_label
+async def update_expense(expense_id: int, amount, payment_method):
+    # Devuelve (user_id, avisos de presupuesto); user_id None si no existe
+    pool = await get_pool()
+    async with pool.acquire() as con:
+        async with con.transaction():
+            row = await con.fetchrow(
+                "UPDATE expenses SET amount = $1, payment_method = $2 WHERE id = $3 RETURNING user_id, category, ts",
+                to_amount(amount), payment_method, expense_id,
+            )
+            if row is None:
+                return None, []
+            return row["user_id"], await check_budgets(con, _touched([row]))
+
+
+# --- PRESUPUESTOS ---
+# Presupuesto mensual por categoría. Lo gastado sale del rollup mensual, que
+# los triggers actualizan en la misma transacción que cada escritura: evaluar
+# los umbrales después de un alta no vuelve a sumar gastos, son dos búsquedas
+# por clave sin importar el tamaño del historial.
+# Umbrales de aviso, en % del presupuesto
+BUDGET_THRESHOLDS = sorted(int(t) for t in os.getenv("BUDGET_THRESHOLDS", "80,100").split(","))
+
+
+def current_month():
+    return datetime.now(BA_TZ).date().replace(day=1)
+
+
+def _touched(rows):
+    # (usuario, categoría) de las filas que caen en el mes actual: los avisos
+    # son sobre el mes en curso, un gasto cargado con fecha vieja no avisa
+    month = current_month()
+    return {
+        (row["user_id"], row["category"]) for row in rows
+        if to_ts(row["ts"]).astimezone(BA_TZ).date().replace(day=1) == month
+    }
+
+
+def _budget_out(category, amount, spent):
+    pct = float(spent / amount * 100) if amount else None
+    if pct is None:
+        status = None
+    elif pct >= 100:
+        status = "exceeded"
+    elif pct >= BUDGET_THRESHOLDS[0]:
+        status = "warning"
+    else:
+        status = "ok"
+    return {
+        "category": category,
+        "budget": float(amount) if amount is not None else None,
+        "spent": float(spent),
+        "remaining": float(amount - spent) if amount is not None else None,
+        "percentage": round(pct, 1) if pct is not None else None,
+        "status": status,
+    }
+
+
+# Una sentencia: lo gastado en el mes por cada (usuario, categoría) tocada que
+# tenga presupuesto, los avisos que dejaron de cumplirse se borran y los
+# umbrales cruzados que no estaban avisados se registran y se devuelven
+_BUDGET_CHECK = """
+WITH t AS (SELECT DISTINCT * FROM unnest($1::text[], $2::text[]) AS t(user_id, category)),
+s AS (
+    SELECT b.user_id, b.category, b.amount,
+           COALESCE((SELECT SUM(r.total) FROM expense_rollup_monthly r
+                     WHERE r.user_id = b.user_id AND r.month = $3 AND r.category = b.category), 0) AS spent
+    FROM budgets b JOIN t USING (user_id, category)
+),
+cleared AS (
+    DELETE FROM budget_alerts a USING s
+    WHERE a.user_id = s.user_id AND a.category = s.category AND a.month = $3
+      AND s.spent * 100 < s.amount * a.threshold
+),
+crossed AS (
+    INSERT INTO budget_alerts (user_id, category, month, threshold)
+    SELECT s.user_id, s.category, $3, th FROM s CROSS JOIN unnest($4::int[]) AS th
+    WHERE s.spent * 100 >= s.amount * th
+    ON CONFLICT DO NOTHING
+    RETURNING user_id, category, threshold
+)
+SELECT s.user_id, s.category, s.amount, s.spent, MAX(c.threshold) AS threshold
+FROM crossed c JOIN s USING (user_id, category)
+GROUP BY 1, 2, 3, 4
+ORDER BY 1, 2
+"""
+
+
+async def check_budgets(con, touched):
+    # Corre en la transacción de la escritura, después del INSERT/UPDATE/DELETE
+    # (el rollup ya está actualizado). Devuelve un aviso por categoría con el
+    # umbral más alto recién cruzado.
+    if not touched:
+        return []
+    users, categories = zip(*touched)
+    rows = await con.fetch(_BUDGET_CHECK, list(users), list(categories), current_month(), BUDGET_THRESHOLDS)
+    return [
+        {"user_id": r["user_id"], "threshold": r["threshold"], **_budget_out(r["category"], r["amount"], r["spent"])}
+        for r in rows
+    ]
+
+
+@query_label
+async def budget_status(user_id, month=None, category=None):
+    # Estado del mes de todas las categorías: las que tienen presupuesto
+    # (primero, de la más consumida a la menos) y las que tienen gastos pero
+    # no presupuesto. O(categorías): lee el rollup, no los gastos.
+    month = month or current_month()
+    pool = await get_pool()
+    rows = await pool.fetch(
+        "WITH spent AS ("
+        "  SELECT category, SUM(total) AS spent, SUM(count)::int AS count FROM expense_rollup_monthly"
+        "  WHERE user_id = $1 AND month = $2 AND ($3::text IS NULL OR category = $3) GROUP BY category"
+        "), b AS ("
+        "  SELECT category, amount FROM budgets WHERE user_id = $1 AND ($3::text IS NULL OR category = $3)"
+        ") "
+        "SELECT COALESCE(b.category, s.category) AS category, b.amount, "
+        "       COALESCE(s.spent, 0) AS spent, COALESCE(s.count, 0) AS count "
+        "FROM b FULL JOIN spent s ON s.category = b.category "
+        "ORDER BY b.amount IS NULL, COALESCE(s.spent, 0) / b.amount DESC, COALESCE(s.spent, 0) DESC, 1",
+        user_id, month, category,
+    )
+    categories = [{**_budget_out(r["category"], r["amount"], r["spent"]), "count": r["count"]} for r in rows]
+    budgeted = [c for c in categories if c["budget"] is not None]
+    return {
+        "month": month.isoformat()[:7],
+        "thresholds": BUDGET_THRESHOLDS,
+        "budget": sum(c["budget"] for c in budgeted),
+        "spent": sum(c["spent"] for c in budgeted),
+        "categories": categories,
+    }
+
+
+@query_label
+async def set_budget(user_id, category, amount):
+    # Alta o cambio de monto. Los avisos del mes se recalculan con el monto
+    # nuevo: los umbrales que ya se cumplen quedan registrados sin avisar (el
+    # estado va en la respuesta) y los que dejan de cumplirse se rehabilitan.
+    pool = await get_pool()
+    async with pool.acquire() as con:
+        async with con.transaction():
+            await con.execute(
+                "INSERT INTO budgets (user_id, category, amount) VALUES ($1, $2, $3) "
+                "ON CONFLICT (user_id, category) DO UPDATE SET amount = EXCLUDED.amount, updated_at = now()",
+                user_id, category, to_amount(amount),
+            )
+            await check_budgets(con, [(user_id, category)])
+    status = await budget_status(user_id, category=category)
+    return status["categories"][0]
+
+
+@query_label
+async def delete_budget(user_id, category):
+    # Devuelve False si la categoría no tenía presupuesto
+    pool = await get_pool()
+    async with pool.acquire() as con:
+        async with con.transaction():
+            await con.execute("DELETE FROM budget_alerts WHERE user_id = $1 AND category = $2", user_id, category)
+            deleted = await con.execute("DELETE FROM budgets WHERE user_id = $1 AND category = $2", user_id, category)
+    return deleted != "DELETE 0"
+
+
+# --- LECTURAS ---
+LIST_COLUMNS = (
+    "id, ts as date, amount, category, note as description, user_id, "
+    "payment_method, installment_plan_id, installment_details"
+)
+
+
+def encode_cursor(ts, expense_id):
+    raw = f"{ts.isoformat()}|{expense_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    # Lanza ValueError si el cursor no es válido
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    ts, expense_id = raw.rsplit("|", 1)
+    return datetime.fromisoformat(ts), int(expense_id)
+
+
+@query_label
+async def list_expenses(user_id, limit=50, cursor=None, start_date=None, end_date=None,
+                        category=None, payment_method=None, installment_plan_id=None):
+    # Paginación por keyset sobre (ts, id), en el mismo orden que el índice
+    # expenses_user_ts_idx: cada página cuesta O(limit) sin importar cuán
+    # atrás esté. Devuelve (filas, cursor de la página siguiente o None).
+    where, args = ["user_id = $1"], [user_id]
+
+    def add(condition, value):
+        args.append(value)
+        where.append(condition.format(f"${len(args)}"))
+
+    if cursor:
+        cursor_ts, cursor_id = decode_cursor(cursor)
+        args.extend([cursor_ts, cursor_id])
+        where.append(f"(ts, id) < (${len(args) - 1}, ${len(args)})")
+    if start_date:
+        add("ts >= {}", to_ts(start_date))
+    if end_date:
+        add("ts < {}", to_ts(end_date))
+    if category:
+        add("category = {}", category)
+    if payment_method:
+        add("payment_method = {}", payment_method)
+    if installment_plan_id:
+        add("installment_plan_id = {}", installment_plan_id)
+    args.append(limit + 1)
+
+    pool = await get_pool()
+    rows = await pool.fetch(
+        f"SELECT {LIST_COLUMNS} FROM expenses WHERE {' AND '.join(where)} "
+        f"ORDER BY ts DESC, id DESC LIMIT ${len(args)}",
+        *args,
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["date"], rows[-1]["id"])
+    return [row_out(r) for r in rows], next_cursor
+
+
+# --- BÚSQUEDA ---
+# Columna search_doc + índice GIN (migración 0008). Cada palabra buscada se
+# usa como prefijo ("super" encuentra "supermercado") y todas tienen que
+# aparecer; search_fold ignora tildes y mayúsculas de los dos lados.
+_SEARCH_WORD_RE = re.compile(r"[^\W_]+")
+# Texto de la búsqueda aproximada: la misma expresión que el índice de
+# trigramas (migración 0010), si no el planificador no lo usa
+SEARCH_FOLD_DOC = "search_fold(category || ' ' || COALESCE(note, '') || ' ' || COALESCE(raw_msg, ''))"
+_has_trgm = None
+
+
+def search_query(text):
+    # "Café Martínez" -> "café:* & martínez:*" (el folding lo hace Postgres)
+    return " & ".join(f"{word}:*" for word in _SEARCH_WORD_RE.findall(text.lower()))
+
+
+@query_label
+async def has_trgm():
+    global _has_trgm
+    if _has_trgm is None:
+        pool = await get_pool()
+        _has_trgm = await pool.fetchval("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+    return _has_trgm
+
+
+@query_label
+async def search_expenses(user_id, text, limit=50, offset=0, start_date=None, end_date=None,
+                          category=None, payment_method=None):
+    # Resultados por relevancia (ts_rank) y después los más nuevos. Si no hay
+    # coincidencias por palabras y está pg_trgm, se reintenta con similitud
+    # de trigramas. Devuelve (filas, offset de la página siguiente o None, modo).
+    query = search_query(text)
+    if not query:
+        return [], None, "fts"
+    where, args = ["user_id = $1"], [user_id]
+
+    def add(condition, value):
+        args.append(value)
+        where.append(condition.format(f"${len(args)}"))
+
+    if start_date:
+        add("ts >= {}", to_ts(start_date))
+    if end_date:
+        add("ts < {}", to_ts(end_date))
+    if category:
+        add("category = {}", category)
+    if payment_method:
+        add("payment_method = {}", payment_method)
+    filters = " AND ".join(where)
+    page = f"LIMIT {limit + 1} OFFSET {offset}"
+
+    pool = await get_pool()
+    mode = "fts"
+    rows = await pool.fetch(
+        f"SELECT {LIST_COLUMNS}, ts_rank(search_doc, q) AS rank "
+        f"FROM expenses, to_tsquery('spanish', search_fold(${len(args) + 1})) q "
+        f"WHERE {filters} AND search_doc @@ q ORDER BY rank DESC, ts DESC, id DESC {page}",
+        *args, query,
+    )
+    if not rows and offset == 0 and await has_trgm():
+        mode = "fuzzy"
+        rows = await pool.fetch(
+            f"SELECT {LIST_COLUMNS}, word_similarity(q, {SEARCH_FOLD_DOC}) AS rank "
+            f"FROM expenses, search_fold(${len(args) + 1}) q "
+            f"WHERE {filters} AND q <% {SEARCH_FOLD_DOC} ORDER BY rank DESC, ts DESC, id DESC {page}",
+            *args, text,
+        )
+    next_offset = offset + limit if len(rows) > limit else None
+    return [row_out(r) for r in rows[:limit]], next_offset, mode
+
+
+@query_label
+async def categories(user_id):
+    # Categorías del usuario con cantidad y total históricos, desde el rollup
+    # (expense_rollup_monthly_pkey): O(meses x categorías), no O(gastos)
+    pool = await get_pool()
+    rows = await pool.fetch(
+        "SELECT category, SUM(count)::int AS count, SUM(total) AS total, MAX(month) AS last_month "
+        "FROM expense_rollup_monthly WHERE user_id = $1 GROUP BY category ORDER BY count DESC, category",
+        user_id,
+    )
+    return [{**row_out(r), "last_month": r["last_month"].isoformat()} for r in rows]
+
+
+@query_label
+async def sum_by_period(user_id, start_date, end_date):
+    rows = await _aggregate(user_id, start_date, end_date)
+    return float(rows[0]["total"]) if rows else 0.0
+
+
+@query_label
+async def top_categories(user_id, start_date, end_date, limit=3):
+    rows = await _aggregate(user_id, start_date, end_date, "category", limit)
+    return [(r["key"], float(r["total"])) for r in rows]
+
+
+@query_label
+async def iter_by_period(user_id, start_date, end_date):
+    pool = await get_pool()
+    rows = await pool.fetch(
+        "SELECT id, user_id, ts, amount, currency, category, note, raw_msg, payment_method, installment_plan_id, installment_details "
+        "FROM expenses WHERE user_id = $1 AND ts >= $2 AND ts < $3 ORDER BY ts DESC",
+        user_id, to_ts(start_date), to_ts(end_date),
+    )
+    return [tuple(row_out(r).values()) for r in rows]
+
+
+# --- SINCRONIZACIÓN INCREMENTAL ---
+# ledger_versions y expense_changes los mantiene un trigger (migración 0004)
+@query_label
+async def ledger_version(user_id):
+    pool = await get_pool()
+    version = await pool.fetchval("SELECT version FROM ledger_versions WHERE user_id = $1", user_id)
+    return version or 0
+
+
+@query_label
+async def changes_since(user_id, since=0, limit=500):
+    # Cambios con versión > since, en orden. Cada gasto aparece una sola vez
+    # con su estado actual (upsert) o como baja (deleted). `cursor` es la
+    # versión a mandar como since en el próximo pedido.
+    pool = await get_pool()
+    async with pool.acquire() as con:
+        async with con.transaction(isolation="repeatable_read", readonly=True):
+            changes = await con.fetch(
+                "SELECT version, expense_id, op FROM expense_changes "
+                "WHERE user_id = $1 AND version > $2 ORDER BY version LIMIT $3",
+                user_id, since, limit + 1,
+            )
+            has_more = len(changes) > limit
+            changes = changes[:limit]
+            latest = {}
+            for change in changes:
+                latest[change["expense_id"]] = change["op"]
+            upsert_ids = [expense_id for expense_id, op in latest.items() if op == "U"]
+            rows = await con.fetch(
+                f"SELECT {LIST_COLUMNS} FROM expenses WHERE user_id = $1 AND id = ANY($2::int[]) ORDER BY ts DESC, id DESC",
+                user_id, upsert_ids,
+            ) if upsert_ids else []
+    found = {r["id"] for r in rows}
+    # Un alta que ya no existe se borró en una versión posterior a esta página
+    deleted = [expense_id for expense_id, op in latest.items() if op == "D" or expense_id not in found]
+    return {
+        "upserts": [row_out(r) for r in rows],
+        "deleted": deleted,
+        "cursor": changes[-1]["version"] if changes else since,
+        "has_more": has_more,
+    }
+
+
+# --- AGREGADOS PARA LOS WIDGETS ---
+# group_by -> (clave sobre expenses, clave sobre el rollup mensual, orden). Los
+# buckets de día/mes se calculan en la zona horaria de la sesión (BA); por día
+# no hay rollup y se agrupan las filas crudas.
+# El rollup guarda el medio de pago NULL como '' (es parte de la clave): en las
+# dos fuentes '' y NULL se leen como NULL, así el mismo período da el mismo
+# desglose salga de donde salga.
+PAYMENT_KEY = "NULLIF(payment_method, '')"
+SUMMARY_GROUPS = {
+    "category": ("category", "category", "total DESC"),
+    "payment_method": (PAYMENT_KEY, PAYMENT_KEY, "total DESC"),
+    "day": ("date_trunc('day', ts)::date", None, "key"),
+    "month": ("date_trunc('month', ts)::date", "month", "key"),
+    None: ("NULL", "NULL", "key"),
+}
+
+
+def _period_source(user_id, start_date, end_date, raw_columns, rollup_columns, args):
+    # SELECTs (para UNION ALL) que cubren [start, end): los meses completos
+    # desde el rollup (una fila por categoría/medio de pago y mes) y solo los
+    # bordes desde expenses. rollup_columns None fuerza todo por filas crudas.
+    # Cada parte devuelve raw/rollup_columns + total, count. user_id None
+    # agrega todas las cuentas (dashboard web).
+    if rollup_columns is None:
+        months, edges = None, [(start_date, end_date)]
+    else:
+        months, edges = split_period(start_date, end_date)
+    parts = []
+
+    def arg(value):
+        args.append(value)
+        return f"${len(args)}"
+
+    def user_filter():
+        return f"user_id = {arg(user_id)} AND " if user_id is not None else ""
+
+    if months:
+        parts.append(
+            f"SELECT {rollup_columns}, total, count FROM expense_rollup_monthly "
+            f"WHERE {user_filter()}month >= {arg(months[0])} AND month < {arg(months[1])}"
+        )
+    if edges:
+        ranges = " OR ".join(f"(ts >= {arg(to_ts(lo))} AND ts < {arg(to_ts(hi))})" for lo, hi in edges)
+        parts.append(
+            f"SELECT {raw_columns}, amount AS total, 1 AS count FROM expenses "
+            f"WHERE {user_filter()}({ranges})"
+        )
+    return parts
+
+
+async def _aggregate(user_id, start_date, end_date, group_by=None, limit=None):
+    raw_key, rollup_key, order = SUMMARY_GROUPS[group_by]
+    args = []
+    parts = _period_source(
+        user_id, start_date, end_date, f"{raw_key} AS key",
+        f"{rollup_key} AS key" if rollup_key is not None else None, args,
+    )
+    if not parts:
+        return []
+    query = (
+        f"SELECT key, SUM(total) AS total, SUM(count)::int AS count FROM ({' UNION ALL '.join(parts)}) t "
+        f"GROUP BY key ORDER BY {order}"
+    )
+    if limit:
+        args.append(limit)
+        query += f" LIMIT ${len(args)}"
+    pool = await get_pool()
+    return await pool.fetch(query, *args)
+
+
+@query_label
+async def digest(user_id, start_date, end_date, top=5):
+    # Total, categorías y medios de pago del período en una sola consulta
+    # (GROUPING SETS sobre la misma fuente rollup + bordes que _aggregate).
+    args = []
+    parts = _period_source(
+        user_id, start_date, end_date, f"category, {PAYMENT_KEY} AS payment_method",
+        f"category, {PAYMENT_KEY} AS payment_method", args,
+    )
+    result = {"total": 0.0, "count": 0, "categories": [], "payment_methods": [], "other_categories": 0}
+    if not parts:
+        return result
+    pool = await get_pool()
+    rows = await pool.fetch(
+        "SELECT GROUPING(category) AS no_category, GROUPING(payment_method) AS no_payment, "
+        "category, payment_method, SUM(total) AS total, SUM(count)::int AS count "
+        f"FROM ({' UNION ALL '.join(parts)}) t "
+        "GROUP BY GROUPING SETS ((), (category), (payment_method)) ORDER BY total DESC",
+        *args,
+    )
+    for r in rows:
+        if r["no_category"] and r["no_payment"]:
+            # Sin gastos el conjunto vacío igual devuelve una fila (SUM NULL)
+            result["total"], result["count"] = float(r["total"] or 0), r["count"] or 0
+        elif not r["no_category"]:
+            result["categories"].append({"key": r["category"], "total": float(r["total"]), "count": r["count"]})
+        else:
+            result["payment_methods"].append({"key": r["payment_method"], "total": float(r["total"]), "count": r["count"]})
+    result["other_categories"] = max(0, len(result["categories"]) - top)
+    result["categories"] = result["categories"][:top]
+    return result
+
+
+@query_label
+async def summarize(user_id, start_date, end_date, group_by="category", limit=None):
+    # Una fila por grupo: O(grupos) en la respuesta en vez de O(gastos)
+    rows = await _aggregate(user_id, start_date, end_date, group_by)
+    groups = [
+        {
+            "key": r["key"].isoformat() if isinstance(r["key"], date) else r["key"],
+            "total": float(r["total"]),
+            "count": r["count"],
+        }
+        for r in rows
+    ]
+    return {
+        "total": round(sum(g["total"] for g in groups), 2),
+        "count": sum(g["count"] for g in groups),
+        "groups": groups[:limit] if limit else groups,
+    }
+
+
+@query_label
+async def recent_expenses(user_id, start_date, end_date, limit=6):
+    pool = await get_pool()
+    rows = await pool.fetch(
+        f"SELECT {LIST_COLUMNS} "
+        "FROM expenses WHERE user_id = $1 AND ts >= $2 AND ts < $3 ORDER BY ts DESC, id DESC LIMIT $4",
+        user_id, to_ts(start_date), to_ts(end_date), limit,
+    )
+    return [row_out(r) for r in rows]
+
+
+@query_label
+async def upcoming_installments(user_id, since, limit=10):
+    # La próxima cuota (desde `since`) de cada plan, ordenadas por vencimiento,
+    # con lo que resta pagar del plan. Recorre expenses_user_installment_ts_idx.
+    pool = await get_pool()
+    rows = await pool.fetch(
+        "SELECT next.*, p.total AS plan_total, p.installments FROM ("
+        " SELECT DISTINCT ON (installment_plan_id) id, installment_plan_id AS plan_id,"
+        " COALESCE(NULLIF(note, ''), category) AS description, installment_details AS details, ts AS date, amount,"
+        " COUNT(*) OVER w AS remaining, SUM(amount) OVER w AS remaining_amount"
+        " FROM expenses WHERE user_id = $1 AND installment_plan_id IS NOT NULL AND ts >= $2"
+        " WINDOW w AS (PARTITION BY installment_plan_id)"
+        " ORDER BY installment_plan_id, ts"
+        ") next JOIN installment_plans p ON p.id = next.plan_id ORDER BY date LIMIT $3",
+        user_id, to_ts(since), limit,
+    )
+    return [row_out(r) for r in rows]
+
+
+@query_label
+async def installment_commitments(user_id, since, until):
+    # Total de cuotas a pagar por mes (hora de BA) en [since, until)
+    pool = await get_pool()
+    rows = await pool.fetch(
+        f"SELECT {BA_MONTH} AS month, SUM(amount) AS total, COUNT(*) AS count FROM expenses"
+        " WHERE user_id = $1 AND installment_plan_id IS NOT NULL AND ts >= $2 AND ts < $3"
+        " GROUP BY 1 ORDER BY 1",
+        user_id, to_ts(since), to_ts(until),
+    )
+    return [{**row_out(r), "month": r["month"].isoformat()} for r in rows]
+
+
+@query_label
+async def installment_plan(plan_id, today):
+    # El plan con su cronograma completo; None si no existe
+    pool = await get_pool()
+    async with pool.acquire() as con:
+        plan = await con.fetchrow(
+            "SELECT id, user_id, description, category, payment_method, total, installments, start_ts"
+            " FROM installment_plans WHERE id = $1",
+            plan_id,
+        )
+        if plan is None:
+            return None
+        rows = await con.fetch(
+            "SELECT id, installment_details AS details, ts AS date, amount FROM expenses"
+            " WHERE installment_plan_id = $1 ORDER BY ts, id",
+            plan_id,
+        )
+    cutoff = to_ts(today)
+    schedule = [{**row_out(r), "paid": r["date"] < cutoff} for r in rows]
+    paid = [item for item in schedule if item["paid"]]
+    pending = [item for item in schedule if not item["paid"]]
+    return {
+        **row_out(plan),
+        "paid_count": len(paid),
+        "paid_amount": round(sum(item["amount"] for item in paid), 2),
+        "remaining_count": len(pending),
+        "remaining_amount": round(sum(item["amount"] for item in pending), 2),
+        "next_due": pending[0]["date"] if pending else None,
+        "schedule": schedule,
+    }
+
+
+# --- SERIES DE TIEMPO ---
+# Buckets en hora de BA (la sesión del pool usa DB_TIMEZONE), igual que el
+# group_by day/month de summarize.
+GRANULARITIES = ("day", "week", "month")
+BREAKDOWNS = {"category": "category", "payment_method": PAYMENT_KEY, None: "NULL::text"}
+MAX_BUCKETS = 1000
+
+
+@query_label
+async def timeseries(user_id, start_date=None, end_date=None, granularity="day", breakdown=None, window=7, top=8):
+    # Serie con todos los buckets de [start, end) aunque no tengan gastos
+    # (generate_series), por clave si hay breakdown (las `top` claves de mayor
+    # total; el resto se suma en "otros"). Por bucket: total, cantidad, media
+    # móvil de `window` buckets y diferencia con el bucket anterior, todo con
+    # funciones de ventana. start/end None (período abierto) se recortan al
+    # primer/último gasto; si no hay gastos devuelve None. ValueError si el
+    # período tiene demasiados buckets.
+    key = BREAKDOWNS[breakdown]
+    pool = await get_pool()
+    async with pool.acquire() as con:
+        start = date.fromisoformat(str(start_date)[:10]) if start_date else None
+        end = date.fromisoformat(str(end_date)[:10]) if end_date else None
+        if start is None or end is None:
+            where, args = ["user_id = $1"], [user_id]
+            if start:
+                args.append(to_ts(start))
+                where.append(f"ts >= ${len(args)}")
+            if end:
+                args.append(to_ts(end))
+                where.append(f"ts < ${len(args)}")
+            bounds = await con.fetchrow(
+                f"SELECT MIN(ts)::date AS first, MAX(ts)::date AS last FROM expenses WHERE {' AND '.join(where)}",
+                *args,
+            )
+            if bounds["first"] is None:
+                return None
+            start = start or bounds["first"]
+            end = end or bounds["last"] + timedelta(days=1)
+        span = {"day": 1, "week": 7, "month": 28}[granularity]
+        if (end - start).days / span > MAX_BUCKETS:
+            raise ValueError("demasiados buckets")
+        # Sin gastos en el rango no hay claves: igual va una serie (NULL, en
+        # cero) para que estén todos los buckets
+        keys = (
+            "SELECT DISTINCT key FROM data UNION ALL SELECT NULL::text WHERE NOT EXISTS (SELECT 1 FROM data)"
+            if breakdown else "SELECT NULL::text AS key"
+        )
+        rows = await con.fetch(
+            f"WITH raw AS ("
+            f"  SELECT date_trunc('{granularity}', ts)::date AS bucket, {key} AS key, SUM(amount) AS total, COUNT(*) AS count"
+            f"  FROM expenses WHERE user_id = $1 AND ts >= $2 AND ts < $3 GROUP BY 1, 2"
+            f"), ranked AS ("
+            f"  SELECT key, row_number() OVER (ORDER BY SUM(total) DESC) AS n FROM raw GROUP BY key"
+            f"), data AS ("
+            f"  SELECT r.bucket, CASE WHEN k.n <= {int(top)} THEN r.key ELSE 'otros' END AS key,"
+            f"         SUM(r.total) AS total, SUM(r.count)::int AS count"
+            f"  FROM raw r JOIN ranked k ON k.key IS NOT DISTINCT FROM r.key GROUP BY 1, 2"
+            f"), buckets AS ("
+            f"  SELECT generate_series(date_trunc('{granularity}', $4::date), $5::date - 1, interval '1 {granularity}')::date AS bucket"
+            f"), grid AS ("
+            f"  SELECT b.bucket, k.key FROM buckets b CROSS JOIN ({keys}) k"
+            f") "
+            f"SELECT g.bucket, g.key, COALESCE(d.total, 0) AS total, COALESCE(d.count, 0) AS count,"
+            f"       AVG(COALESCE(d.total, 0)) OVER w_roll AS rolling_avg,"
+            f"       COALESCE(d.total, 0) - LAG(COALESCE(d.total, 0)) OVER w AS delta "
+            f"FROM grid g LEFT JOIN data d ON d.bucket = g.bucket AND d.key IS NOT DISTINCT FROM g.key "
+            f"WINDOW w AS (PARTITION BY g.key ORDER BY g.bucket),"
+            f"       w_roll AS (w ROWS BETWEEN {int(window) - 1} PRECEDING AND CURRENT ROW) "
+            f"ORDER BY g.key NULLS FIRST, g.bucket",
+            user_id, to_ts(start), to_ts(end), start, end,
+        )
+    # Filas ordenadas por (clave, bucket) -> un arreglo por métrica y clave
+    buckets, series = [], {}
+    for r in rows:
+        item = series.get(r["key"])
+        if item is None:
+            item = series[r["key"]] = {"key": r["key"], "total": [], "count": [], "rolling_avg": [], "delta": []}
+        if len(series) == 1:
+            buckets.append(r["bucket"].isoformat())
+        item["total"].append(float(r["total"]))
+        item["count"].append(r["count"])
+        item["rolling_avg"].append(round(float(r["rolling_avg"]), 2))
+        item["delta"].append(float(r["delta"]) if r["delta"] is not None else None)
+    ordered = sorted(series.values(), key=lambda item: -sum(item["total"]))
+    return {"start": start.isoformat(), "end": end.isoformat(), "buckets": buckets, "series": ordered}
+
+
+# --- CONSULTAS DE LA WEB (todas las cuentas) ---
+@query_label
+async def total_between(start_date, end_date):
+    return await sum_by_period(None, start_date, end_date)
+
+
+@query_label
+async def movements_between(start_date, end_date, descending=True):
+    order = "DESC" if descending else "ASC"
+    pool = await get_pool()
+    rows = await pool.fetch(
+        f"SELECT id, ts, amount, currency, category, note FROM expenses WHERE ts >= $1 AND ts < $2 ORDER BY ts {order}, id {order}",
+        to_ts(start_date), to_ts(end_date),
+    )
+    return [row_out(r) for r in rows]
@@ -0,0 +1,167 @@
+# Exportación en streaming: lee los gastos con un cursor del lado del servidor
+# de a CHUNK_SIZE filas y va emitiendo bytes, así que la memoria queda acotada
+# por el tamaño del bloque y no por la cantidad de filas.
+#
+# Formatos: csv, jsonl y parquet (columnar; requiere pyarrow instalado).
+# Cualquiera de ellos se puede comprimir con gzip al vuelo.
+import csv
+import json
+import zlib
+from io import StringIO
+
+import db_async
+
+CHUNK_SIZE = 2000
+
+COLUMNS = [
+    "id", "ts", "amount", "currency", "category", "note",
+    "payment_method", "installment_plan_id", "installment_details",
+]
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+class ExportError(Exception):
+    pass
+
+
+def _have_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def check_format(fmt):
+    if fmt not in FORMATS:
+        raise ExportError(f"Formato desconocido: {fmt}")
+    if fmt == "parquet" and not _have_pyarrow():
+        raise ExportError("El formato parquet requiere pyarrow instalado en el servidor")
+
+
+def media_type(fmt, gzip=False):
+    return "application/gzip" if gzip else FORMATS[fmt][0]
+
+
+def filename(prefix, fmt, gzip=False):
+    return f"{prefix}.{FORMATS[fmt][1]}" + (".gz" if gzip else "")
+
+
+async def iter_chunks(user_id, start_date, end_date, chunk_size=CHUNK_SIZE):
+    # Bloques de filas (dicts) en orden cronológico. Si user_id es None se
+    # exportan todas las cuentas (lo usa el dashboard web original).
+    where, args = ["ts >= $1", "ts < $2"], [db_async.to_ts(start_date), db_async.to_ts(end_date)]
+    if user_id is not None:
+        args.append(user_id)
+        where.append(f"user_id = ${len(args)}")
+    query = f"SELECT {', '.join(COLUMNS)} FROM expenses WHERE {' AND '.join(where)} ORDER BY ts, id"
+
+    pool = await db_async.get_pool()
+    async with pool.acquire() as con:
+        # Los cursores de asyncpg son portales del lado del servidor y
+        # necesitan una transacción abierta
+        async with con.transaction(isolation="repeatable_read", readonly=True):
+            cursor = await con.cursor(query, *args)
+            while True:
+                records = await cursor.fetch(chunk_size)
+                if not records:
+                    break
+                yield [db_async.row_out(r) for r in records]
+
+
+async def _csv(chunks):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    async for rows in chunks:
+        for row in rows:
+            writer.writerow(["" if row[c] is None else row[c] for c in COLUMNS])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def _jsonl(chunks):
+    async for rows in chunks:
+        yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+
+
+class _DrainSink:
+    # Destino de escritura que se puede vaciar sin perder la posición absoluta:
+    # parquet guarda en el footer los offsets de cada row group.
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+async def _parquet(chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.int64()), ("ts", pa.string()), ("amount", pa.float64()),
+        ("currency", pa.string()), ("category", pa.string()), ("note", pa.string()),
+        ("payment_method", pa.string()), ("installment_plan_id", pa.string()),
+        ("installment_details", pa.string()),
+    ])
+    # Cada bloque se escribe como un row group y se vacía el buffer: solo el
+    # footer (metadatos de los row groups) queda en memoria hasta el final.
+    sink = _DrainSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="snappy")
+    try:
+        async for rows in chunks:
+            table = pa.Table.from_pydict({c: [row[c] for row in rows] for c in COLUMNS}, schema=schema)
+            writer.write_table(table)
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+async def _gzip(stream):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for data in stream:
+        compressed = compressor.compress(data)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(user_id, start_date, end_date, fmt="csv", gzip=False, chunk_size=CHUNK_SIZE):
+    check_format(fmt)
+    writers = {"csv": _csv, "jsonl": _jsonl, "parquet": _parquet}
+    stream = writers[fmt](iter_chunks(user_id, start_date, end_date, chunk_size))
+    return _gzip(stream) if gzip else stream
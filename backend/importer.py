@@ -0,0 +1,327 @@
+# Importación de extractos (tarjeta, Mercado Pago, planillas) en CSV.
+#
+# La subida se vuelca primero completa (spool_upload: en memoria hasta
+# SPOOL_BYTES, después en un archivo temporal) y recién entonces se procesa en
+# streaming, de a CHUNK_SIZE filas con csv.reader: la memoria queda acotada
+# por el bloque y no por el largo del extracto. Cada bloque se normaliza
+# (fecha en hora de BA, monto, medio de pago con los alias de
+# parser.PAYMENT_METHODS) y se carga con COPY (db_async.import_expenses), una
+# transacción por bloque.
+#
+# Cada fila lleva como clave de idempotencia un hash de su contenido (usuario,
+# fecha, monto, descripción y cuántas veces apareció esa misma fila antes en
+# el archivo): reimportar el mismo extracto, o uno que se superpone con el
+# anterior, no duplica gastos. Por lo mismo, si una importación se corta a la
+# mitad alcanza con volver a subir el archivo.
+#
+# El progreso sale como NDJSON, una línea por evento:
+#   {"event": "error", "line": 12, "error": "Fecha inválida: 31/02/2024"}
+#   {"event": "progress", "line": 2001, "rows": 2000, "inserted": 1990, ...}
+#   {"event": "done", ...totales}   o   {"event": "failed", "error": ..., ...totales}
+#
+# Perfiles: cómo leer las columnas de cada tipo de extracto. Se pueden agregar
+# o pisar con un JSON en IMPORT_PROFILES_PATH ({"nombre": {...perfil...}}).
+import asyncio
+import csv
+import functools
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, time as dt_time
+from decimal import Decimal
+
+import pytz
+
+import db_async
+from cache import get_read_cache
+from parser import find_payment_method, parse_amount
+
+BA_TZ = pytz.timezone("America/Argentina/Buenos_Aires")
+CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "2000"))
+MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(20 * 1024 * 1024)))
+# Errores por fila que se informan con detalle; el resto solo se cuenta
+MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "100"))
+# El cuerpo se vuelca a disco a partir de este tamaño
+SPOOL_BYTES = 1024 * 1024
+# Días para los que se recuerdan las filas ya vistas (para numerar las
+# repetidas). Los extractos vienen ordenados por fecha, así que alcanza con
+# los últimos días y la memoria no crece con el largo del archivo.
+SEEN_DAYS = 31
+# Hora que se asigna a los movimientos que solo traen fecha: mediodía cae
+# siempre en el mismo día y mes en BA, y es estable entre importaciones
+DEFAULT_TIME = dt_time(12, 0)
+
+# columns: campo -> nombre de la columna en el encabezado (sin importar
+# mayúsculas ni acentos). date y amount son obligatorios; description,
+# category, payment_method e installments son opcionales.
+# sign: 1 si los gastos vienen en positivo, -1 si vienen en negativo (las
+# filas con el otro signo, ingresos o devoluciones, se saltean).
+# payment_method: medio de pago si la fila no trae uno reconocible.
+PROFILES = {
+    # Planilla armada a mano o exportada de otra app
+    "generico": {
+        "delimiter": ",",
+        "encoding": "utf-8-sig",
+        "columns": {
+            "date": "fecha", "amount": "monto", "description": "descripcion",
+            "category": "categoria", "payment_method": "medio_pago",
+        },
+        "date_formats": ["%Y-%m-%d", "%d/%m/%Y", "%d/%m/%y", "%Y-%m-%d %H:%M:%S"],
+        "sign": 1,
+        "payment_method": None,
+    },
+    # Reporte de actividad de "Dinero en cuenta" de Mercado Pago
+    "mercadopago": {
+        "delimiter": ";",
+        "encoding": "utf-8-sig",
+        "columns": {"date": "RELEASE_DATE", "amount": "TRANSACTION_NET_AMOUNT", "description": "TRANSACTION_TYPE"},
+        "date_formats": ["%d-%m-%Y", "%d/%m/%Y", "%Y-%m-%dT%H:%M:%S"],
+        "sign": -1,
+        "payment_method": "mercadopago",
+    },
+    # Resumen de tarjeta de crédito exportado desde el home banking
+    "tarjeta": {
+        "delimiter": ";",
+        "encoding": "latin-1",
+        "columns": {"date": "Fecha", "amount": "Pesos", "description": "Descripción", "installments": "Cuotas"},
+        "date_formats": ["%d/%m/%Y", "%d/%m/%y", "%d-%m-%y"],
+        "sign": 1,
+        "payment_method": "credito",
+    },
+}
+
+
+class StatementError(Exception):
+    pass
+
+
+class UploadTooLarge(StatementError):
+    pass
+
+
+def _fold(text):
+    # "Descripción " -> "descripcion": encabezados sin mayúsculas ni acentos
+    text = unicodedata.normalize("NFKD", text.strip().lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+@functools.lru_cache(maxsize=None)
+def profiles(path=os.getenv("IMPORT_PROFILES_PATH")):
+    result = dict(PROFILES)
+    if path:
+        with open(path, encoding="utf-8") as f:
+            result.update(json.load(f))
+    return result
+
+
+def get_profile(name):
+    if name not in profiles():
+        raise StatementError(f"Perfil desconocido: {name}. Disponibles: {', '.join(sorted(profiles()))}")
+    return profiles()[name]
+
+
+def parse_ts(value, formats):
+    # Fecha del extracto -> datetime en hora de BA. Acepta ISO (con o sin
+    # offset) y los formatos del perfil; sin hora, mediodía.
+    value = value.strip()
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        for fmt in formats:
+            try:
+                dt = datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            return None
+    if dt.tzinfo is not None:
+        return dt.astimezone(BA_TZ)
+    if dt.time() == dt_time.min and ":" not in value:
+        dt = datetime.combine(dt.date(), DEFAULT_TIME)
+    return BA_TZ.localize(dt)
+
+
+def content_hash(user_id, ts, amount, description, occurrence):
+    key = f"{user_id}|{ts.date().isoformat()}|{amount}|{_fold(description)}|{occurrence}"
+    return "csv:" + hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+class StatementReader:
+    # Lee el extracto de a bloques. next_chunk() devuelve (registros para
+    # db_async.import_expenses, errores [(línea, mensaje)], filas salteadas).
+    def __init__(self, fileobj, profile, user_id, default_category):
+        self.profile = profile
+        self.user_id = user_id
+        self.default_category = default_category
+        self._raw = fileobj
+        self._text = io.TextIOWrapper(fileobj, encoding=profile.get("encoding", "utf-8-sig"),
+                                      errors="replace", newline="")
+        self._reader = csv.reader(self._text, delimiter=profile.get("delimiter", ","))
+        self._seen = OrderedDict()  # fecha -> {(monto, descripción): apariciones}
+        self._index = self._header()
+        self.done = False
+
+    def _header(self):
+        try:
+            header = next(self._reader, None)
+        except csv.Error as e:
+            raise StatementError(f"No se pudo leer el encabezado: {e}") from e
+        if header is None:
+            raise StatementError("El archivo está vacío")
+        positions = {_fold(name): i for i, name in enumerate(header)}
+        index = {}
+        for field, column in self.profile["columns"].items():
+            if _fold(column) in positions:
+                index[field] = positions[_fold(column)]
+            elif field in ("date", "amount"):
+                raise StatementError(f"Falta la columna '{column}' en el encabezado")
+        return index
+
+    @property
+    def line(self):
+        return self._reader.line_num
+
+    def _value(self, row, field):
+        i = self._index.get(field)
+        return row[i].strip() if i is not None and i < len(row) else ""
+
+    def _record(self, row):
+        # Devuelve (registro, None), (None, error) o (None, None) si se saltea
+        raw_date, raw_amount = self._value(row, "date"), self._value(row, "amount")
+        if not raw_date and not raw_amount:
+            return None, None
+        ts = parse_ts(raw_date, self.profile.get("date_formats", []))
+        if ts is None:
+            return None, f"Fecha inválida: {raw_date!r}"
+        amount = parse_amount(raw_amount)
+        if amount is None:
+            return None, f"Monto inválido: {raw_amount!r}"
+        amount *= self.profile.get("sign", 1)
+        if amount <= 0:
+            return None, None
+        amount = Decimal(str(round(amount, 2)))
+        description = self._value(row, "description")
+        category = self._value(row, "category").lower() or self.default_category
+        method = (find_payment_method(self._value(row, "payment_method"))
+                  or find_payment_method(description) or self.profile.get("payment_method"))
+        installments = self._value(row, "installments") or None
+        # Dos filas idénticas en el mismo extracto (dos cafés el mismo día)
+        # son dos gastos: el número de aparición entra en el hash
+        occurrence = self._occurrence(ts.date(), (amount, _fold(description)))
+        raw = self.profile.get("delimiter", ",").join(row)[:500]
+        return (
+            self.user_id, ts, amount, "ARS", category, description or None, raw, method,
+            installments, content_hash(self.user_id, ts, amount, description, occurrence),
+        ), None
+
+    def _occurrence(self, day, key):
+        seen = self._seen.get(day)
+        if seen is None:
+            seen = self._seen[day] = {}
+            if len(self._seen) > SEEN_DAYS:
+                self._seen.popitem(last=False)
+        else:
+            self._seen.move_to_end(day)
+        seen[key] = seen.get(key, 0) + 1
+        return seen[key]
+
+    def next_chunk(self, size=CHUNK_SIZE):
+        # Hasta `size` filas leídas (válidas o no); self.done al llegar al final
+        records, errors, skipped = [], [], 0
+        while len(records) + len(errors) + skipped < size:
+            try:
+                row = next(self._reader)
+            except StopIteration:
+                self.done = True
+                break
+            except csv.Error as e:
+                # Fila que csv no puede leer (campo más largo que el límite,
+                # comillas sin cerrar...): el lector sigue con la próxima línea
+                errors.append((self.line, f"Fila ilegible: {e}"))
+                continue
+            record, error = self._record(row)
+            if error:
+                errors.append((self.line, error))
+            elif record is None:
+                skipped += 1
+            else:
+                records.append(record)
+        return records, errors, skipped
+
+    def progress(self, size):
+        # Fracción del archivo leída (aproximada: TextIOWrapper lee adelantado)
+        return round(min(self._raw.tell() / size, 1.0), 3) if size else 1.0
+
+
+async def spool_upload(chunks, max_bytes=MAX_BYTES):
+    # Vuelca el cuerpo (iterador asíncrono de bytes) a un BytesIO y, pasado
+    # SPOOL_BYTES, a un archivo temporal escrito fuera del event loop. Son
+    # objetos io completos: TextIOWrapper sobre SpooledTemporaryFile pide
+    # Python 3.11. Devuelve (archivo al inicio, tamaño).
+    file, size = io.BytesIO(), 0
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"El archivo supera el máximo de {max_bytes // (1024 * 1024)} MB")
+            if isinstance(file, io.BytesIO) and size > SPOOL_BYTES:
+                disk = await asyncio.to_thread(tempfile.TemporaryFile)
+                buffered, file = file, disk
+                await asyncio.to_thread(file.write, buffered.getvalue())
+            if isinstance(file, io.BytesIO):
+                file.write(chunk)
+            else:
+                await asyncio.to_thread(file.write, chunk)
+        await asyncio.to_thread(file.seek, 0)
+    except BaseException:
+        file.close()
+        raise
+    return file, size
+
+
+def _event(**fields):
+    return (json.dumps(fields, ensure_ascii=False) + "\n").encode()
+
+
+async def import_stream(user_id, fileobj, size, profile, default_category="otros", chunk_size=CHUNK_SIZE):
+    # Generador de eventos NDJSON para StreamingResponse. El archivo ya está
+    # completo en `fileobj` (volcado por el endpoint) y se cierra al terminar.
+    t0 = time.perf_counter()
+    totals = {"rows": 0, "inserted": 0, "duplicates": 0, "skipped": 0, "errors": 0}
+    alerts = []
+    try:
+        try:
+            reader = await asyncio.to_thread(StatementReader, fileobj, profile, user_id, default_category)
+        except StatementError as e:
+            yield _event(event="failed", error=str(e), **totals)
+            return
+        while not reader.done:
+            records, errors, skipped = await asyncio.to_thread(reader.next_chunk, chunk_size)
+            for line, error in errors:
+                if totals["errors"] < MAX_ERRORS:
+                    yield _event(event="error", line=line, error=error)
+                totals["errors"] += 1
+            totals["skipped"] += skipped
+            if records:
+                try:
+                    inserted, chunk_alerts = await db_async.import_expenses(records)
+                except Exception as e:
+                    yield _event(event="failed", line=reader.line, error=f"No se pudo guardar el bloque: {e}", **totals)
+                    return
+                if inserted:
+                    await get_read_cache().bump(user_id)
+                alerts.extend(chunk_alerts)
+                totals["rows"] += len(records)
+                totals["inserted"] += inserted
+                totals["duplicates"] += len(records) - inserted
+            yield _event(event="progress", line=reader.line, progress=reader.progress(size), **totals)
+        yield _event(event="done", elapsed_s=round(time.perf_counter() - t0, 2), alerts=alerts, **totals)
+    finally:
+        fileobj.close()
+
@@ -0,0 +1,60 @@
+# Planes de cuotas (tabla installment_plans, migración 0007).
+#
+# Cada cuota sigue siendo una fila de expenses con installment_plan_id, ahora
+# con FK al plan (ON DELETE CASCADE): borrar el plan borra sus cuotas en una
+# sola sentencia. Quien inserta cuotas sin crear el plan antes (el bot manda
+# solo las filas "i/N") lo deriva de ellas con plans_from_expenses y lo
+# inserta en la misma transacción, con ON CONFLICT DO NOTHING.
+import re
+from datetime import datetime
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+
+PLAN_COLUMNS = (
+    ("id", "text"), ("user_id", "text"), ("description", "text"), ("category", "text"),
+    ("payment_method", "text"), ("total", "numeric"), ("installments", "integer"),
+    ("start_ts", "timestamptz"),
+)
+
+_DETAILS_RE = re.compile(r"^\s*(\d+)\s*/\s*(\d+)\s*$")
+
+
+def parse_details(details):
+    # "3/12" -> (3, 12); cualquier otra cosa -> (None, None)
+    m = _DETAILS_RE.match(details or "")
+    if not m:
+        return None, None
+    return int(m.group(1)), int(m.group(2))
+
+
+def plans_from_expenses(expenses):
+    # expenses: dicts con las columnas de expenses, ts como datetime. Devuelve
+    # un dict por plan con las claves de PLAN_COLUMNS.
+    groups = {}
+    for e in expenses:
+        if e.get("installment_plan_id"):
+            groups.setdefault(e["installment_plan_id"], []).append(e)
+    plans = []
+    for plan_id, rows in groups.items():
+        numbered = [(parse_details(r.get("installment_details")), r) for r in rows]
+        count = max((n for (_, n), _ in numbered if n), default=len(rows))
+        # El inicio es la fecha de la cuota 1; si el lote no la trae se
+        # calcula hacia atrás desde la cuota más baja que venga
+        number, first = min(((i or 1, r) for (i, _), r in numbered), key=lambda x: (x[0], x[1]["ts"]))
+        start = first["ts"]
+        if isinstance(start, datetime) and number > 1:
+            start = start - relativedelta(months=number - 1)
+        amounts = [Decimal(str(r["amount"])) for r in rows]
+        total = sum(amounts) if len(rows) >= count else amounts[0] * count
+        plans.append({
+            "id": plan_id,
+            "user_id": first["user_id"],
+            "description": first.get("note") or None,
+            "category": first["category"],
+            "payment_method": first.get("payment_method"),
+            "total": round(total, 2),
+            "installments": count,
+            "start_ts": start,
+        })
+    return plans
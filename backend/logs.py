@@ -0,0 +1,65 @@
+# Logging estructurado con la librería estándar.
+#
+#   LOG_LEVEL=DEBUG|INFO|WARNING|ERROR|OFF   (default INFO; OFF no loguea nada)
+#   LOG_FORMAT=json|text                     (default json, una línea por evento)
+#
+# Los campos se pasan con extra: log.info("gasto guardado", extra={"user_id": u}).
+# En json van como claves del objeto; en text se agregan como clave=valor.
+import json
+import logging
+import os
+import sys
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+# Atributos propios de LogRecord: todo lo demás vino por extra
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+def _fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _RESERVED}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **_fields(record),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    # Idempotente: webapp y main.py la llaman al arrancar
+    root = logging.getLogger()
+    if level == "OFF":
+        logging.disable(logging.CRITICAL)
+        return
+    logging.disable(logging.NOTSET)
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    for old in [h for h in root.handlers if getattr(h, "_gastos", False)]:
+        root.removeHandler(old)
+    handler._gastos = True
+    root.addHandler(handler)
+    root.setLevel(getattr(logging, level, logging.INFO))
+    # httpx loguea cada pedido en INFO (incluye el token del bot en la URL)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
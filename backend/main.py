@@ -1,11 +1,9 @@
-import nest_asyncio
-nest_asyncio.apply() # <-- ESTE ES EL ARREGLO PRINCIPAL
-
-import requests
 import os
 from dotenv import load_dotenv
 load_dotenv()
+import logging
 import re
+import tempfile
 import uuid
 from datetime import datetime, timedelta
 import pytz
@@ -13,6 +11,7 @@ import asyncio
 
 from telegram.ext import (
     Application,
+    BaseUpdateProcessor,
     CommandHandler,
     ContextTypes,
     MessageHandler,
@@ -21,25 +20,42 @@ from telegram.ext import (
 from dateutil.relativedelta import relativedelta
 
 # El bot ya no necesita llamar a init_db() directamente.
-# El servidor web (webapp.py) se encarga de esto al arrancar.
-from parser import parse_gasto_args
+# El esquema se maneja con las migraciones (migrate.py) en cada deploy.
+from pipeline import get_pipeline
+from parser import parse_budget_args, parse_range
+from api_client import ApiClient, ApiError
+from outbox import MAX_BATCH, Outbox, OutboxFlusher
+from logs import setup_logging
+
+log = logging.getLogger("gastos.bot")
 
 # -------------------------------------------------
 # Configuración
 # -------------------------------------------------
 TOKEN = os.getenv("TELEGRAM_TOKEN")
-# La URL de tu API en Render es la única fuente de verdad
-API_URL = "https://entrega-topicos-backend.onrender.com"
-print("TOKEN:", TOKEN)
+# La URL de la API en Render (la única fuente de verdad) se configura en
+# api_client.py; se puede cambiar con la variable de entorno API_URL.
+# Cuántas actualizaciones se procesan a la vez (entre todos los usuarios)
+MAX_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "32"))
 BA_TZ = pytz.timezone("America/Argentina/Buenos_Aires")
+# /resumen responde dentro de este tiempo aunque la API esté despertando
+RESUMEN_BUDGET = float(os.getenv("BOT_RESUMEN_BUDGET", "8"))
+RESUMEN_TOP = 5
+# Telegram no acepta documentos de más de 50 MB enviados por bots
+EXPORT_MAX_BYTES = 50 * 1024 * 1024
+# La exportación se arma en memoria hasta este tamaño y después en disco
+EXPORT_SPOOL_BYTES = 1024 * 1024
 
 HELP_TEXT = ("📒 *Gastos Bot*\n\n"
              "Comandos:\n"
              "• /gasto <monto> <cat> \"nota\" [fecha] [medio_pago]\n"
+             "  Ej: /gasto 1.500 super ayer débito (una línea por gasto para cargar varios)\n"
              "• /cuotas <total> <N> <cat> \"descripción\"\n"
              "  Ej: /cuotas 120000 12 hogar \"tele nueva\"\n"
-             "• /resumen semana | mes\n"
-             "• /exportar\n"
+             "• /resumen semana | mes | 2024-05 | 1/5 15/5\n"
+             "• /exportar [csv|jsonl] [semana | mes | rango]\n"
+             "• /presupuesto [<cat> <monto> | <cat> borrar]\n"
+             "  Ej: /presupuesto comida 150000 (te aviso al 80% y al 100%)\n"
              "• /help\n")
 
 # ... (Las funciones de period_week y period_month no necesitan cambios) ...
@@ -56,9 +72,35 @@ def period_month():
     end = today + timedelta(days=1)
     return start.isoformat(), end.isoformat()
 
+
+PERIODS = {"semana": ("de la semana", period_week), "mes": ("del mes", period_month)}
+
+
+def command_period(args):
+    # semana | mes | <AAAA-MM> | <fecha> [<fecha>] -> ((título, inicio, fin exclusivo), None) o (None, error)
+    if len(args) == 1 and args[0].lower() in PERIODS:
+        label, period = PERIODS[args[0].lower()]
+        return (label, *period()), None
+    today_iso = datetime.now(BA_TZ).date().isoformat()
+    rng, err = parse_range(args, today_iso)
+    if err:
+        return None, err
+    start, end = rng
+    return (f"del {format_day(start)} al {format_day(end, exclusive=True)}", start, end), None
+
+
+def format_day(iso, exclusive=False):
+    day = datetime.fromisoformat(iso).date() - timedelta(days=1 if exclusive else 0)
+    return day.strftime("%d/%m/%Y")
+
 # -------------------------------------------------
 # Handlers (Comandos del Bot)
 # -------------------------------------------------
+async def enqueue(context, expenses, chat_id):
+    await context.application.bot_data["outbox"].add(expenses, chat_id)
+    context.application.bot_data["flusher"].wake()
+
+
 async def start_cmd(update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("¡Hola! 👋\n" + HELP_TEXT,
                                       parse_mode="Markdown")
@@ -68,20 +110,17 @@ async def help_cmd(update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(HELP_TEXT, parse_mode="Markdown")
 
 
-async def gasto_cmd(update, context: ContextTypes.DEFAULT_TYPE):
-    text = " ".join(context.args) if context.args else (update.message.text or "")
-    today_iso_date = datetime.now(BA_TZ).date().isoformat()
-    parsed, err = parse_gasto_args(text, today_iso_date)
+def message_text(update, context):
+    # Con /gasto, context.args pierde los saltos de línea: se usa el texto
+    # crudo del mensaje sin el comando para poder cargar varios gastos juntos.
+    text = update.message.text or ""
+    if context.args is not None and text.startswith("/"):
+        parts = text.split(maxsplit=1)
+        text = parts[1] if len(parts) > 1 else ""
+    return text
 
-    if not parsed:
-        await update.message.reply_text(f"❌ {err}")
-        return
-
-    amount, category = parsed["amount"], parsed["category"]
-    ts_from_parser = parsed.get("date", today_iso_date)
-    note = parsed.get("note") or ""
-    payment_method = parsed.get("payment_method")
 
+def to_timestamp(ts_from_parser):
     # Siempre usar la zona horaria de Buenos Aires
     try:
         if 'T' not in ts_from_parser:
@@ -91,53 +130,80 @@ async def gasto_cmd(update, context: ContextTypes.DEFAULT_TYPE):
             dt_ba = BA_TZ.localize(dt)
             # Si accidentalmente dt ya tiene tzinfo, usar astimezone
             if dt_ba.tzinfo is None:
-                full_timestamp = BA_TZ.localize(dt_ba).isoformat()
-            else:
-                full_timestamp = dt_ba.astimezone(BA_TZ).isoformat()
-        else:
-            # Si ya hay fecha y hora, asegurar que esté en BA_TZ
-            dt = datetime.fromisoformat(ts_from_parser)
-            if dt.tzinfo is None:
-                # Si no tiene zona horaria, asumir BA_TZ
-                full_timestamp = BA_TZ.localize(dt).isoformat()
-            else:
-                full_timestamp = dt.astimezone(BA_TZ).isoformat()
+                return BA_TZ.localize(dt_ba).isoformat()
+            return dt_ba.astimezone(BA_TZ).isoformat()
+        # Si ya hay fecha y hora, asegurar que esté en BA_TZ
+        dt = datetime.fromisoformat(ts_from_parser)
+        if dt.tzinfo is None:
+            # Si no tiene zona horaria, asumir BA_TZ
+            return BA_TZ.localize(dt).isoformat()
+        return dt.astimezone(BA_TZ).isoformat()
     except Exception:
         # Fallback: usar la hora actual en BA_TZ
-        full_timestamp = datetime.now(BA_TZ).isoformat()
+        return datetime.now(BA_TZ).isoformat()
 
-    expense_data = {
-        "user_id": str(update.effective_user.id),
-        "ts": full_timestamp,
-        "amount": amount,
+
+def expense_payload(parsed, user_id, raw_msg, today_iso_date):
+    return {
+        "user_id": user_id,
+        "ts": to_timestamp(parsed.get("date", today_iso_date)),
+        "amount": parsed["amount"],
         "currency": "ARS",
-        "category": category,
-        "note": note,
-        "raw_msg": text,
-        "payment_method": payment_method
+        "category": parsed["category"],
+        "note": parsed.get("note") or "",
+        "raw_msg": raw_msg,
+        "payment_method": parsed.get("payment_method")
     }
-    
-    # El bot envía el gasto a la API de Render
-    response = requests.post(f"{API_URL}/api/expenses", json=expense_data)
 
-    if response.status_code != 200:
-        # Mostrar el error exacto que devuelve la API (si es JSON, mostrar el detalle)
-        try:
-            error_detail = response.json().get("detail", response.text)
-        except Exception:
-            error_detail = response.text
-        await update.message.reply_text(f"❌ Error al registrar el gasto en la API: {error_detail}")
+
+async def gasto_cmd(update, context: ContextTypes.DEFAULT_TYPE):
+    text = message_text(update, context)
+    today_iso_date = datetime.now(BA_TZ).date().isoformat()
+    user_id = str(update.effective_user.id)
+
+    if "\n" in text.strip():
+        await gasto_many(update, context, text, user_id, today_iso_date)
+        return
+
+    # Parser local primero; el LLM solo si el mensaje no tiene el formato esperado
+    parsed, err = await get_pipeline().parse(text, today_iso_date)
+
+    if not parsed:
+        await update.message.reply_text(f"❌ {err}")
         return
 
+    expense_data = expense_payload(parsed, user_id, text, today_iso_date)
+
+    # El gasto queda guardado en el outbox local y se confirma enseguida; el
+    # flusher lo manda a la API (aunque esté fría o caída, reintenta después)
+    await enqueue(context, [expense_data], update.effective_chat.id)
+
     # Mostrar siempre la hora en Buenos Aires
-    dt = datetime.fromisoformat(full_timestamp)
+    dt = datetime.fromisoformat(expense_data["ts"])
     dt_ba = dt.astimezone(BA_TZ)
     formatted_date = dt_ba.strftime("%d/%m/%Y %H:%M")
 
-    msg = f"✅ Registrado: ${amount:.2f} en *{category}* ({formatted_date})."
+    msg = f"✅ Registrado: ${parsed['amount']:.2f} en *{parsed['category']}* ({formatted_date})."
     await update.message.reply_text(msg, parse_mode="Markdown")
 
 
+async def gasto_many(update, context, text, user_id, today_iso_date):
+    # Un gasto por línea. Las líneas válidas viajan juntas en un solo lote; las
+    # que no se entienden se informan para que el usuario las corrija.
+    # Cada gasto guarda como raw_msg solo su línea (la búsqueda indexa raw_msg)
+    parsed_list, errors = await get_pipeline().parse_many(text, today_iso_date)
+    lines = []
+    if parsed_list:
+        expenses = [expense_payload(p, user_id, line, today_iso_date) for _, line, p in parsed_list]
+        await enqueue(context, expenses, update.effective_chat.id)
+        total = sum(p["amount"] for _, _, p in parsed_list)
+        lines.append(f"✅ Registrados {len(parsed_list)} gastos por ${total:.2f}:")
+        lines += [f"• ${p['amount']:.2f} en {p['category']}" for _, _, p in parsed_list]
+    for number, line, err in errors:
+        lines.append(f"❌ Línea {number} ({line}): {err}")
+    await update.message.reply_text("\n".join(lines))
+
+
 async def cuotas_cmd(update, context: ContextTypes.DEFAULT_TYPE):
     try:
         args = context.args
@@ -146,17 +212,25 @@ async def cuotas_cmd(update, context: ContextTypes.DEFAULT_TYPE):
         categoria = args[2]
         descripcion_match = re.search(r'["“](.*?)["”]', " ".join(args))
         descripcion = descripcion_match.group(1) if descripcion_match else categoria
+        # Todas las cuotas van en un solo lote de la API (como mucho MAX_BATCH
+        # gastos): un plan que la API rechace se perdería después de confirmarlo
+        if not 0 < monto_total < float("inf") or not 1 <= cantidad_cuotas <= MAX_BATCH:
+            raise ValueError
     except (IndexError, ValueError):
-        await update.message.reply_text("Formato incorrecto. Usá: /cuotas <total> <N> <cat> \"descripción\"")
+        await update.message.reply_text(
+            f"Formato incorrecto. Usá: /cuotas <total> <N> <cat> \"descripción\" "
+            f"(total mayor a cero, N entre 1 y {MAX_BATCH})"
+        )
         return
 
     monto_por_cuota = monto_total / cantidad_cuotas
     plan_id = str(uuid.uuid4())
     fecha_inicio = datetime.now(BA_TZ)
 
+    cuotas = []
     for i in range(cantidad_cuotas):
         fecha_cuota = fecha_inicio + relativedelta(months=i)
-        expense_data = {
+        cuotas.append({
             "user_id": str(update.effective_user.id),
             "ts": fecha_cuota.isoformat(),
             "amount": monto_por_cuota,
@@ -167,18 +241,138 @@ async def cuotas_cmd(update, context: ContextTypes.DEFAULT_TYPE):
             "payment_method": "crédito",
             "installment_plan_id": plan_id,
             "installment_details": f"{i+1}/{cantidad_cuotas}"
-        }
-        requests.post(f"{API_URL}/api/expenses", json=expense_data)
+        })
+
+    # Todas las cuotas son una sola entrada del outbox y viajan en el mismo
+    # lote (una transacción): o se registra el plan completo o nada
+    await enqueue(context, cuotas, update.effective_chat.id)
 
     await update.message.reply_text(f"✅ ¡Plan de {cantidad_cuotas} cuotas registrado!")
 
 
 async def resumen_cmd(update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("Función de resumen en desarrollo para la versión API.")
+    # Una sola consulta agregada en la API (rollup mensual + bordes), así que
+    # el costo no crece con los años de historial
+    period, err = command_period(context.args or ["mes"])
+    if err:
+        await update.message.reply_text(f"❌ {err}")
+        return
+    label, start, end = period
+    user_id = str(update.effective_user.id)
+    api = context.application.bot_data["api"]
+    try:
+        data = await asyncio.wait_for(
+            api.digest(user_id, start, end, top=RESUMEN_TOP, timeout=RESUMEN_BUDGET), RESUMEN_BUDGET,
+        )
+    except asyncio.TimeoutError:
+        await update.message.reply_text("⏳ El resumen está tardando más de lo normal. Probá de nuevo en un momento.")
+        return
+    except ApiError as e:
+        await update.message.reply_text(f"❌ No se pudo obtener el resumen: {e.detail}")
+        return
+
+    if not data["count"]:
+        await update.message.reply_text(f"📊 No hay gastos registrados {label}.")
+        return
+    total = data["total"]
+    lines = [f"📊 Resumen {label}", f"Total: ${total:.2f} en {data['count']} gastos", "", "Categorías:"]
+    for group in data["categories"]:
+        share = group["total"] / total * 100 if total else 0
+        lines.append(f"• {group['key']}: ${group['total']:.2f} ({share:.0f}%)")
+    if data["other_categories"]:
+        lines.append(f"• … y {data['other_categories']} categorías más")
+    lines += ["", "Medios de pago:"]
+    for group in data["payment_methods"]:
+        lines.append(f"• {group['key'] or 'sin especificar'}: ${group['total']:.2f} ({group['count']})")
+    await update.message.reply_text("\n".join(lines))
+
+
+def budget_line(status):
+    if status["budget"] is None:
+        return f"• {status['category']}: ${status['spent']:.2f} (sin presupuesto)"
+    icon = {"ok": "🟢", "warning": "🟡", "exceeded": "🔴"}[status["status"]]
+    return (f"{icon} {status['category']}: ${status['spent']:.2f} de ${status['budget']:.2f} "
+            f"({status['percentage']:.0f}%)")
+
+
+def budget_alert_text(alert):
+    if alert["threshold"] >= 100:
+        return (f"🚨 Superaste el presupuesto de {alert['category']} del mes: "
+                f"${alert['spent']:.2f} de ${alert['budget']:.2f} ({alert['percentage']:.0f}%).")
+    return (f"⚠️ Ya usaste el {alert['percentage']:.0f}% del presupuesto de {alert['category']} del mes: "
+            f"${alert['spent']:.2f} de ${alert['budget']:.2f}.")
+
+
+async def presupuesto_cmd(update, context: ContextTypes.DEFAULT_TYPE):
+    # /presupuesto                      estado del mes de cada presupuesto
+    # /presupuesto <cat> <monto>        presupuesto mensual de la categoría
+    # /presupuesto <cat> borrar         lo elimina
+    user_id = str(update.effective_user.id)
+    api = context.application.bot_data["api"]
+    args = list(context.args or [])
+    try:
+        if not args:
+            data = await api.budgets(user_id)
+            budgeted = [c for c in data["categories"] if c["budget"] is not None]
+            if not budgeted:
+                await update.message.reply_text(
+                    "💰 No tenés presupuestos. Usá /presupuesto <categoría> <monto> para crear uno.")
+                return
+            lines = [f"💰 Presupuestos del mes ({data['month']})"] + [budget_line(c) for c in budgeted]
+            lines += ["", f"Total: ${data['spent']:.2f} de ${data['budget']:.2f}"]
+            await update.message.reply_text("\n".join(lines))
+            return
+        parsed, err = parse_budget_args(args)
+        if err:
+            await update.message.reply_text(f"❌ {err}")
+            return
+        category, amount = parsed
+        if amount is None:
+            await api.delete_budget(user_id, category)
+            await update.message.reply_text(f"🗑️ Presupuesto de {category} eliminado.")
+            return
+        status = await api.set_budget(user_id, category, amount)
+    except ApiError as e:
+        await update.message.reply_text(f"❌ No se pudo actualizar el presupuesto: {e.detail}")
+        return
+    await update.message.reply_text(f"✅ Presupuesto de {category}: ${amount:.2f} por mes.\n{budget_line(status)}")
 
 
 async def exportar_cmd(update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("Función de exportar en desarrollo para la versión API.")
+    # La API exporta con un cursor del lado del servidor y el bot baja la
+    # respuesta en streaming (gzip) a un archivo temporal. Al subirlo a
+    # Telegram sí se lee entero: el bot llega a tener en memoria el archivo
+    # comprimido, como mucho EXPORT_MAX_BYTES.
+    args = list(context.args or [])
+    fmt = "csv"
+    if args and args[0].lower() in ("csv", "jsonl"):
+        fmt = args.pop(0).lower()
+    label, start, end = "del historial completo", None, None
+    if args:
+        period, err = command_period(args)
+        if err:
+            await update.message.reply_text(f"❌ {err}")
+            return
+        label, start, end = period
+
+    user_id = str(update.effective_user.id)
+    api = context.application.bot_data["api"]
+    await update.message.chat.send_action("upload_document")
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as file:
+        try:
+            size, filename = await api.export(user_id, file, fmt, start, end, max_bytes=EXPORT_MAX_BYTES)
+        except ApiError as e:
+            await update.message.reply_text(f"❌ No se pudo exportar: {e.detail}")
+            return
+        file.seek(0)
+        # InputFile de PTB lee el archivo entero aunque reciba un handle o una
+        # ruta, así que pasar los bytes no cambia el pico de memoria (y
+        # SpooledTemporaryFile en memoria no tiene name, que InputFile pide)
+        await update.message.reply_document(
+            document=file.read(),
+            filename=filename or f"gastos.{fmt}.gz",
+            caption=f"📁 Exportación {label} ({size / 1024:.0f} KB comprimido)",
+        )
 
 
 async def free_text_handler(update, context: ContextTypes.DEFAULT_TYPE):
@@ -189,25 +383,115 @@ async def free_text_handler(update, context: ContextTypes.DEFAULT_TYPE):
 # Arranque del Bot
 # -------------------------------------------------
 
-async def main():
-    if not TOKEN:
-        print("⚠️ No se encontró la variable de entorno TELEGRAM_TOKEN.")
-        return
-
-    app = Application.builder().token(TOKEN).build()
-    
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    # Procesa en paralelo los mensajes de distintos usuarios pero en orden los
+    # de un mismo usuario (así dos gastos seguidos no se registran al revés).
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._locks = {}  # user_id -> [lock, updates pendientes]
+
+    async def do_process_update(self, update, coroutine):
+        user = getattr(update, "effective_user", None)
+        if user is None:
+            await coroutine
+            return
+        entry = self._locks.setdefault(user.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[user.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        self._locks.clear()
+
+
+async def start_services(app, api):
+    # `api` es ApiClient (HTTP contra la API, modo polling) o webhook.LocalApi
+    # (capa de datos en proceso, modo webhook)
+    app.bot_data["api"] = api
+    app.bot_data["outbox"] = Outbox()
+
+    async def on_rejected(entry, detail):
+        if entry["chat_id"] is not None:
+            await app.bot.send_message(entry["chat_id"], f"❌ La API rechazó un gasto guardado: {detail}")
+
+    async def on_alerts(entries, alerts):
+        # Los gastos de un lote pueden ser de varios usuarios: cada aviso va
+        # al chat desde el que se cargó el gasto
+        chats = {e["user_id"]: entry["chat_id"] for entry in entries for e in entry["expenses"]}
+        for alert in alerts:
+            chat_id = chats.get(alert["user_id"])
+            if chat_id is not None:
+                await app.bot.send_message(chat_id, budget_alert_text(alert))
+
+    flusher = OutboxFlusher(app.bot_data["outbox"], app.bot_data["api"], on_rejected, on_alerts)
+    app.bot_data["flusher"] = flusher
+    flusher.start()
+
+
+async def post_init(app):
+    # Un solo cliente HTTP (pool keep-alive) compartido por todos los handlers
+    await start_services(app, ApiClient())
+
+
+async def post_shutdown(app):
+    flusher = app.bot_data.pop("flusher", None)
+    if flusher is not None:
+        await flusher.stop()
+        # Último intento antes de salir; lo que no salga queda en el outbox
+        try:
+            await flusher.flush()
+        except Exception as e:
+            log.warning("no se pudo vaciar el outbox al apagar", extra={"error": str(e)})
+    api = app.bot_data.pop("api", None)
+    if api is not None:
+        await api.close()
+    outbox = app.bot_data.pop("outbox", None)
+    if outbox is not None:
+        outbox.close()
+
+
+def add_handlers(app):
     app.add_handler(CommandHandler("start", start_cmd))
     app.add_handler(CommandHandler("help", help_cmd))
     app.add_handler(CommandHandler("gasto", gasto_cmd))
     app.add_handler(CommandHandler("cuotas", cuotas_cmd))
     app.add_handler(CommandHandler("resumen", resumen_cmd))
     app.add_handler(CommandHandler("exportar", exportar_cmd))
+    app.add_handler(CommandHandler("presupuesto", presupuesto_cmd))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, free_text_handler))
 
-    print("🤖 Bot de gastos iniciando...")
-    await app.run_polling(drop_pending_updates=True)
 
+def main():
+    # Modo polling. En modo webhook (BOT_MODE=webhook, ver webhook.py) el bot
+    # corre dentro de la app FastAPI y este proceso no hace falta; correrlo
+    # igual sirve de respaldo: run_polling borra el webhook al arrancar.
+    setup_logging()
+    if not TOKEN:
+        log.error("no se encontró la variable de entorno TELEGRAM_TOKEN")
+        return
 
-if __name__ == "__main__":
-    asyncio.run(main())
+    app = (
+        Application.builder()
+        .token(TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    add_handlers(app)
 
+    log.info("bot de gastos iniciando")
+    # run_polling maneja su propio event loop; ya no hace falta nest_asyncio
+    app.run_polling(drop_pending_updates=True)
+
+
+if __name__ == "__main__":
+    main()
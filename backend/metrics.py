@@ -0,0 +1,346 @@
+# Métricas en formato de texto de Prometheus (GET /metrics), sin dependencias.
+#
+#   http_requests_total{method,route,status}          pedidos respondidos
+#   http_request_duration_seconds{method,route}       latencia (histograma)
+#   http_requests_in_flight{method}                   pedidos en curso
+#   db_query_duration_seconds{driver,label}           duración de cada consulta
+#   db_query_rows_total{driver,label}                 filas devueltas/afectadas
+#   db_slow_queries_total{driver,label}               consultas sobre SLOW_QUERY_MS
+#
+# route es la plantilla de la ruta ("/api/users/{user_id}/expenses"), no el
+# path, para que la cantidad de series no dependa de los ids. label es el
+# nombre de la función de db.py / db_async.py que hizo la consulta (lo fija
+# el decorador query_label); las consultas sin etiqueta (migraciones, rollup)
+# se agrupan por verbo SQL.
+#
+# Los valores son por proceso: con varios workers de gunicorn cada uno expone
+# los suyos y el scrape suma lo que le toque. Una consulta lenta se cuenta
+# siempre; se loguea solo una fracción SLOW_QUERY_SAMPLE de ellas.
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+
+import asyncpg
+from psycopg2.extensions import cursor as pg_cursor
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "250"))
+SLOW_QUERY_SAMPLE = float(os.getenv("SLOW_QUERY_SAMPLE", "0.1"))
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+log = logging.getLogger("gastos.db")
+
+
+# --- TIPOS DE MÉTRICA ---
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # tupla de valores de labels -> valor
+
+    def _render_values(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._render_values())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=HTTP_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *labels, value):
+        # Por serie: [conteo por bucket (no acumulado) + +Inf, suma]
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def _render_values(self):
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                bucket = 'le="' + le + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, bucket)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        # fn() -> texto en formato Prometheus, calculado en cada scrape
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        parts = [m.render() for m in self._metrics]
+        parts.extend(fn() for fn in self._collectors)
+        return "\n".join(p for p in parts if p) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "Pedidos HTTP respondidos", ("method", "route", "status")))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Latencia de los pedidos HTTP", ("method", "route"), HTTP_BUCKETS))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "Pedidos HTTP en curso", ("method",)))
+DB_LATENCY = REGISTRY.register(Histogram(
+    "db_query_duration_seconds", "Duración de las consultas a Postgres", ("driver", "label"), DB_BUCKETS))
+DB_ROWS = REGISTRY.register(Counter(
+    "db_query_rows_total", "Filas devueltas o afectadas por las consultas", ("driver", "label")))
+DB_SLOW = REGISTRY.register(Counter(
+    "db_slow_queries_total", "Consultas que superaron SLOW_QUERY_MS", ("driver", "label")))
+
+
+# --- CONSULTAS ---
+_query_label = contextvars.ContextVar("query_label", default=None)
+
+
+def query_label(fn):
+    # Decorador para las funciones públicas de db.py / db_async.py: las
+    # consultas que se hagan dentro se etiquetan con el nombre de la función.
+    label = fn.__name__
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            token = _query_label.set(label)
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                _query_label.reset(token)
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            token = _query_label.set(label)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _query_label.reset(token)
+    return wrapper
+
+
+_VERB_RE = re.compile(r"\s*([A-Za-z]+)")
+
+
+def _current_label(sql):
+    label = _query_label.get()
+    if label is not None:
+        return label
+    verb = _VERB_RE.match(sql) if isinstance(sql, str) else None
+    return f"sql_{verb.group(1).lower()}" if verb else "sql"
+
+
+def record_query(driver, sql, elapsed, rows):
+    label = _current_label(sql)
+    DB_LATENCY.observe(driver, label, value=elapsed)
+    if rows is not None and rows >= 0:
+        DB_ROWS.inc(driver, label, amount=rows)
+    ms = elapsed * 1000
+    if ms >= SLOW_QUERY_MS:
+        DB_SLOW.inc(driver, label)
+        if random.random() < SLOW_QUERY_SAMPLE:
+            # Sin parámetros: pueden traer datos de los usuarios
+            log.warning("consulta lenta", extra={
+                "driver": driver, "label": label, "ms": round(ms, 1), "rows": rows,
+                "sql": " ".join(str(sql).split())[:300],
+            })
+
+
+class TimedCursor(pg_cursor):
+    # cursor_factory de psycopg2 (db.py): mide cada execute
+    def execute(self, query, vars=None):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query("psycopg2", query, time.perf_counter() - t0, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query("psycopg2", query, time.perf_counter() - t0, self.rowcount)
+
+
+def _status_rows(status):
+    # "INSERT 0 5" / "DELETE 3" / "UPDATE 1" -> cantidad de filas
+    last = status.rsplit(" ", 1)[-1] if status else ""
+    return int(last) if last.isdigit() else None
+
+
+class TimedConnection(asyncpg.Connection):
+    # connection_class del pool de asyncpg (db_async.py). Pool.fetch & cía.
+    # delegan en estos métodos, así que cubren también las consultas sin acquire.
+    _untimed = False
+
+    async def reset(self, *, timeout=None):
+        # El reset que hace el pool al devolver la conexión no es una consulta
+        # de la app (y correría con la etiqueta de quien la devolvió)
+        self._untimed = True
+        try:
+            await super().reset(timeout=timeout)
+        finally:
+            self._untimed = False
+
+    async def execute(self, query, *args, timeout=None):
+        if self._untimed:
+            return await super().execute(query, *args, timeout=timeout)
+        t0 = time.perf_counter()
+        status = None
+        try:
+            status = await super().execute(query, *args, timeout=timeout)
+            return status
+        finally:
+            record_query("asyncpg", query, time.perf_counter() - t0, _status_rows(status))
+
+    async def executemany(self, command, args, *, timeout=None):
+        t0 = time.perf_counter()
+        try:
+            return await super().executemany(command, args, timeout=timeout)
+        finally:
+            record_query("asyncpg", command, time.perf_counter() - t0, None)
+
+    async def fetch(self, query, *args, timeout=None, record_class=None):
+        t0 = time.perf_counter()
+        rows = None
+        try:
+            rows = await super().fetch(query, *args, timeout=timeout, record_class=record_class)
+            return rows
+        finally:
+            record_query("asyncpg", query, time.perf_counter() - t0, len(rows) if rows is not None else None)
+
+    async def fetchrow(self, query, *args, timeout=None, record_class=None):
+        t0 = time.perf_counter()
+        row = None
+        try:
+            row = await super().fetchrow(query, *args, timeout=timeout, record_class=record_class)
+            return row
+        finally:
+            record_query("asyncpg", query, time.perf_counter() - t0, 0 if row is None else 1)
+
+    async def fetchval(self, query, *args, column=0, timeout=None):
+        t0 = time.perf_counter()
+        try:
+            return await super().fetchval(query, *args, column=column, timeout=timeout)
+        finally:
+            record_query("asyncpg", query, time.perf_counter() - t0, None)
+
+
+# --- HTTP ---
+class MetricsMiddleware:
+    # Middleware ASGI puro (BaseHTTPMiddleware agrega una tarea por pedido y
+    # rompe el streaming de /export). La latencia se mide hasta que se manda
+    # el último byte del cuerpo.
+    def __init__(self, app):
+        self.app = app
+        self._templates = None  # endpoint -> plantilla de la ruta
+
+    def _route(self, scope):
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._templates is None:
+            self._templates = {
+                r.endpoint: r.path for r in scope["app"].routes if getattr(r, "endpoint", None) is not None
+            }
+        return self._templates.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(method)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - t0
+            HTTP_IN_FLIGHT.dec(method)
+            route = self._route(scope)
+            HTTP_REQUESTS.inc(method, route, str(status))
+            HTTP_LATENCY.observe(method, route, value=elapsed)
+
+
+def render():
+    return REGISTRY.render()
@@ -0,0 +1,201 @@
+# Runner de migraciones versionadas.
+#
+# Se corre una vez por deploy (en Render: "Pre-Deploy Command"), no al importar
+# la app:
+#   python migrate.py               aplica las migraciones pendientes
+#   python migrate.py status        lista aplicadas y pendientes
+#   python migrate.py check-plans   verifica que las consultas críticas usen índices
+#
+# Las migraciones viven en migrations/ como NNNN_nombre.sql o NNNN_nombre.py
+# (con una función upgrade(con)). Se aplican en orden y cada versión se registra
+# en schema_migrations en la misma transacción que termina la migración.
+import importlib.util
+import json
+import re
+import sys
+from pathlib import Path
+
+from db import get_con
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+# Lock de sesión para que dos deploys simultáneos no migren a la vez
+ADVISORY_LOCK_ID = 7240001
+
+# Consultas calientes y los índices que le sirven (alcanza con que use uno)
+HOT_QUERIES = [
+    (
+        "listado por usuario",
+        "SELECT id, ts FROM expenses WHERE user_id = %s ORDER BY ts DESC, id DESC LIMIT 50",
+        ("0",),
+        ("expenses_user_ts_idx",),
+    ),
+    (
+        "total por período",
+        "SELECT SUM(amount) FROM expenses WHERE user_id = %s AND ts >= %s AND ts < %s",
+        ("0", "2024-01-01", "2024-02-01"),
+        ("expenses_user_ts_idx", "expenses_user_category_ts_idx"),
+    ),
+    (
+        "dashboard por período",
+        "SELECT id, ts, amount FROM expenses WHERE ts >= %s AND ts < %s ORDER BY ts DESC",
+        ("2024-01-01", "2024-02-01"),
+        ("expenses_ts_idx",),
+    ),
+    (
+        "cuotas de un plan",
+        "SELECT id FROM expenses WHERE installment_plan_id = %s",
+        ("x",),
+        ("expenses_plan_idx",),
+    ),
+    (
+        "categoría por período",
+        "SELECT SUM(amount) FROM expenses WHERE user_id = %s AND category = %s AND ts >= %s AND ts < %s",
+        ("0", "comida", "2024-01-01", "2024-02-01"),
+        ("expenses_user_category_ts_idx",),
+    ),
+    (
+        "rollup mensual por usuario",
+        "SELECT category, total FROM expense_rollup_monthly WHERE user_id = %s AND month >= %s AND month < %s",
+        ("0", "2024-01-01", "2024-07-01"),
+        ("expense_rollup_monthly_pkey",),
+    ),
+    (
+        "próximas cuotas por usuario",
+        "SELECT id, ts FROM expenses WHERE user_id = %s AND installment_plan_id IS NOT NULL AND ts >= %s",
+        ("0", "2024-01-01"),
+        ("expenses_user_installment_ts_idx",),
+    ),
+    (
+        "búsqueda por texto",
+        # Sin filtro de usuario: con pocas filas por usuario el planificador
+        # prefiere el índice de user_id; con volumen combina los dos (BitmapAnd)
+        "SELECT id FROM expenses WHERE search_doc @@ to_tsquery('spanish', search_fold(%s))",
+        ("super:*",),
+        ("expenses_search_idx",),
+    ),
+]
+
+
+def discover():
+    migrations = []
+    for path in sorted(MIGRATIONS_DIR.iterdir()):
+        m = re.match(r"^(\d{4})_(\w+)\.(sql|py)$", path.name)
+        if m:
+            migrations.append((int(m.group(1)), m.group(2), path))
+    return migrations
+
+
+def _ensure_table(cur):
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        " version INTEGER PRIMARY KEY,"
+        " name TEXT NOT NULL,"
+        " applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+    )
+
+
+def _applied(cur):
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def _run(con, path):
+    if path.suffix == ".sql":
+        cur = con.cursor()
+        cur.execute(path.read_text(encoding="utf-8"))
+        cur.close()
+        return
+    spec = importlib.util.spec_from_file_location(f"migration_{path.stem}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.upgrade(con)
+
+
+def pending():
+    with get_con() as con:
+        cur = con.cursor()
+        _ensure_table(cur)
+        done = _applied(cur)
+        cur.close()
+    return [m for m in discover() if m[0] not in done]
+
+
+def migrate():
+    applied = []
+    with get_con() as con:
+        cur = con.cursor()
+        cur.execute("SELECT pg_advisory_lock(%s)", (ADVISORY_LOCK_ID,))
+        try:
+            _ensure_table(cur)
+            con.commit()
+            done = _applied(cur)
+            for version, name, path in discover():
+                if version in done:
+                    continue
+                print(f"[migrate] aplicando {version:04d}_{name}")
+                _run(con, path)
+                cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+                con.commit()
+                applied.append(version)
+        finally:
+            con.rollback()
+            cur.execute("SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_ID,))
+            cur.close()
+    return applied
+
+
+def _nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _nodes(child)
+
+
+def _index_names(plan):
+    return {node["Index Name"] for node in _nodes(plan) if "Index Name" in node}
+
+
+def _seq_scans(plan):
+    return {node["Relation Name"] for node in _nodes(plan) if node["Node Type"] == "Seq Scan"}
+
+
+def check_plans():
+    # Con tablas chicas el planificador prefiere seq scan, así que lo
+    # deshabilitamos: lo que interesa es que exista un índice utilizable. Si
+    # igual queda un seq scan es que no hay ninguno.
+    failures = []
+    with get_con() as con:
+        cur = con.cursor()
+        cur.execute("SET LOCAL enable_seqscan = off")
+        for label, sql, params, indexes in HOT_QUERIES:
+            cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cur.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            used = _index_names(plan[0]["Plan"])
+            scans = _seq_scans(plan[0]["Plan"])
+            ok = bool(used & set(indexes)) and not scans
+            detail = ", ".join(sorted(used)) or "sin índice"
+            if scans:
+                detail += f" (seq scan sobre {', '.join(sorted(scans))})"
+            print(f"[{'ok' if ok else 'FALLA'}] {label}: {detail}")
+            if not ok:
+                failures.append(label)
+        cur.close()
+        con.rollback()
+    return failures
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "up"
+    if command == "up":
+        applied = migrate()
+        print(f"[migrate] {len(applied)} migración(es) aplicada(s)")
+    elif command == "status":
+        todo = {m[0] for m in pending()}
+        for version, name, _ in discover():
+            print(f"{version:04d}_{name}: {'pendiente' if version in todo else 'aplicada'}")
+    elif command == "check-plans":
+        sys.exit(1 if check_plans() else 0)
+    else:
+        print(f"Comando desconocido: {command}")
+        sys.exit(2)
@@ -0,0 +1,14 @@
+-- Esquema original (antes vivía en db.init_db)
+CREATE TABLE IF NOT EXISTS expenses (
+    id SERIAL PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    amount REAL NOT NULL,
+    currency TEXT NOT NULL,
+    category TEXT NOT NULL,
+    note TEXT,
+    raw_msg TEXT,
+    payment_method TEXT,
+    installment_plan_id TEXT,
+    installment_details TEXT
+);
@@ -0,0 +1,39 @@
+# ts TEXT -> TIMESTAMPTZ y amount REAL -> NUMERIC(14,2), convirtiendo en lotes.
+#
+# Los lotes se commitean de a uno para no bloquear la tabla durante toda la
+# conversión; si se corta a mitad de camino, volver a correr la migración
+# continúa desde donde quedó (solo toca filas con ts_tz NULL). El reemplazo
+# final de columnas se hace con la tabla bloqueada, en la misma transacción que
+# registra la versión.
+BATCH_SIZE = 5000
+
+CONVERT_BATCH = (
+    "UPDATE expenses SET ts_tz = ts::timestamptz, amount_num = round(amount::numeric, 2) "
+    "WHERE id IN (SELECT id FROM expenses WHERE ts_tz IS NULL ORDER BY id LIMIT %s)"
+)
+
+
+def upgrade(con):
+    cur = con.cursor()
+    cur.execute(
+        "ALTER TABLE expenses "
+        "ADD COLUMN IF NOT EXISTS ts_tz TIMESTAMPTZ, "
+        "ADD COLUMN IF NOT EXISTS amount_num NUMERIC(14,2)"
+    )
+    con.commit()
+
+    while True:
+        cur.execute(CONVERT_BATCH, (BATCH_SIZE,))
+        converted = cur.rowcount
+        con.commit()
+        if converted < BATCH_SIZE:
+            break
+
+    # Filas que se hayan insertado mientras convertíamos
+    cur.execute("LOCK TABLE expenses IN ACCESS EXCLUSIVE MODE")
+    cur.execute("UPDATE expenses SET ts_tz = ts::timestamptz, amount_num = round(amount::numeric, 2) WHERE ts_tz IS NULL")
+    cur.execute("ALTER TABLE expenses DROP COLUMN ts, DROP COLUMN amount")
+    cur.execute("ALTER TABLE expenses RENAME COLUMN ts_tz TO ts")
+    cur.execute("ALTER TABLE expenses RENAME COLUMN amount_num TO amount")
+    cur.execute("ALTER TABLE expenses ALTER COLUMN ts SET NOT NULL, ALTER COLUMN amount SET NOT NULL")
+    cur.close()
@@ -0,0 +1,8 @@
+-- Listado y agregados por usuario/período (WHERE user_id = ... AND ts ..., ORDER BY ts DESC)
+CREATE INDEX IF NOT EXISTS expenses_user_ts_idx ON expenses (user_id, ts DESC, id DESC);
+-- Dashboard web (todas las cuentas, por período)
+CREATE INDEX IF NOT EXISTS expenses_ts_idx ON expenses (ts);
+-- Borrado de planes de cuotas
+CREATE INDEX IF NOT EXISTS expenses_plan_idx ON expenses (installment_plan_id) WHERE installment_plan_id IS NOT NULL;
+-- Filtros y totales por categoría
+CREATE INDEX IF NOT EXISTS expenses_user_category_ts_idx ON expenses (user_id, category, ts);
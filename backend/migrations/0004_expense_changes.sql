@@ -0,0 +1,58 @@
+-- Versión del ledger por usuario y registro de cambios para sincronización
+-- incremental (GET /api/users/{id}/changes?since=<versión>) y ETags.
+--
+-- El trigger incrementa ledger_versions.version dentro de la misma transacción
+-- que el INSERT/UPDATE/DELETE. El UPDATE de esa fila la bloquea hasta el
+-- commit, así que las versiones de un usuario quedan en orden de commit y un
+-- cliente que ya leyó la versión N nunca se pierde un cambio con versión <= N.
+CREATE TABLE IF NOT EXISTS ledger_versions (
+    user_id TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS expense_changes (
+    user_id TEXT NOT NULL,
+    version BIGINT NOT NULL,
+    expense_id INTEGER NOT NULL,
+    op CHAR(1) NOT NULL,  -- 'U' alta/modificación, 'D' baja
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, version)
+);
+
+-- Los gastos existentes entran como altas para que since=0 sea una sincronización completa
+INSERT INTO expense_changes (user_id, version, expense_id, op)
+SELECT user_id, row_number() OVER (PARTITION BY user_id ORDER BY id), id, 'U'
+FROM expenses;
+
+INSERT INTO ledger_versions (user_id, version)
+SELECT user_id, COUNT(*) FROM expenses GROUP BY user_id;
+
+CREATE OR REPLACE FUNCTION bump_ledger_version(p_user_id TEXT) RETURNS BIGINT AS $$
+    INSERT INTO ledger_versions (user_id, version) VALUES (p_user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = ledger_versions.version + 1
+    RETURNING version;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION log_expense_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO expense_changes (user_id, version, expense_id, op)
+        VALUES (OLD.user_id, bump_ledger_version(OLD.user_id), OLD.id, 'D');
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'UPDATE' THEN
+        IF OLD.user_id <> NEW.user_id THEN
+            INSERT INTO expense_changes (user_id, version, expense_id, op)
+            VALUES (OLD.user_id, bump_ledger_version(OLD.user_id), OLD.id, 'D');
+        END IF;
+    END IF;
+    INSERT INTO expense_changes (user_id, version, expense_id, op)
+    VALUES (NEW.user_id, bump_ledger_version(NEW.user_id), NEW.id, 'U');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS expenses_log_change ON expenses;
+CREATE TRIGGER expenses_log_change
+    AFTER INSERT OR UPDATE OR DELETE ON expenses
+    FOR EACH ROW EXECUTE FUNCTION log_expense_change();
@@ -0,0 +1,8 @@
+-- Clave de idempotencia para las altas: el bot genera una por gasto y la
+-- reenvía en cada reintento, así que un POST repetido (timeout, outbox que se
+-- vacía dos veces) no duplica la fila. El índice es parcial: los gastos
+-- cargados sin clave (web, API vieja) no ocupan lugar ni chocan entre sí.
+ALTER TABLE expenses ADD COLUMN IF NOT EXISTS idempotency_key TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS expenses_user_idempotency_key_idx
+    ON expenses (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL;
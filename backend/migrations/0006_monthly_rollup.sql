@@ -0,0 +1,75 @@
+-- Totales mensuales por (usuario, mes, categoría, medio de pago) mantenidos
+-- por triggers en la misma transacción que el INSERT/UPDATE/DELETE, así los
+-- agregados de meses completos se leen en O(categorías) en vez de O(gastos).
+--
+-- Los triggers son por sentencia con tablas de transición: un lote de N
+-- cuotas o el borrado de un plan entero hacen un solo upsert agrupado.
+-- El mes se calcula en hora de Buenos Aires (igual que los buckets de la API)
+-- y payment_method NULL se guarda como '' porque forma parte de la clave.
+-- Para reconstruir o verificar: python rollup.py rebuild | verify
+LOCK TABLE expenses IN SHARE ROW EXCLUSIVE MODE;
+
+CREATE TABLE IF NOT EXISTS expense_rollup_monthly (
+    user_id TEXT NOT NULL,
+    month DATE NOT NULL,
+    category TEXT NOT NULL,
+    payment_method TEXT NOT NULL DEFAULT '',
+    total NUMERIC(14,2) NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, month, category, payment_method)
+);
+
+INSERT INTO expense_rollup_monthly (user_id, month, category, payment_method, total, count)
+SELECT user_id, date_trunc('month', ts AT TIME ZONE 'America/Argentina/Buenos_Aires')::date,
+       category, COALESCE(payment_method, ''), SUM(amount), COUNT(*)
+FROM expenses
+GROUP BY 1, 2, 3, 4;
+
+CREATE OR REPLACE FUNCTION rollup_apply_expenses() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        WITH d AS (
+            SELECT user_id, date_trunc('month', ts AT TIME ZONE 'America/Argentina/Buenos_Aires')::date AS month,
+                   category, COALESCE(payment_method, '') AS payment_method, SUM(amount) AS total, COUNT(*) AS count
+            FROM old_rows GROUP BY 1, 2, 3, 4
+        )
+        UPDATE expense_rollup_monthly r
+        SET total = r.total - d.total, count = r.count - d.count
+        FROM d
+        WHERE r.user_id = d.user_id AND r.month = d.month
+          AND r.category = d.category AND r.payment_method = d.payment_method;
+
+        DELETE FROM expense_rollup_monthly
+        WHERE count <= 0 AND user_id IN (SELECT DISTINCT user_id FROM old_rows);
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO expense_rollup_monthly (user_id, month, category, payment_method, total, count)
+        SELECT user_id, date_trunc('month', ts AT TIME ZONE 'America/Argentina/Buenos_Aires')::date,
+               category, COALESCE(payment_method, ''), SUM(amount), COUNT(*)
+        FROM new_rows
+        GROUP BY 1, 2, 3, 4
+        ORDER BY 1, 2, 3, 4
+        ON CONFLICT (user_id, month, category, payment_method) DO UPDATE
+        SET total = expense_rollup_monthly.total + EXCLUDED.total,
+            count = expense_rollup_monthly.count + EXCLUDED.count;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS expenses_rollup_insert ON expenses;
+CREATE TRIGGER expenses_rollup_insert
+    AFTER INSERT ON expenses REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_apply_expenses();
+
+DROP TRIGGER IF EXISTS expenses_rollup_update ON expenses;
+CREATE TRIGGER expenses_rollup_update
+    AFTER UPDATE ON expenses REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_apply_expenses();
+
+DROP TRIGGER IF EXISTS expenses_rollup_delete ON expenses;
+CREATE TRIGGER expenses_rollup_delete
+    AFTER DELETE ON expenses REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_apply_expenses();
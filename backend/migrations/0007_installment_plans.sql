@@ -0,0 +1,52 @@
+-- Planes de cuotas como entidad propia. Hasta ahora un plan era solo un
+-- installment_plan_id repetido en N gastos; ahora tiene total, cantidad de
+-- cuotas, fecha de inicio y tarjeta, y las cuotas lo referencian con FK
+-- ON DELETE CASCADE: borrar un plan es un DELETE sobre installment_plans que
+-- baja sus cuotas por expenses_plan_idx (los triggers del rollup y del
+-- registro de cambios corren igual que con un DELETE directo).
+LOCK TABLE expenses IN SHARE ROW EXCLUSIVE MODE;
+
+CREATE TABLE IF NOT EXISTS installment_plans (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    description TEXT,
+    category TEXT NOT NULL,
+    payment_method TEXT,
+    total NUMERIC(14,2) NOT NULL,
+    installments INTEGER NOT NULL CHECK (installments > 0),
+    start_ts TIMESTAMPTZ NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS installment_plans_user_idx ON installment_plans (user_id, start_ts);
+
+-- Planes existentes: la cantidad sale de installment_details ("i/N"); si
+-- faltan cuotas (borradas a mano) el total se estima con el promedio.
+INSERT INTO installment_plans (id, user_id, description, category, payment_method, total, installments, start_ts)
+SELECT installment_plan_id,
+       (array_agg(user_id ORDER BY ts, id))[1],
+       (array_agg(NULLIF(note, '') ORDER BY ts, id))[1],
+       (array_agg(category ORDER BY ts, id))[1],
+       (array_agg(payment_method ORDER BY ts, id))[1],
+       CASE WHEN COUNT(*) >= n THEN SUM(amount) ELSE round(AVG(amount) * n, 2) END,
+       n,
+       MIN(ts)
+FROM (
+    SELECT *, GREATEST(
+        COALESCE(MAX(substring(installment_details FROM '/\s*(\d+)\s*$')::int) OVER w, 0),
+        COUNT(*) OVER w
+    ) AS n
+    FROM expenses
+    WHERE installment_plan_id IS NOT NULL
+    WINDOW w AS (PARTITION BY installment_plan_id)
+) e
+GROUP BY installment_plan_id, n
+ON CONFLICT (id) DO NOTHING;
+
+ALTER TABLE expenses DROP CONSTRAINT IF EXISTS expenses_installment_plan_fk;
+ALTER TABLE expenses ADD CONSTRAINT expenses_installment_plan_fk
+    FOREIGN KEY (installment_plan_id) REFERENCES installment_plans (id) ON DELETE CASCADE;
+
+-- Próximas cuotas y compromisos mensuales de un usuario (solo filas de planes)
+CREATE INDEX IF NOT EXISTS expenses_user_installment_ts_idx
+    ON expenses (user_id, ts) WHERE installment_plan_id IS NOT NULL;
@@ -0,0 +1,37 @@
+-- Búsqueda del historial del lado del servidor.
+--
+-- search_doc es un tsvector generado (configuración spanish: stemming y
+-- stopwords) con peso A para la categoría, B para la nota y C para el
+-- mensaje original, indexado con GIN. El texto se pasa antes por
+-- search_fold (minúsculas y sin tildes) para que "cafe" encuentre "Café";
+-- unaccent no sirve acá porque no es IMMUTABLE y no se puede usar en una
+-- columna generada.
+--
+-- Si el servidor tiene pg_trgm se agrega además un índice de trigramas para
+-- la búsqueda aproximada (errores de tipeo) que se usa cuando la búsqueda
+-- por palabras no encuentra nada. Sin la extensión la migración igual aplica.
+CREATE OR REPLACE FUNCTION search_fold(value TEXT) RETURNS TEXT AS $$
+    SELECT lower(translate(value,
+        'ÁÀÂÄÉÈÊËÍÌÎÏÓÒÔÖÚÙÛÜÑÇáàâäéèêëíìîïóòôöúùûüñç',
+        'AAAAEEEEIIIIOOOOUUUUNCaaaaeeeeiiiioooouuuunc'))
+$$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE;
+
+ALTER TABLE expenses ADD COLUMN IF NOT EXISTS search_doc tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('spanish'::regconfig, search_fold(category)), 'A') ||
+    setweight(to_tsvector('spanish'::regconfig, search_fold(COALESCE(note, ''))), 'B') ||
+    setweight(to_tsvector('spanish'::regconfig, search_fold(COALESCE(raw_msg, ''))), 'C')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS expenses_search_idx ON expenses USING gin (search_doc);
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        EXECUTE 'CREATE INDEX IF NOT EXISTS expenses_search_trgm_idx ON expenses '
+                'USING gin (search_fold(category || '' '' || COALESCE(note, '''')) gin_trgm_ops)';
+    END IF;
+EXCEPTION WHEN insufficient_privilege THEN
+    RAISE NOTICE 'pg_trgm no disponible: solo búsqueda por palabras';
+END
+$$;
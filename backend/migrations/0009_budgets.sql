@@ -0,0 +1,24 @@
+-- Presupuestos mensuales por (usuario, categoría) y los avisos ya enviados.
+--
+-- Lo gastado en el mes sale de expense_rollup_monthly, que los triggers de
+-- 0006 mantienen al día en cada alta, baja, modificación o lote de cuotas:
+-- evaluar un presupuesto después de una escritura es una búsqueda por clave
+-- (budgets) más una por prefijo de clave (rollup), sin importar el tamaño del
+-- historial. budget_alerts guarda qué umbrales (80%, 100%...) ya se avisaron
+-- en cada mes para no repetir el aviso con cada gasto.
+CREATE TABLE IF NOT EXISTS budgets (
+    user_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    amount NUMERIC(14,2) NOT NULL CHECK (amount > 0),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, category)
+);
+
+CREATE TABLE IF NOT EXISTS budget_alerts (
+    user_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    month DATE NOT NULL,
+    threshold SMALLINT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, category, month, threshold)
+);
@@ -0,0 +1,13 @@
+-- La búsqueda aproximada (trigramas) cubre también el mensaje original, como
+-- search_doc: un error de tipeo en una palabra que solo está en raw_msg
+-- ahora encuentra el gasto. La expresión tiene que ser idéntica a
+-- db_async.SEARCH_FOLD_DOC para que el planificador use el índice.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        DROP INDEX IF EXISTS expenses_search_trgm_idx;
+        EXECUTE 'CREATE INDEX expenses_search_trgm_idx ON expenses USING gin ('
+                'search_fold(category || '' '' || COALESCE(note, '''') || '' '' || COALESCE(raw_msg, '''')) gin_trgm_ops)';
+    END IF;
+END
+$$;
@@ -0,0 +1,259 @@
+# Outbox durable del bot: los gastos se guardan primero en un SQLite local y un
+# task en segundo plano los manda a la API en lotes. Si la API está fría o
+# caída el usuario igual recibe la confirmación y nada se pierde; al volver la
+# API se vacía la cola.
+#
+# Cada entrada es un alta lógica (un gasto, o todas las cuotas de un plan, que
+# viajan siempre en el mismo lote para que el plan sea atómico). Cada gasto
+# lleva una clave de idempotencia estable, así que reenviar una entrada que
+# la API ya había guardado (p. ej. se cortó la respuesta) no la duplica.
+#
+# Varios procesos pueden compartir el archivo: _due reclama las entradas que
+# devuelve (les corre next_attempt_at CLAIM_TIMEOUT segundos) en la misma
+# transacción en que las lee, así que otro proceso no las manda a la vez. Si
+# el proceso muere con entradas reclamadas, vuelven a estar listas al vencer
+# el reclamo. Una entrada que falla MAX_ATTEMPTS veces se da por perdida y se
+# avisa como si la API la hubiera rechazado.
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from api_client import RETRY_STATUS, ApiError
+
+log = logging.getLogger("gastos.outbox")
+
+OUTBOX_PATH = os.getenv("BOT_OUTBOX_PATH", os.path.join(os.path.dirname(__file__), "outbox.db"))
+FLUSH_INTERVAL = float(os.getenv("BOT_OUTBOX_FLUSH_INTERVAL", "5"))
+MAX_BATCH = 1000  # el límite de POST /api/expenses/batch
+RETRY_BASE = 2.0
+RETRY_MAX = 300.0
+MAX_ATTEMPTS = int(os.getenv("BOT_OUTBOX_MAX_ATTEMPTS", "20"))
+# Más que lo que puede tardar un envío con los reintentos de ApiClient
+CLAIM_TIMEOUT = 300.0
+
+
+class Outbox:
+    def __init__(self, path=OUTBOX_PATH):
+        # Una sola conexión protegida por un lock; las operaciones son chicas
+        # y se corren fuera del event loop con asyncio.to_thread.
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=FULL")
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " entry_key TEXT NOT NULL UNIQUE,"
+            " chat_id INTEGER,"
+            " payload TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt_at REAL NOT NULL DEFAULT 0,"
+            " last_error TEXT,"
+            " dead INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL)"
+        )
+
+    def close(self):
+        with self._lock:
+            self._con.close()
+
+    # --- operaciones sincrónicas ---
+    def _add(self, expenses, chat_id):
+        entry_key = uuid.uuid4().hex
+        expenses = [dict(e, idempotency_key=e.get("idempotency_key") or f"{entry_key}:{i}")
+                    for i, e in enumerate(expenses)]
+        with self._lock:
+            self._con.execute(
+                "INSERT INTO outbox (entry_key, chat_id, payload, size, created_at) VALUES (?, ?, ?, ?, ?)",
+                (entry_key, chat_id, json.dumps(expenses, ensure_ascii=False), len(expenses), time.time()),
+            )
+        return entry_key
+
+    def _due(self, limit):
+        # Entradas listas para enviar, en orden de llegada, hasta `limit`
+        # gastos. Quedan reclamadas hasta el ack, el reintento o CLAIM_TIMEOUT.
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE toma el lock de escritura del archivo antes de leer
+            self._con.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._con.execute(
+                    "SELECT seq, entry_key, chat_id, payload, size, attempts FROM outbox"
+                    " WHERE dead = 0 AND next_attempt_at <= ? ORDER BY seq",
+                    (now,),
+                ).fetchall()
+                batch, total = [], 0
+                for seq, entry_key, chat_id, payload, size, attempts in rows:
+                    if batch and total + size > limit:
+                        break
+                    batch.append({"seq": seq, "entry_key": entry_key, "chat_id": chat_id,
+                                  "expenses": json.loads(payload), "attempts": attempts})
+                    total += size
+                self._con.executemany("UPDATE outbox SET next_attempt_at = ? WHERE seq = ?",
+                                      [(now + CLAIM_TIMEOUT, e["seq"]) for e in batch])
+                self._con.execute("COMMIT")
+            except BaseException:
+                self._con.execute("ROLLBACK")
+                raise
+        return batch
+
+    def _ack(self, seqs):
+        with self._lock:
+            self._con.executemany("DELETE FROM outbox WHERE seq = ?", [(s,) for s in seqs])
+
+    def _retry_later(self, entries, error):
+        # Devuelve las entradas que llegaron a MAX_ATTEMPTS (quedan enterradas)
+        now = time.time()
+        retry = [e for e in entries if e["attempts"] + 1 < MAX_ATTEMPTS]
+        exhausted = [e for e in entries if e["attempts"] + 1 >= MAX_ATTEMPTS]
+        with self._lock:
+            self._con.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE seq = ?",
+                [(now + min(RETRY_MAX, RETRY_BASE * 2 ** e["attempts"]), error, e["seq"]) for e in retry],
+            )
+            self._con.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, dead = 1, last_error = ? WHERE seq = ?",
+                [(error, e["seq"]) for e in exhausted],
+            )
+        return exhausted
+
+    def _bury(self, seq, error):
+        # La API rechazó la entrada (datos inválidos) o se agotaron los
+        # intentos: reintentar no sirve
+        with self._lock:
+            self._con.execute("UPDATE outbox SET dead = 1, last_error = ? WHERE seq = ?", (error, seq))
+
+    def _stats(self):
+        with self._lock:
+            pending, dead = self._con.execute(
+                "SELECT COALESCE(SUM(dead = 0), 0), COALESCE(SUM(dead = 1), 0) FROM outbox"
+            ).fetchone()
+        return {"pending": pending, "dead": dead}
+
+    # --- API asíncrona para los handlers ---
+    async def add(self, expenses, chat_id=None):
+        return await asyncio.to_thread(self._add, expenses, chat_id)
+
+    async def stats(self):
+        return await asyncio.to_thread(self._stats)
+
+
+def _permanent(error):
+    # 4xx (menos timeout / rate limit) significa que reenviar lo mismo va a fallar igual
+    return error.status_code is not None and 400 <= error.status_code < 500 and error.status_code not in (408, 429)
+
+
+def _unavailable(error):
+    # La API no respondió o está caída / saturada: no tiene sentido separar el
+    # lote. Cualquier otra respuesta (4xx, 500) puede deberse a una sola entrada.
+    return error.status_code is None or error.status_code in (408, 429) or error.status_code in RETRY_STATUS
+
+
+class OutboxFlusher:
+    # Task en segundo plano que vacía el outbox. wake() lo despierta apenas se
+    # encola algo, así que con la API disponible el envío es casi inmediato.
+    # on_alerts recibe los avisos de presupuesto que devuelve la API junto con
+    # las entradas que los generaron (para saber a qué chat mandarlos).
+    def __init__(self, outbox, api, on_rejected=None, on_alerts=None, interval=FLUSH_INTERVAL):
+        self.outbox = outbox
+        self.api = api
+        self.on_rejected = on_rejected
+        self.on_alerts = on_alerts
+        self.interval = interval
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def wake(self):
+        self._wake.set()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            try:
+                while await self.flush():
+                    pass
+            except Exception:
+                log.exception("error vaciando la cola")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def flush(self):
+        # Envía un lote. Devuelve True si quedó algo por mandar enseguida.
+        entries = await asyncio.to_thread(self.outbox._due, MAX_BATCH)
+        if not entries:
+            return False
+        try:
+            result = await self.api.create_expenses([e for entry in entries for e in entry["expenses"]])
+        except ApiError as error:
+            if _unavailable(error):
+                await self._retry(entries, error.detail)
+                return False
+            if len(entries) == 1:
+                await self._failed(entries[0], error)
+                return True
+            # El lote entero falla por una sola entrada mala (un 4xx, o un 500
+            # que se repite siempre con los mismos datos): se reenvían de a una
+            # para aislarla sin frenar al resto
+            for entry in entries:
+                await self._flush_one(entry)
+            return True
+        await asyncio.to_thread(self.outbox._ack, [entry["seq"] for entry in entries])
+        await self._alert(entries, result)
+        return True
+
+    async def _flush_one(self, entry):
+        try:
+            result = await self.api.create_expenses(entry["expenses"])
+        except ApiError as error:
+            await self._failed(entry, error)
+            return
+        await asyncio.to_thread(self.outbox._ack, [entry["seq"]])
+        await self._alert([entry], result)
+
+    async def _failed(self, entry, error):
+        if _permanent(error):
+            await self._reject(entry, error.detail)
+        else:
+            await self._retry([entry], error.detail)
+
+    async def _retry(self, entries, detail):
+        exhausted = await asyncio.to_thread(self.outbox._retry_later, entries, detail)
+        for entry in exhausted:
+            log.warning("entrada %s descartada después de %d intentos: %s", entry["entry_key"], MAX_ATTEMPTS, detail)
+            if self.on_rejected is not None:
+                await self.on_rejected(entry, f"sin guardar después de {MAX_ATTEMPTS} intentos ({detail})")
+
+    async def _reject(self, entry, detail):
+        await asyncio.to_thread(self.outbox._bury, entry["seq"], detail)
+        if self.on_rejected is not None:
+            await self.on_rejected(entry, detail)
+
+    async def _alert(self, entries, result):
+        # Un aviso que no se pudo mandar no frena el vaciado: el gasto ya quedó
+        # registrado y el umbral ya figura como avisado
+        alerts = result.get("alerts") if isinstance(result, dict) else None
+        if not alerts or self.on_alerts is None:
+            return
+        try:
+            await self.on_alerts(entries, alerts)
+        except Exception:
+            log.exception("no se pudieron mandar los avisos de presupuesto")
@@ -1,79 +1,268 @@
-# FILE: parser.py (VERSIÓN FINAL CON TILDES Y ALIAS)
-from datetime import datetime
+# FILE: parser.py
+# Parser de gastos en una sola pasada: todas las expresiones se compilan una
+# vez al importar el módulo y los medios de pago se buscan con una sola
+# alternación (en vez de una regex por medio de pago).
+#
+# Formato: <monto> <categoría...> ["nota"] [fecha] [medio_pago]
+#   monto:  500 | 12,5 | 12.5 | 1.500 | 1.500,50 | 1,500.50 | $500 | 15 mil | 15k | 2 lucas | 1,5 palos
+#   fecha:  2024-05-01 | 1/5 | 01/05/2024 | 01-05-24 | hoy | ayer | anteayer
+# parse_many acepta un mensaje con un gasto por línea; parse_range interpreta
+# los rangos de fechas de /resumen.
+from datetime import date, timedelta
 import re
 
-# Ampliamos la lista para incluir variantes con y sin tilde, y alias comunes como "mp"
-PAYMENT_METHODS = [
-    "efectivo", 
-    "crédito", "credito", 
-    "débito", "debito", 
-    "mercadopago", "mp",
-    "modo", 
-    "transferencia", 
-    "binance",
-    "sube",
-    "uala",
-]
+# Alias -> nombre normalizado. El orden es la prioridad si en el texto aparece
+# más de un medio de pago (gana el primero de esta tabla, no el primero del texto).
+PAYMENT_METHODS = {
+    "efectivo": "efectivo",
+    "crédito": "credito",
+    "credito": "credito",
+    "débito": "debito",
+    "debito": "debito",
+    "mercadopago": "mercadopago",
+    "mercado pago": "mercadopago",
+    "mp": "mp",
+    "modo": "modo",
+    "transferencia": "transferencia",
+    "transf": "transferencia",
+    "binance": "binance",
+    "sube": "sube",
+    "uala": "uala",
+    "ualá": "uala",
+}
+_PAYMENT_PRIORITY = {alias: i for i, alias in enumerate(PAYMENT_METHODS)}
+_PAYMENT_RE = re.compile(
+    r"\b(" + "|".join(re.escape(a) for a in sorted(PAYMENT_METHODS, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE,
+)
+
+_NOTE_RE = re.compile(r'["“](.*?)["”]')
+
+# 1.500 / 1.500,50 (punto de miles), 1,500.50 (coma de miles con decimales),
+# 12,5 / 12.5 (un solo separador: decimal). Sufijo opcional k / mil pegado.
+_AMOUNT_RE = re.compile(
+    r"^\$?(?:(?P<ar>\d{1,3}(?:\.\d{3})+(?:,\d+)?)|(?P<us>\d{1,3}(?:,\d{3})+\.\d+)|(?P<plain>\d+(?:[.,]\d+)?))"
+    r"(?P<suffix>k|mil)?$",
+    re.IGNORECASE,
+)
+MULTIPLIERS = {
+    "k": 1_000, "mil": 1_000, "luca": 1_000, "lucas": 1_000,
+    "palo": 1_000_000, "palos": 1_000_000, "millon": 1_000_000, "millón": 1_000_000, "millones": 1_000_000,
+}
+
+_ISO_DATE_RE = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})$")
+_DMY_DATE_RE = re.compile(r"^(\d{1,2})[/-](\d{1,2})(?:[/-](\d{2}|\d{4}))?$")
+RELATIVE_DATES = {"hoy": 0, "ayer": 1, "anteayer": 2}
+
+ERR_EMPTY = "Faltan argumentos. Usá: /gasto <monto> <categoría> [...]"
+ERR_AMOUNT = "No se pudo encontrar el monto."
+ERR_CATEGORY = "Falta la categoría después del monto."
+ERR_AMOUNT_ZERO = "El monto tiene que ser mayor a cero."
+ERR_TWO_DATES = "Hay más de una fecha; indicá una sola."
+ERR_RANGE = "Rango inválido. Usá: /resumen semana | mes | <AAAA-MM> | <fecha> [<fecha>]"
+ERR_BUDGET = "Usá: /presupuesto <categoría> <monto> | /presupuesto <categoría> borrar"
+
+_MONTH_RE = re.compile(r"^(\d{4})-(\d{1,2})$")
+
+
+def _parse_amount(token):
+    m = _AMOUNT_RE.match(token)
+    if not m:
+        return None
+    if m.group("ar"):
+        value = float(m.group("ar").replace(".", "").replace(",", "."))
+    elif m.group("us"):
+        value = float(m.group("us").replace(",", ""))
+    else:
+        value = float(m.group("plain").replace(",", "."))
+    if m.group("suffix"):
+        value = round(value * 1_000, 2)
+    return value
+
+
+def parse_amount(token):
+    # Monto de un extracto bancario: mismos formatos que /gasto, con signo y
+    # espacios ("-1.234,56", "$ -1.234,56", "- 500"). None si no es un monto.
+    token = token.replace(" ", "").replace("\u00a0", "")
+    sign = 1
+    if token.startswith("-") or token.startswith("$-"):
+        sign, token = -1, token.replace("-", "", 1)
+    value = _parse_amount(token)
+    return None if value is None else sign * value
+
+
+def _preferred_payment(aliases):
+    return min((alias.lower() for alias in aliases), key=_PAYMENT_PRIORITY.__getitem__)
+
+
+def find_payment_method(text):
+    # Medio de pago normalizado mencionado en un texto libre ("Tarjeta de
+    # crédito", "Mercado Pago"), con la misma prioridad que /gasto; o None
+    aliases = _PAYMENT_RE.findall(text or "")
+    return PAYMENT_METHODS[_preferred_payment(aliases)] if aliases else None
 
-def parse_gasto_args(text: str, today_iso: str):
-    print("--- EJECUTANDO PARSER v4 (con tildes) ---") 
 
+def _parse_date(token, today):
+    # Devuelve (fecha ISO, None), (None, error) si parece una fecha pero es
+    # inválida, o (None, None) si el token no es una fecha.
+    lowered = token.lower()
+    if lowered in RELATIVE_DATES:
+        return (today - timedelta(days=RELATIVE_DATES[lowered])).isoformat(), None
+    m = _ISO_DATE_RE.match(token)
+    if m:
+        year, month, day = int(m.group(1)), int(m.group(2)), int(m.group(3))
+    else:
+        m = _DMY_DATE_RE.match(token)
+        if not m:
+            return None, None
+        day, month = int(m.group(1)), int(m.group(2))
+        if m.group(3) is None:
+            year = None
+        else:
+            year = int(m.group(3))
+            if year < 100:
+                year += 2000
+    try:
+        if year is not None:
+            return date(year, month, day).isoformat(), None
+        # Sin año: el último día/mes que no esté en el futuro
+        value = date(today.year, month, day)
+        if value > today:
+            value = date(today.year - 1, month, day)
+        return value.isoformat(), None
+    except ValueError:
+        return None, f"Fecha inválida: {token}"
+
+
+def parse_gasto_args(text: str, today_iso: str):
     # 1. Extraer y quitar la nota (texto entre comillas)
     note = None
-    note_match = re.search(r'["“](.*?)["”]', text)
+    note_match = _NOTE_RE.search(text)
     if note_match:
         note = note_match.group(1).strip()
-        text = text.replace(note_match.group(0), "", 1).strip()
+        text = text[:note_match.start()] + text[note_match.end():]
 
-    # 2. Extraer y quitar el método de pago
+    # 2. Extraer y quitar el medio de pago: una sola búsqueda sobre la
+    # alternación compilada y se quitan todas las apariciones del elegido
     payment_method = None
-    text_lower_for_search = text.lower()
-    for method in PAYMENT_METHODS:
-        if re.search(r'\b' + re.escape(method) + r'\b', text_lower_for_search):
-            # Normalizamos al nombre sin tilde para consistencia
-            if method == "crédito": payment_method = "credito"
-            elif method == "débito": payment_method = "debito"
-            else: payment_method = method
-
-            text = re.sub(r'\b' + re.escape(method) + r'\b', '', text, flags=re.IGNORECASE).strip()
-            break
+    matches = list(_PAYMENT_RE.finditer(text))
+    if matches:
+        chosen = _preferred_payment(m.group(1) for m in matches)
+        payment_method = PAYMENT_METHODS[chosen]
+        pieces, last = [], 0
+        for m in matches:
+            if m.group(1).lower() == chosen:
+                pieces.append(text[last:m.start()])
+                last = m.end()
+        pieces.append(text[last:])
+        text = " ".join(pieces)
 
     parts = text.split()
     if not parts:
-        return None, "Faltan argumentos. Usá: /gasto <monto> <categoría> [...]"
-
-    # 3. Extraer el monto
-    try:
-        amount_str = parts.pop(0).replace(",", ".")
-        amount = float(amount_str)
-    except (ValueError, IndexError):
-        return None, "No se pudo encontrar el monto."
+        return None, ERR_EMPTY
 
-    # 4. Lo que queda es la categoría y (opcionalmente) la fecha
-    remaining_text = " ".join(parts)
-    date_str = None
-    category = remaining_text
-
-    date_match = re.search(r'(\d{4}-\d{2}-\d{2})$', remaining_text)
-    if date_match:
-        date_str = date_match.group(1)
-        category = remaining_text.replace(date_str, "").strip()
+    # 3. El monto es el primer token, con un multiplicador opcional después
+    amount = _parse_amount(parts[0])
+    if amount is None:
+        return None, ERR_AMOUNT
+    rest = parts[1:]
+    if rest and rest[0].lower() in MULTIPLIERS:
+        # Redondeo a centavos: 1,1 * 1000 en float no da exacto
+        amount = round(amount * MULTIPLIERS[rest[0].lower()], 2)
+        rest = rest[1:]
+    if amount <= 0:
+        return None, ERR_AMOUNT_ZERO
 
+    # 4. Lo que queda es la categoría y (opcionalmente) una sola fecha en
+    # cualquier posición
+    today = date.fromisoformat(today_iso[:10])
     ts = today_iso
-    if date_str:
-        try:
-            ts = datetime.strptime(date_str, "%Y-%m-%d").date().isoformat()
-        except ValueError:
-            pass
+    category_parts = []
+    date_found = False
+    for token in rest:
+        value, err = _parse_date(token, today)
+        if err:
+            return None, err
+        if value:
+            if date_found:
+                return None, ERR_TWO_DATES
+            ts = value
+            date_found = True
+            continue
+        category_parts.append(token)
 
-    if not category:
-        return None, "Falta la categoría después del monto."
+    if not category_parts:
+        return None, ERR_CATEGORY
 
     return {
         "amount": amount,
-        "category": category.lower().strip(),
+        "category": " ".join(category_parts).lower(),
         "note": note,
         "date": ts,
         "currency": "ARS",
         "payment_method": payment_method
-    }, None
\ No newline at end of file
+    }, None
+
+
+def parse_many(text: str, today_iso: str):
+    # Un gasto por línea (las líneas vacías se ignoran). Devuelve
+    # (gastos, errores) donde cada gasto es (número de línea, línea, gasto) y
+    # cada error (número de línea, línea, mensaje).
+    expenses, errors = [], []
+    for number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        parsed, err = parse_gasto_args(line, today_iso)
+        if parsed:
+            expenses.append((number, line.strip(), parsed))
+        else:
+            errors.append((number, line.strip(), err))
+    return expenses, errors
+
+
+def parse_range(tokens, today_iso: str):
+    # ["2024-05"] -> ese mes; [fecha] -> ese día; [desde, hasta] -> ambos
+    # inclusive. Las fechas aceptan los mismos formatos que /gasto. Devuelve
+    # ((inicio, fin exclusivo) en ISO, None) o (None, error).
+    today = date.fromisoformat(today_iso)
+    if len(tokens) == 1:
+        m = _MONTH_RE.match(tokens[0])
+        if m:
+            try:
+                start = date(int(m.group(1)), int(m.group(2)), 1)
+            except ValueError:
+                return None, ERR_RANGE
+            end = (start + timedelta(days=32)).replace(day=1)
+            return (start.isoformat(), end.isoformat()), None
+    if len(tokens) not in (1, 2):
+        return None, ERR_RANGE
+    days = []
+    for token in tokens:
+        value, err = _parse_date(token, today)
+        if err or value is None:
+            return None, err or ERR_RANGE
+        days.append(date.fromisoformat(value))
+    start, last = days[0], days[-1]
+    if last < start:
+        return None, ERR_RANGE
+    return (start.isoformat(), (last + timedelta(days=1)).isoformat()), None
+
+
+def parse_budget_args(tokens):
+    # [categoría, monto (+ multiplicador)] o [categoría, "borrar"] ->
+    # ((categoría, monto o None para borrar), None) o (None, error)
+    if len(tokens) < 2:
+        return None, ERR_BUDGET
+    category = tokens[0].lower()
+    if len(tokens) == 2 and tokens[1].lower() in ("borrar", "0"):
+        return (category, None), None
+    amount = _parse_amount(tokens[1])
+    if amount is None or len(tokens) > 3:
+        return None, ERR_BUDGET
+    if len(tokens) == 3:
+        if tokens[2].lower() not in MULTIPLIERS:
+            return None, ERR_BUDGET
+        amount = round(amount * MULTIPLIERS[tokens[2].lower()], 2)
+    if amount <= 0:
+        return None, ERR_BUDGET
+    return (category, amount), None
@@ -0,0 +1,232 @@
+# Pipeline de parseo de gastos: primero el parser local (sin red, ~10 us) y
+# el LLM solo si el parser no entiende el mensaje o el resultado es dudoso
+# (p. ej. "gasté 500 en el super con la tarjeta").
+#
+# Las respuestas del LLM se guardan en un caché LRU con TTL por (texto
+# normalizado, fecha), la cantidad de llamadas simultáneas al modelo está
+# acotada por un semáforo y dos mensajes iguales en vuelo comparten la misma
+# llamada. El modelo se elige con PARSER_MODEL:
+#   auto    gemini si hay GOOGLE_API_KEY, si no openai si hay OPENAI_API_KEY, si no ninguno
+#   gemini | openai | stub (determinístico y local, para pruebas sin red) | none
+import asyncio
+import os
+import re
+import unicodedata
+from datetime import date, timedelta
+
+from cache import TTLCache
+from parser import ERR_EMPTY, PAYMENT_METHODS, parse_gasto_args
+
+PARSER_MODEL = os.getenv("PARSER_MODEL", "auto")
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+# Por debajo de este puntaje el resultado local se confirma con el LLM
+CONFIDENCE_THRESHOLD = 0.6
+
+_FILLER_WORDS = {"en", "el", "la", "los", "las", "un", "una", "de", "del", "por", "para",
+                 "gaste", "gasté", "pague", "pagué", "compre", "compré", "me", "salio", "salió"}
+_DIGIT_RE = re.compile(r"\d")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def confidence(parsed):
+    # Heurística barata: las categorías cortas y sin relleno ("comida",
+    # "nafta ypf") son confiables; una frase entera como categoría no.
+    words = parsed["category"].split()
+    score = 1.0
+    if len(words) > 3:
+        score -= 0.5
+    if _DIGIT_RE.search(parsed["category"]):
+        score -= 0.3
+    if any(w in _FILLER_WORDS for w in words):
+        score -= 0.3
+    return score
+
+
+def normalize_text(text):
+    return _SPACES_RE.sub(" ", unicodedata.normalize("NFC", text)).strip().lower()
+
+
+def _normalize_result(result, today_iso):
+    # Lleva la respuesta del modelo al mismo formato que parse_gasto_args
+    try:
+        amount = float(result.get("amount"))
+    except (TypeError, ValueError):
+        return None, "La IA no pudo determinar el monto."
+    category = str(result.get("category") or "").strip().lower()
+    if amount <= 0 or not category:
+        return None, "La IA no pudo determinar el monto o la categoría."
+    try:
+        ts = date.fromisoformat(str(result.get("date"))[:10]).isoformat()
+    except ValueError:
+        ts = today_iso
+    payment_method = result.get("payment_method")
+    if payment_method:
+        payment_method = str(payment_method).strip().lower()
+        payment_method = PAYMENT_METHODS.get(payment_method, payment_method)
+    return {
+        "amount": amount,
+        "category": category,
+        "note": result.get("note"),
+        "date": ts,
+        "currency": "ARS",
+        "payment_method": payment_method or None,
+    }, None
+
+
+# --- MODELOS ---
+class GeminiModel:
+    name = "gemini"
+
+    async def parse(self, text, today_iso):
+        import ai
+        return await ai.ai_parse_expense_async(text, today_iso)
+
+
+class OpenAIModel:
+    name = "openai"
+
+    async def parse(self, text, today_iso):
+        import ai_openai
+        return await ai_openai.ai_parse_expense_openai_async(text, today_iso)
+
+
+class StubModel:
+    # Modelo falso pero determinístico: primer número del texto como monto y
+    # categoría por palabras clave. Sirve para probar el pipeline sin red;
+    # `latency` simula la demora de un modelo real.
+    name = "stub"
+    KEYWORDS = {
+        "super": "supermercado", "supermercado": "supermercado", "verduleria": "supermercado",
+        "uber": "transporte", "taxi": "transporte", "colectivo": "transporte", "nafta": "transporte",
+        "pizza": "comida", "almuerzo": "comida", "cena": "comida", "cafe": "comida", "café": "comida",
+        "luz": "servicios", "gas": "servicios", "internet": "servicios",
+        "farmacia": "salud", "medico": "salud", "médico": "salud",
+        "cine": "ocio", "netflix": "ocio", "alquiler": "hogar",
+        "ropa": "ropa", "zapatillas": "ropa", "curso": "educación", "libro": "educación",
+    }
+    _AMOUNT_RE = re.compile(r"(\d+(?:[.,]\d+)*)\s*(mil|k)?\b", re.IGNORECASE)
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def parse(self, text, today_iso):
+        self.calls += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            m = self._AMOUNT_RE.search(text)
+            if not m:
+                return None, "La IA no pudo determinar el monto o la categoría."
+            number = m.group(1)
+            if "," in number or re.fullmatch(r"\d{1,3}(\.\d{3})+", number):
+                number = number.replace(".", "").replace(",", ".")
+            amount = float(number) * (1000 if m.group(2) else 1)
+            words = normalize_text(text).split()
+            category = next((self.KEYWORDS[w] for w in words if w in self.KEYWORDS), "otros")
+            payment = next((w for w in words if w in PAYMENT_METHODS), None)
+            day = date.fromisoformat(today_iso) - timedelta(days=1 if "ayer" in words else 0)
+            return {"amount": amount, "category": category, "note": None,
+                    "date": day.isoformat(), "payment_method": payment}, None
+        finally:
+            self.in_flight -= 1
+
+
+def build_model(name=PARSER_MODEL):
+    if name == "auto":
+        if os.getenv("GOOGLE_API_KEY"):
+            name = "gemini"
+        elif os.getenv("OPENAI_API_KEY"):
+            name = "openai"
+        else:
+            return None
+    return {"gemini": GeminiModel, "openai": OpenAIModel, "stub": StubModel}.get(name, lambda: None)()
+
+
+# --- PIPELINE ---
+class ParsePipeline:
+    def __init__(self, model=None, cache=None, concurrency=LLM_CONCURRENCY, threshold=CONFIDENCE_THRESHOLD):
+        self.model = model
+        self.cache = cache if cache is not None else TTLCache(LLM_CACHE_SIZE, LLM_CACHE_TTL)
+        self.threshold = threshold
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._inflight = {}
+        self.counts = {"local": 0, "cached": 0, "llm": 0, "llm_errors": 0}
+
+    async def parse(self, text, today_iso):
+        parsed, err = parse_gasto_args(text, today_iso)
+        if parsed and confidence(parsed) >= self.threshold:
+            self.counts["local"] += 1
+            return parsed, None
+        if self.model is None or err == ERR_EMPTY:
+            self.counts["local"] += 1
+            return parsed, err
+
+        key = (normalize_text(text), today_iso)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.counts["cached"] += 1
+            return dict(cached), None
+
+        # Mensajes idénticos en vuelo esperan la misma llamada al modelo
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._call_model(text, today_iso, key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        result, _ = await asyncio.shield(task)
+        if result is not None:
+            return dict(result), None
+        # Si el modelo falla queda el resultado local (aunque sea dudoso) o el
+        # error del parser local, que explica el formato esperado
+        return parsed, err
+
+    async def _call_model(self, text, today_iso, key):
+        async with self._semaphore:
+            self.counts["llm"] += 1
+            try:
+                raw, err = await self.model.parse(text, today_iso)
+            except Exception as e:
+                raw, err = None, f"Error de IA: {e}"
+        result, err = _normalize_result(raw, today_iso) if raw else (None, err)
+        if result is None:
+            self.counts["llm_errors"] += 1
+            return None, err
+        self.cache.set(key, result)
+        return result, None
+
+    async def parse_many(self, text, today_iso):
+        # Igual que parser.parse_many pero cada línea pasa por el pipeline (en paralelo)
+        lines = [(n, line) for n, line in enumerate(text.splitlines(), start=1) if line.strip()]
+        results = await asyncio.gather(*(self.parse(line, today_iso) for _, line in lines))
+        expenses, errors = [], []
+        for (number, line), (parsed, err) in zip(lines, results):
+            if parsed:
+                expenses.append((number, line.strip(), parsed))
+            else:
+                errors.append((number, line.strip(), err))
+        return expenses, errors
+
+    def stats(self):
+        return {
+            "model": getattr(self.model, "name", None),
+            **self.counts,
+            "in_flight": len(self._inflight),
+            "cache": self.cache.stats(),
+        }
+
+
+_pipeline = None
+
+
+def get_pipeline():
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = ParsePipeline(build_model())
+    return _pipeline
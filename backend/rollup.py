@@ -0,0 +1,109 @@
+# Rollup mensual de gastos (tabla expense_rollup_monthly, migración 0006).
+#
+#   python rollup.py verify [user_id]    compara el rollup con los gastos crudos
+#   python rollup.py rebuild [user_id]   lo recalcula desde cero
+#
+# Las lecturas de agregados parten el período en meses completos (rollup) y
+# bordes (filas crudas de expenses); split_period hace ese corte.
+import sys
+from datetime import date, datetime, timedelta
+
+BA_MONTH = "date_trunc('month', ts AT TIME ZONE 'America/Argentina/Buenos_Aires')::date"
+
+FRESH_SQL = (
+    f"SELECT user_id, {BA_MONTH} AS month, category, COALESCE(payment_method, '') AS payment_method, "
+    "SUM(amount) AS total, COUNT(*) AS count FROM expenses {where} GROUP BY 1, 2, 3, 4"
+)
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return None
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str) and len(value) == 10:
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _next_month(d):
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def split_period(start_date, end_date):
+    # [start, end) -> (meses completos o None, [rangos crudos]). Solo se usa
+    # el rollup si los límites son fechas (medianoche de BA); con horas
+    # arbitrarias todo el período va por las filas crudas.
+    start, end = _as_date(start_date), _as_date(end_date)
+    if start is None or end is None:
+        return None, [(start_date, end_date)]
+    first = start if start.day == 1 else _next_month(start)
+    last = end.replace(day=1)
+    if first >= last:
+        return None, [(start, end)] if start < end else []
+    edges = [(lo, hi) for lo, hi in ((start, first), (last, end)) if lo < hi]
+    return (first, last), edges
+
+
+# --- CLI ---
+def verify(user_id=None):
+    from db import get_con
+
+    where = "WHERE user_id = %s" if user_id else ""
+    params = (user_id, user_id) if user_id else ()
+    with get_con() as con:
+        cur = con.cursor()
+        cur.execute(
+            f"WITH fresh AS ({FRESH_SQL.format(where=where)}), "
+            f"r AS (SELECT * FROM expense_rollup_monthly {where}) "
+            "SELECT COALESCE(f.user_id, r.user_id), COALESCE(f.month, r.month), "
+            "COALESCE(f.category, r.category), COALESCE(f.payment_method, r.payment_method), "
+            "f.total, f.count, r.total, r.count "
+            "FROM fresh f FULL OUTER JOIN r USING (user_id, month, category, payment_method) "
+            "WHERE f.total IS DISTINCT FROM r.total OR f.count IS DISTINCT FROM r.count "
+            "ORDER BY 1, 2, 3, 4",
+            params,
+        )
+        diffs = cur.fetchall()
+        cur.close()
+    for user, month, category, payment_method, total, count, r_total, r_count in diffs:
+        print(f"[rollup] {user} {month} {category}/{payment_method or '-'}: "
+              f"gastos={total} ({count}) rollup={r_total} ({r_count})")
+    return diffs
+
+
+def rebuild(user_id=None):
+    from db import get_con
+
+    where = "WHERE user_id = %s" if user_id else ""
+    params = (user_id,) if user_id else ()
+    with get_con() as con:
+        cur = con.cursor()
+        # Bloquea escrituras a expenses mientras se recalcula (las lecturas siguen)
+        cur.execute("LOCK TABLE expenses IN SHARE ROW EXCLUSIVE MODE")
+        cur.execute(f"DELETE FROM expense_rollup_monthly {where}", params)
+        cur.execute(
+            "INSERT INTO expense_rollup_monthly (user_id, month, category, payment_method, total, count) "
+            + FRESH_SQL.format(where=where),
+            params,
+        )
+        rows = cur.rowcount
+        cur.close()
+    return rows
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+    user = sys.argv[2] if len(sys.argv) > 2 else None
+    if command == "verify":
+        diffs = verify(user)
+        print(f"[rollup] {len(diffs)} diferencia(s)")
+        sys.exit(1 if diffs else 0)
+    elif command == "rebuild":
+        print(f"[rollup] {rebuild(user)} fila(s) recalculadas")
+    else:
+        print(f"Comando desconocido: {command}")
+        sys.exit(2)
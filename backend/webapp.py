@@ -1,26 +1,133 @@
-import csv
-from datetime import datetime
-from io import StringIO
-from typing import Optional
+import asyncio
+import functools
+import hashlib
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from typing import List, Literal, Optional
 import pytz
-from fastapi import FastAPI, Form, Request, HTTPException, Body
-from fastapi.responses import RedirectResponse, StreamingResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from dateutil.relativedelta import relativedelta
+from fastapi import FastAPI, Form, Request, Response, HTTPException, Body, Query, Header
+from fastapi.responses import RedirectResponse, StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from db import get_con, insert_expense, delete_expense, init_db
+import db_async
+import export
+import importer
+import metrics
+from cache import get_read_cache
+from db import close_pool, pool_stats
+from logs import setup_logging
 
 BA_TZ = pytz.timezone("America/Argentina/Buenos_Aires")
-app = FastAPI()
-init_db()
-templates = Jinja2Templates(directory="templates")
+# "webhook": el bot de Telegram corre dentro de este proceso (ver webhook.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+TELEGRAM_WEBHOOK_PATH = os.getenv("TELEGRAM_WEBHOOK_PATH", "/telegram/webhook")
+# Tiempo máximo de la consulta de /readyz
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", "2"))
+setup_logging()
+log = logging.getLogger("gastos.api")
+
+
+# --- ARRANQUE ---
+# Corre una vez por worker de gunicorn, antes de aceptar pedidos. El esquema
+# no se toca acá: se crea/actualiza con `python migrate.py` en cada deploy.
+# Si Postgres no responde al arrancar el worker levanta igual (/healthz da
+# 200) y /readyz da 503 hasta que la base vuelva; el pool se abre solo en el
+# primer pedido que lo necesite.
+@asynccontextmanager
+async def lifespan(app):
+    t0 = time.perf_counter()
+    try:
+        warmed = await db_async.warm_pool()
+    except Exception:
+        warmed = 0
+        log.exception("no se pudo abrir el pool al arrancar")
+    if BOT_MODE == "webhook":
+        from webhook import WebhookBot
+
+        app.state.bot = WebhookBot.from_env()
+        await app.state.bot.start()
+    app.state.ready = True
+    log.info("api lista", extra={"startup_ms": round((time.perf_counter() - t0) * 1000, 1), "connections": warmed})
+    try:
+        yield
+    finally:
+        # Desde acá /readyz da 503 y el balanceador deja de mandar pedidos
+        app.state.ready = False
+        bot = getattr(app.state, "bot", None)
+        if bot is not None:
+            await bot.stop()
+        await db_async.close_pool()
+        close_pool()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@functools.lru_cache(maxsize=None)
+def templates():
+    # Jinja2 solo lo usa el dashboard viejo: se importa con el primer pedido
+    from fastapi.templating import Jinja2Templates
+
+    return Jinja2Templates(directory="templates")
+
+
+@functools.lru_cache(maxsize=None)
+def latest_migration():
+    from migrate import discover
+
+    return max((version for version, _, _ in discover()), default=None)
 
 # --- DEFINE period_month FUNCTION ---
 def period_month():
+    # Rango [start, end): end es mañana para incluir todo el día de hoy
+    today = datetime.now(BA_TZ).date()
+    start = today.replace(day=1)
+    end = today + timedelta(days=1)
+    return start.isoformat(), end.isoformat()
+
+
+Period = Literal["current", "last", "week", "month", "7days", "90days", "all"]
+
+
+def resolve_period(period="current", start=None, end=None):
+    # Devuelve (start, end) como fechas ISO con end exclusivo. Si vienen start/end
+    # explícitos (YYYY-MM-DD, ambos inclusive) tienen prioridad sobre period.
     today = datetime.now(BA_TZ).date()
-    start = today.replace(day=1).isoformat()
-    end = today.isoformat()
-    return start, end
+    tomorrow = today + timedelta(days=1)
+    if start or end:
+        start_d = date.fromisoformat(start) if start else date(1970, 1, 1)
+        end_d = date.fromisoformat(end) + timedelta(days=1) if end else tomorrow
+    elif period == "current":
+        start_d = today.replace(day=1)
+        end_d = (start_d + timedelta(days=32)).replace(day=1)
+    elif period == "last":
+        end_d = today.replace(day=1)
+        start_d = (end_d - timedelta(days=1)).replace(day=1)
+    elif period == "week":
+        start_d, end_d = today - timedelta(days=today.weekday()), tomorrow
+    elif period == "month":
+        start_d, end_d = today.replace(day=1), tomorrow
+    elif period == "7days":
+        start_d, end_d = today - timedelta(days=6), tomorrow
+    elif period == "90days":
+        start_d, end_d = today - timedelta(days=89), tomorrow
+    else:
+        start_d, end_d = date(1970, 1, 1), date(2100, 1, 1)
+    return start_d.isoformat(), end_d.isoformat()
+
+def normalize_ts(ts: Optional[str]) -> datetime:
+    # Normaliza a BA_TZ; si solo viene la fecha, agrega la hora actual de BA
+    ba_now = datetime.now(BA_TZ)
+    if not ts:
+        return ba_now
+    if 'T' not in ts:
+        return BA_TZ.localize(datetime.combine(date.fromisoformat(ts), ba_now.time()))
+    dt = datetime.fromisoformat(ts)
+    return BA_TZ.localize(dt) if dt.tzinfo is None else dt.astimezone(BA_TZ)
 
 # --- ENDPOINTS DE API PARA TU FRONTEND ---
 # Modelo para recibir gastos por API
@@ -35,31 +142,17 @@ class Expense(BaseModel):
     payment_method: Optional[str] = None
     installment_plan_id: Optional[str] = None
     installment_details: Optional[str] = None
+    # Clave generada por el cliente: reenviar el mismo gasto no lo duplica
+    idempotency_key: Optional[str] = None
 
-# Endpoint para registrar gastos vía API
+# Endpoint para registrar gastos vía API. La clave de idempotencia puede venir
+# en el cuerpo o en el header Idempotency-Key.
 @app.post("/api/expenses")
-async def add_expense_api(expense: Expense):
-    try:
-        # Normalizar timestamp a BA_TZ y agregar hora si solo viene fecha
-        ts = expense.ts
-        from datetime import datetime
-        import pytz
-        BA_TZ = pytz.timezone("America/Argentina/Buenos_Aires")
-        if 'T' not in ts:
-            # Solo fecha, agregar hora actual de BA
-            ba_now = datetime.now(BA_TZ)
-            dt = datetime.combine(datetime.fromisoformat(ts), ba_now.time())
-            ts_ba = BA_TZ.localize(dt)
-        else:
-            dt = datetime.fromisoformat(ts)
-            if dt.tzinfo is None:
-                ts_ba = BA_TZ.localize(dt)
-            else:
-                ts_ba = dt.astimezone(BA_TZ)
-        ts_final = ts_ba.isoformat()
-        insert_expense(
+async def add_expense_api(expense: Expense, idempotency_key: Optional[str] = Header(None)):
+    try:
+        expense_id, created, alerts = await db_async.insert_expense(
             user_id=expense.user_id,
-            ts=ts_final,
+            ts=normalize_ts(expense.ts),
             amount=expense.amount,
             currency=expense.currency,
             category=expense.category,
@@ -68,11 +161,45 @@ async def add_expense_api(expense: Expense):
             payment_method=expense.payment_method,
             installment_plan_id=expense.installment_plan_id,
             installment_details=expense.installment_details,
+            idempotency_key=expense.idempotency_key or idempotency_key,
         )
-        return {"ok": True, "message": "Gasto registrado via API"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-## ...existing code...
+    if created:
+        await get_read_cache().bump(expense.user_id)
+    message = "Gasto registrado via API" if created else "El gasto ya estaba registrado"
+    return {"ok": True, "message": message, "id": expense_id, "duplicate": not created, "alerts": alerts}
+
+
+MAX_BATCH = 1000
+
+
+class ExpenseBatch(BaseModel):
+    expenses: List[Expense]
+
+
+# Alta de varios gastos en una sola transacción (p. ej. todas las cuotas de un
+# plan): o se insertan todos o ninguno. Devuelve los ids en el orden recibido;
+# los gastos con una clave de idempotencia ya vista devuelven el id original.
+@app.post("/api/expenses/batch")
+async def add_expenses_batch_api(batch: ExpenseBatch):
+    if not 1 <= len(batch.expenses) <= MAX_BATCH:
+        raise HTTPException(status_code=422, detail=f"El lote debe tener entre 1 y {MAX_BATCH} gastos")
+    try:
+        rows = []
+        for expense in batch.expenses:
+            row = expense.dict()
+            row["ts"] = normalize_ts(expense.ts)
+            rows.append(row)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Fecha inválida: {e}")
+    try:
+        ids, inserted, alerts = await db_async.insert_expenses(rows)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if inserted:
+        await get_read_cache().bump(*(row["user_id"] for row in rows))
+    return {"ok": True, "ids": ids, "count": len(ids), "duplicates": len(ids) - inserted, "alerts": alerts}
 
 
 # --- CONFIGURACIÓN DE CORS ---
@@ -90,34 +217,25 @@ app.add_middleware(
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=["ETag", "Server-Timing"]
 )
+# Último en agregarse = el más externo: la latencia incluye CORS
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 # --- ENDPOINTS DE API PARA TU FRONTEND ---
 @app.delete("/api/expenses/{expense_id}")
 async def delete_expense_api(expense_id: int):
     try:
-        with get_con() as con:
-            cur = con.cursor()
-            # Buscar si el gasto tiene installment_plan_id
-            cur.execute("SELECT installment_plan_id FROM expenses WHERE id = %s", (expense_id,))
-            row = cur.fetchone()
-            if row is None:
-                cur.close()
-                raise HTTPException(status_code=404, detail="Gasto no encontrado")
-            plan_id = row[0]
-            if plan_id:
-                # Eliminar todas las cuotas asociadas
-                cur.execute("DELETE FROM expenses WHERE installment_plan_id = %s", (plan_id,))
-            else:
-                # Eliminar solo el gasto
-                cur.execute("DELETE FROM expenses WHERE id = %s", (expense_id,))
-            con.commit()
-            cur.close()
-        return {"ok": True, "message": "Gasto(s) eliminado(s) correctamente"}
+        # Si el gasto es una cuota se elimina el plan entero (cascada)
+        users = await db_async.delete_expense(expense_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if users is None:
+        raise HTTPException(status_code=404, detail="Gasto no encontrado")
+    await get_read_cache().bump(*users)
+    return {"ok": True, "message": "Gasto(s) eliminado(s) correctamente"}
 
 from fastapi import Body
 
@@ -128,104 +246,599 @@ async def update_expense_api(
     payment_method: str = Body(...)
 ):
     try:
-        with get_con() as con:
-            cur = con.cursor()
-            cur.execute(
-                "UPDATE expenses SET amount = %s, payment_method = %s WHERE id = %s",
-                (amount, payment_method, expense_id)
-            )
-            con.commit()
-            if cur.rowcount == 0:
-                cur.close()
-                raise HTTPException(status_code=404, detail="Gasto no encontrado")
-            cur.close()
-        return {"ok": True, "message": "Gasto actualizado correctamente"}
+        updated, alerts = await db_async.update_expense(expense_id, amount, payment_method)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if updated is None:
+        raise HTTPException(status_code=404, detail="Gasto no encontrado")
+    await get_read_cache().bump(updated)
+    return {"ok": True, "message": "Gasto actualizado correctamente", "alerts": alerts}
+
+
+# --- PLANES DE CUOTAS ---
+@app.get("/api/installment-plans/{plan_id}")
+async def installment_plan_api(plan_id: str):
+    today = datetime.now(BA_TZ).date().isoformat()
+    plan = await db_async.installment_plan(plan_id, today)
+    if plan is None:
+        raise HTTPException(status_code=404, detail="Plan no encontrado")
+    return plan
+
+
+@app.delete("/api/installment-plans/{plan_id}")
+async def delete_installment_plan_api(plan_id: str):
+    try:
+        user_id = await db_async.delete_plan(plan_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="Plan no encontrado")
+    await get_read_cache().bump(user_id)
+    return {"ok": True, "message": "Plan de cuotas eliminado correctamente"}
+
+
+# --- PRESUPUESTOS ---
+# Presupuesto mensual por categoría. Las altas, bajas y modificaciones de
+# gastos devuelven en "alerts" los umbrales (BUDGET_THRESHOLDS, 80 y 100 por
+# defecto) que cruzaron recién; el bot los manda como aviso al usuario.
+class Budget(BaseModel):
+    amount: float
+
+
+def budget_category(category):
+    category = category.strip().lower()
+    if not category:
+        raise HTTPException(status_code=422, detail="Falta la categoría")
+    return category
+
+
+@app.get("/api/users/{user_id}/budgets")
+async def budgets_api(user_id: str, month: Optional[str] = Query(None, description="YYYY-MM, por defecto el actual")):
+    try:
+        start = date.fromisoformat(f"{month}-01") if month else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Mes inválido, usá YYYY-MM")
+    return await db_async.budget_status(user_id, start)
+
+
+# {category:path}: el servidor decodifica %2F antes de rutear, así que una
+# categoría con "/" ("super/almacén") llega partida en varios segmentos
+@app.put("/api/users/{user_id}/budgets/{category:path}")
+async def set_budget_api(user_id: str, category: str, budget: Budget):
+    if budget.amount <= 0:
+        raise HTTPException(status_code=422, detail="El presupuesto tiene que ser mayor a cero")
+    return await db_async.set_budget(user_id, budget_category(category), budget.amount)
+
+
+@app.delete("/api/users/{user_id}/budgets/{category:path}")
+async def delete_budget_api(user_id: str, category: str):
+    if not await db_async.delete_budget(user_id, budget_category(category)):
+        raise HTTPException(status_code=404, detail="No hay presupuesto para esa categoría")
+    return {"ok": True, "message": "Presupuesto eliminado"}
+
+
+# --- ETAGS ---
+# El ETag combina la versión del ledger del usuario (la sube un trigger en cada
+# alta/baja/modificación) con la ruta, los parámetros y el día en BA (los
+# períodos relativos como "current" dependen de la fecha). Si el cliente manda
+# el mismo ETag en If-None-Match se responde 304 sin ejecutar la consulta.
+CACHE_HEADERS = {"Cache-Control": "private, no-cache"}
+
 
+async def _etag(request: Request, user_id: str):
+    version = await db_async.ledger_version(user_id)
+    today = datetime.now(BA_TZ).date().isoformat()
+    key = f"{version}|{request.url.path}|{request.url.query}|{today}"
+    tag = '"' + hashlib.sha1(key.encode()).hexdigest()[:24] + '"'
+    sent = request.headers.get("if-none-match", "")
+    not_modified = tag in [t.strip() for t in sent.split(",")]
+    return tag, not_modified
 
+
+def _not_modified(tag):
+    return Response(status_code=304, headers={"ETag": tag, **CACHE_HEADERS})
+
+
+def _set_etag(response: Response, tag):
+    response.headers["ETag"] = tag
+    response.headers.update(CACHE_HEADERS)
+
+
+# --- CACHÉ DE LECTURAS ---
+# Las respuestas de listados y resúmenes se guardan por usuario (cache.py). La
+# clave es el ETag, que ya incluye la versión del ledger en la base, y el
+# caché suma su propia versión por usuario que suben los endpoints de
+# escritura: después de un alta/baja/modificación nunca se sirve la respuesta
+# vieja, aunque la escritura haya entrado por otro worker.
+async def _cached(user_id, tag, loader):
+    value, _ = await get_read_cache().get_or_load(user_id, tag, loader)
+    return value
+
+
+async def _list_page(user_id, limit, cursor, start=None, end=None, **filters):
+    # start/end son fechas YYYY-MM-DD inclusive, igual que en /summary
+    try:
+        if start or end:
+            start, end = resolve_period(start=start, end=end)
+        return await db_async.list_expenses(user_id, limit, cursor, start, end, **filters)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor o fechas inválidas")
+
+
+# Listado paginado por cursor (keyset sobre ts, id) con filtros del lado del servidor.
+# format=columns devuelve un objeto con una lista por columna (más compacto).
+@app.get("/api/users/{user_id}/expenses")
+async def list_expenses_api(
+    user_id: str,
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    format: Literal["rows", "columns"] = "rows",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    category: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    installment_plan_id: Optional[str] = None,
+):
+    tag, not_modified = await _etag(request, user_id)
+    if not_modified:
+        return _not_modified(tag)
+    _set_etag(response, tag)
+
+    async def load():
+        items, next_cursor = await _list_page(
+            user_id, limit, cursor, start, end, category=category,
+            payment_method=payment_method, installment_plan_id=installment_plan_id,
+        )
+        if format == "columns":
+            names = list(items[0].keys()) if items else []
+            columns = {name: [item[name] for item in items] for name in names}
+            return {"columns": columns, "count": len(items), "next_cursor": next_cursor}
+        return {"items": items, "count": len(items), "next_cursor": next_cursor}
+
+    return await _cached(user_id, tag, load)
+
+
+# Ruta original: mantiene la forma (lista) pero ahora acotada por `limit`.
+# Para recorrer todo el historial usar /api/users/{user_id}/expenses.
 @app.get("/api/expenses/{user_id}")
-async def get_expenses_api(user_id: str):
-    with get_con() as con:
-        cur = con.cursor()
-        cur.execute(
-            "SELECT id, ts as date, amount, category, note as description, user_id, payment_method, installment_plan_id, installment_details "
-            "FROM expenses WHERE user_id = %s ORDER BY ts DESC",
-            (user_id,)
+async def get_expenses_api(user_id: str, request: Request, response: Response,
+                           limit: int = Query(1000, ge=1, le=5000)):
+    tag, not_modified = await _etag(request, user_id)
+    if not_modified:
+        return _not_modified(tag)
+    _set_etag(response, tag)
+
+    async def load():
+        items, _ = await _list_page(user_id, limit, None)
+        return items
+
+    return await _cached(user_id, tag, load)
+
+
+# Búsqueda por texto en categoría, nota y mensaje (prefijos, sin tildes, por
+# relevancia). `cursor` es opaco: se pasa el next_cursor de la respuesta.
+@app.get("/api/users/{user_id}/search")
+async def search_api(
+    user_id: str,
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    category: Optional[str] = None,
+    payment_method: Optional[str] = None,
+):
+    try:
+        offset = int(cursor) if cursor else 0
+        if start or end:
+            start, end = resolve_period(start=start, end=end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor o fechas inválidas")
+    tag, not_modified = await _etag(request, user_id)
+    if not_modified:
+        return _not_modified(tag)
+    _set_etag(response, tag)
+
+    async def load():
+        items, next_offset, mode = await db_async.search_expenses(
+            user_id, q, limit, offset, start, end, category=category, payment_method=payment_method,
         )
-        rows = cur.fetchall()
-        result = [dict(zip([desc[0] for desc in cur.description], row)) for row in rows]
-        cur.close()
-    return result
+        next_cursor = str(next_offset) if next_offset is not None else None
+        return {"items": items, "count": len(items), "next_cursor": next_cursor, "mode": mode}
 
+    return await _cached(user_id, tag, load)
 
 
-# --- Rutas para la web original de Replit (sin cambios) ---
-def period_month():
+# Categorías usadas por el usuario con cantidad y total (desde el rollup)
+@app.get("/api/users/{user_id}/categories")
+async def categories_api(user_id: str, request: Request, response: Response):
+    tag, not_modified = await _etag(request, user_id)
+    if not_modified:
+        return _not_modified(tag)
+    _set_etag(response, tag)
+    return await _cached(user_id, tag, lambda: db_async.categories(user_id))
+
+
+# Sincronización incremental: altas/modificaciones (upserts) y bajas (deleted)
+# posteriores a `since`. Empezar con since=0 y seguir con el `cursor` devuelto
+# mientras has_more sea true. Incluye las bajas en cascada de planes de cuotas.
+@app.get("/api/users/{user_id}/changes")
+async def changes_api(user_id: str, request: Request, response: Response,
+                      since: int = Query(0, ge=0), limit: int = Query(500, ge=1, le=5000)):
+    tag, not_modified = await _etag(request, user_id)
+    if not_modified:
+        return _not_modified(tag)
+    _set_etag(response, tag)
+    return await db_async.changes_since(user_id, since, limit)
+
+
+# Totales agrupados calculados en SQL para los widgets (en vez de bajar todo el historial)
+@app.get("/api/users/{user_id}/summary")
+async def summary_api(
+    user_id: str,
+    request: Request,
+    response: Response,
+    period: Period = "current",
+    group_by: Literal["category", "payment_method", "day", "month"] = "category",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+):
+    try:
+        start, end = resolve_period(period, start, end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Fechas inválidas, usá YYYY-MM-DD")
+    tag, not_modified = await _etag(request, user_id)
+    if not_modified:
+        return _not_modified(tag)
+    _set_etag(response, tag)
+    result = await _cached(user_id, tag, lambda: db_async.summarize(user_id, start, end, group_by, limit))
+    return {"start": start, "end": end, "group_by": group_by, **result}
+
+
+# Resumen compacto del período (lo usa /resumen del bot): total, las `top`
+# categorías y el reparto por medio de pago en una sola consulta
+@app.get("/api/users/{user_id}/digest")
+async def digest_api(
+    user_id: str,
+    request: Request,
+    response: Response,
+    period: Period = "current",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    top: int = Query(5, ge=1, le=50),
+):
+    try:
+        start, end = resolve_period(period, start, end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Fechas inválidas, usá YYYY-MM-DD")
+    tag, not_modified = await _etag(request, user_id)
+    if not_modified:
+        return _not_modified(tag)
+    _set_etag(response, tag)
+    result = await _cached(user_id, tag, lambda: db_async.digest(user_id, start, end, top))
+    return {"start": start, "end": end, **result}
+
+
+# Serie de tiempo lista para graficar: un arreglo por métrica, todos los
+# buckets del período (con 0 donde no hubo gastos), media móvil de `window`
+# buckets y diferencia con el bucket anterior. `totals` compara el período con
+# el anterior de la misma duración (no aplica a period=all).
+@app.get("/api/users/{user_id}/timeseries")
+async def timeseries_api(
+    user_id: str,
+    request: Request,
+    response: Response,
+    period: Period = "current",
+    granularity: Literal["day", "week", "month"] = "day",
+    breakdown: Optional[Literal["category", "payment_method"]] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    window: int = Query(7, ge=1, le=90),
+    top: int = Query(8, ge=1, le=50),
+):
+    try:
+        start, end = resolve_period(period, start, end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Fechas inválidas, usá YYYY-MM-DD")
+    tag, not_modified = await _etag(request, user_id)
+    if not_modified:
+        return _not_modified(tag)
+    _set_etag(response, tag)
+
+    async def load():
+        start_d, end_d = date.fromisoformat(start), date.fromisoformat(end)
+        # Sin fecha de inicio (period=all) no hay período anterior
+        previous = (start_d - (end_d - start_d)).isoformat() if start_d > date(1970, 1, 1) else None
+        # Los extremos abiertos de resolve_period se recortan a los gastos existentes
+        open_start = None if start_d <= date(1970, 1, 1) else start
+        open_end = None if end_d >= date(2100, 1, 1) else end
+        try:
+            series, total, previous_total = await asyncio.gather(
+                db_async.timeseries(user_id, open_start, open_end, granularity, breakdown, window, top),
+                db_async.sum_by_period(user_id, start, end),
+                db_async.sum_by_period(user_id, previous, start) if previous else asyncio.sleep(0),
+            )
+        except ValueError:
+            raise HTTPException(status_code=400, detail="El período tiene demasiados buckets para esa granularidad")
+        if series is None:
+            series = {"start": start, "end": end, "buckets": [], "series": []}
+        delta = round(total - previous_total, 2) if previous else None
+        return {
+            **series,
+            "granularity": granularity,
+            "breakdown": breakdown,
+            "window": window,
+            "totals": {
+                "total": total,
+                "previous_total": previous_total if previous else None,
+                "delta": delta,
+                "delta_pct": round(delta / previous_total * 100, 1) if previous and previous_total else None,
+            },
+        }
+
+    return await _cached(user_id, tag, load)
+
+
+async def _timed(timings, name, coro):
+    t0 = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        timings[name] = round((time.perf_counter() - t0) * 1000, 2)
+
+
+# Próxima cuota de cada plan y total comprometido por mes para los próximos
+# `months` meses (incluido el actual)
+@app.get("/api/users/{user_id}/installments")
+async def installments_api(user_id: str, request: Request, response: Response,
+                           months: int = Query(12, ge=1, le=60), limit: int = Query(20, ge=1, le=100)):
+    tag, not_modified = await _etag(request, user_id)
+    if not_modified:
+        return _not_modified(tag)
+    _set_etag(response, tag)
     today = datetime.now(BA_TZ).date()
-    start = today.replace(day=1).isoformat()
-    end = today.isoformat()
-    return start, end
+    until = (today.replace(day=1) + relativedelta(months=months)).isoformat()
+
+    async def load():
+        upcoming, commitments = await asyncio.gather(
+            db_async.upcoming_installments(user_id, today.isoformat(), limit),
+            db_async.installment_commitments(user_id, today.isoformat(), until),
+        )
+        return {"upcoming": upcoming, "commitments": commitments}
+
+    return await _cached(user_id, tag, load)
+
+
+# Todo lo que necesita la pestaña de inicio en un solo pedido. Las consultas
+# corren en paralelo (cada una con su conexión del pool) y se informa cuánto
+# tardó cada sección en el cuerpo y en el header Server-Timing.
+@app.get("/api/users/{user_id}/home")
+async def home_bundle_api(user_id: str, request: Request, response: Response, period: Period = "current",
+                          recent_limit: int = Query(6, ge=1, le=50),
+                          installments_limit: int = Query(10, ge=1, le=50)):
+    tag, not_modified = await _etag(request, user_id)
+    if not_modified:
+        return _not_modified(tag)
+    _set_etag(response, tag)
+
+    t0 = time.perf_counter()
+    bundle, hit = await get_read_cache().get_or_load(
+        user_id, tag, lambda: _home_bundle(user_id, period, recent_limit, installments_limit),
+    )
+    if hit:
+        # Los tiempos guardados son los de la consulta original
+        bundle = {**bundle, "timings_ms": {"cache": round((time.perf_counter() - t0) * 1000, 2)}}
+    response.headers["Server-Timing"] = ", ".join(f"{name};dur={ms}" for name, ms in bundle["timings_ms"].items())
+    return bundle
+
 
+async def _home_bundle(user_id, period, recent_limit, installments_limit):
+    month_start, month_end = resolve_period("current")
+    prev_start, prev_end = resolve_period("last")
+    start, end = resolve_period(period)
+    today = datetime.now(BA_TZ).date().isoformat()
+
+    timings = {}
+    t0 = time.perf_counter()
+    month, previous, categories, payments, recent, installments = await asyncio.gather(
+        _timed(timings, "month", db_async.summarize(user_id, month_start, month_end, "category")),
+        _timed(timings, "previous_month", db_async.summarize(user_id, prev_start, prev_end, "category", limit=1)),
+        _timed(timings, "categories", db_async.summarize(user_id, start, end, "category")),
+        _timed(timings, "payment_methods", db_async.summarize(user_id, start, end, "payment_method")),
+        _timed(timings, "recent", db_async.recent_expenses(user_id, month_start, month_end, recent_limit)),
+        _timed(timings, "installments", db_async.upcoming_installments(user_id, today, installments_limit)),
+    )
+    timings["total"] = round((time.perf_counter() - t0) * 1000, 2)
+
+    delta = round(month["total"] - previous["total"], 2)
+    return {
+        "month": {
+            "start": month_start,
+            "end": month_end,
+            "total": month["total"],
+            "count": month["count"],
+            "previous_total": previous["total"],
+            "delta": delta,
+            "delta_pct": round(delta / previous["total"] * 100, 1) if previous["total"] else None,
+        },
+        "period": {"start": start, "end": end},
+        "categories": categories["groups"],
+        "payment_methods": payments["groups"],
+        "recent": recent,
+        "installments": installments,
+        "timings_ms": timings,
+    }
+
+
+def export_filename(start, end, whole_history, format, gzip):
+    # start/end: fechas ISO con fin exclusivo
+    last_day = (date.fromisoformat(end) - timedelta(days=1)).isoformat()
+    prefix = "gastos_completo" if whole_history else f"gastos_{start}_a_{last_day}"
+    return export.filename(prefix, format, gzip)
+
+
+# Exportación en streaming (cursor del lado del servidor, memoria acotada)
+@app.get("/api/users/{user_id}/export")
+async def export_api(
+    user_id: str,
+    format: Literal["csv", "jsonl", "parquet"] = "csv",
+    period: Period = "all",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    gzip: bool = False,
+):
+    whole_history = period == "all" and not (start or end)
+    try:
+        start, end = resolve_period(period, start, end)
+        export.check_format(format)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Fechas inválidas, usá YYYY-MM-DD")
+    except export.ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filename = export_filename(start, end, whole_history, format, gzip)
+    return StreamingResponse(
+        export.export_stream(user_id, start, end, format, gzip),
+        media_type=export.media_type(format, gzip),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+# --- IMPORTACIÓN DE EXTRACTOS ---
+@app.get("/api/import/profiles")
+async def import_profiles_api():
+    return {
+        name: {"columns": profile["columns"], "delimiter": profile.get("delimiter", ",")}
+        for name, profile in importer.profiles().items()
+    }
+
+
+# El cuerpo es el CSV crudo (Content-Type: text/csv). Primero se vuelca
+# completo (importer.spool_upload) y después se importa en streaming: la
+# respuesta NDJSON con el progreso y los errores por fila (ver importer.py)
+# empieza recién con el archivo entero, porque StreamingResponse escucha si el
+# cliente se desconecta leyendo del mismo canal que el cuerpo.
+@app.post("/api/users/{user_id}/import")
+async def import_api(user_id: str, request: Request, profile: str = "generico", category: str = "otros"):
+    try:
+        config = importer.get_profile(profile)
+    except importer.StatementError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        file, size = await importer.spool_upload(request.stream())
+    except importer.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if not size:
+        file.close()
+        raise HTTPException(status_code=400, detail="El archivo está vacío")
+    return StreamingResponse(
+        importer.import_stream(user_id, file, size, config, category.strip().lower() or "otros"),
+        media_type="application/x-ndjson",
+    )
+
+
+@app.get("/api/db/pool")
+async def pool_stats_api():
+    return {"sync": pool_stats(), "async": db_async.pool_stats()}
+
+
+@app.get("/api/cache/stats")
+async def cache_stats_api():
+    return get_read_cache().stats()
+
+
+# Updates de Telegram en modo webhook: se valida el token secreto y se encolan;
+# las procesa el pool de workers de webhook.WebhookBot. Con la cola llena se
+# responde 503 y Telegram reintenta más tarde.
+@app.post(TELEGRAM_WEBHOOK_PATH, include_in_schema=False)
+async def telegram_webhook(request: Request,
+                           x_telegram_bot_api_secret_token: Optional[str] = Header(None)):
+    bot = getattr(app.state, "bot", None)
+    if bot is None:
+        raise HTTPException(status_code=404, detail="El bot no está en modo webhook")
+    if not bot.check_secret(x_telegram_bot_api_secret_token):
+        raise HTTPException(status_code=403, detail="Token secreto inválido")
+    try:
+        accepted = bot.submit(await request.json())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Update inválida")
+    if not accepted:
+        raise HTTPException(status_code=503, detail="Cola del bot llena", headers={"Retry-After": "5"})
+    return {"ok": True}
+
+
+# Liveness: el proceso responde; no consulta la base (un corte de Postgres
+# no tiene que hacer que se reinicien los workers)
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    return {"ok": True}
+
+
+# Readiness: arranque terminado, Postgres responde y tiene todas las
+# migraciones de este deploy. Es el health check del servicio en Render.
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    if not getattr(app.state, "ready", False):
+        return JSONResponse({"ok": False, "error": "arrancando"}, status_code=503)
+    try:
+        # wait_for cubre también abrir el pool si todavía no existe
+        version = await asyncio.wait_for(db_async.schema_version(), READY_TIMEOUT)
+    except Exception as e:
+        return JSONResponse({"ok": False, "error": f"base de datos: {type(e).__name__}"}, status_code=503)
+    expected = latest_migration()
+    if expected is not None and (version is None or version < expected):
+        return JSONResponse({"ok": False, "error": "migraciones pendientes", "schema": version, "expected": expected},
+                            status_code=503)
+    return {"ok": True, "schema": version, "pool": db_async.pool_stats()}
+
+
+@metrics.REGISTRY.collector
+def _pool_metrics():
+    lines = ["# HELP db_pool_connections Conexiones de los pools a Postgres",
+             "# TYPE db_pool_connections gauge"]
+    for driver, stats in (("psycopg2", pool_stats()), ("asyncpg", db_async.pool_stats())):
+        for state in ("open", "in_use"):
+            lines.append(f'db_pool_connections{{driver="{driver}",state="{state}"}} {stats[state]}')
+    return "\n".join(lines)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_api():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# --- Rutas para la web original de Replit (sin cambios) ---
 @app.get("/")
 async def dashboard(request: Request):
     start, end = period_month()
-    with get_con() as con:
-        cur = con.cursor()
-        cur.execute("SELECT COALESCE(SUM(amount),0) FROM expenses WHERE ts BETWEEN %s AND %s", (start, end))
-        total = float(cur.fetchone()[0] or 0.0)
-        cur.execute("SELECT id, ts, amount, currency, category, note FROM expenses WHERE ts BETWEEN %s AND %s ORDER BY ts DESC, id DESC", (start, end))
-        rows = [dict(zip([desc[0] for desc in cur.description], r)) for r in cur.fetchall()]
-        cur.close()
-    category_breakdown = {}
-    for row in rows:
-        cat = row["category"]
-        amt = float(row["amount"])
-        category_breakdown[cat] = category_breakdown.get(cat, 0.0) + amt
-    breakdown = []
-    if total > 0:
-        for cat, amt in sorted(category_breakdown.items(), key=lambda x: x[1], reverse=True):
-            pct = (amt / total) * 100
-            breakdown.append({"category": cat, "amount": amt, "percentage": round(pct, 1)})
-    return templates.TemplateResponse("index.html", {"request": request, "total": total, "breakdown": breakdown, "movements": rows, "start": start, "end": end})
+    # Total y desglose salen de la misma agregación (rollup + bordes), ya
+    # ordenados por monto; no se vuelve a sumar en Python
+    summary, rows = await asyncio.gather(
+        db_async.summarize(None, start, end, "category"),
+        db_async.movements_between(start, end),
+    )
+    total = summary["total"]
+    breakdown = [
+        {"category": g["key"], "amount": g["total"], "percentage": round(g["total"] / total * 100, 1)}
+        for g in summary["groups"]
+    ] if total > 0 else []
+    return templates().TemplateResponse("index.html", {"request": request, "total": total, "breakdown": breakdown, "movements": rows, "start": start, "end": datetime.now(BA_TZ).date().isoformat()})
 
 @app.post("/add")
 async def add_expense(amount: float = Form(...), category: str = Form(...), note: Optional[str] = Form(None), date: Optional[str] = Form(None)):
     # Normalizar timestamp a BA_TZ y agregar hora si solo viene fecha
-    from datetime import datetime
-    import pytz
-    BA_TZ = pytz.timezone("America/Argentina/Buenos_Aires")
-    if not date:
-        ba_now = datetime.now(BA_TZ)
-        dt = ba_now
-    else:
-        if 'T' not in date:
-            ba_now = datetime.now(BA_TZ)
-            dt = datetime.combine(datetime.fromisoformat(date), ba_now.time())
-            dt = BA_TZ.localize(dt)
-        else:
-            dt = datetime.fromisoformat(date)
-            if dt.tzinfo is None:
-                dt = BA_TZ.localize(dt)
-            else:
-                dt = dt.astimezone(BA_TZ)
-    ts_final = dt.isoformat()
-    insert_expense(user_id="web", ts=ts_final, amount=amount, currency="ARS", category=category, note=note or "", raw_msg=f"web:{amount}:{category}")
+    await db_async.insert_expense(user_id="web", ts=normalize_ts(date), amount=amount, currency="ARS", category=category, note=note or "", raw_msg=f"web:{amount}:{category}")
+    await get_read_cache().bump("web")
     return RedirectResponse(url="/", status_code=303)
 
 @app.get("/export")
 async def export_csv():
     start, end = period_month()
-    with get_con() as con:
-        cur = con.cursor()
-        cur.execute("SELECT id, ts, amount, currency, category, note FROM expenses WHERE ts BETWEEN %s AND %s ORDER BY ts ASC, id ASC", (start, end))
-        rows = [dict(zip([desc[0] for desc in cur.description], r)) for r in cur.fetchall()]
-        cur.close()
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["id", "ts", "amount", "currency", "category", "note"])
-    for r in rows:
-        writer.writerow([r["id"], r["ts"], r["amount"], r["currency"], r["category"], r["note"] or ""])
-    output.seek(0)
-    filename = f"gastos_{start}_a_{end}.csv"
-    return StreamingResponse(iter([output.read()]), media_type="text/csv", headers={"Content-Disposition": f'attachment; filename="{filename}"'})
\ No newline at end of file
+    today = datetime.now(BA_TZ).date().isoformat()
+    filename = export.filename(f"gastos_{start}_a_{today}", "csv")
+    return StreamingResponse(export.export_stream(None, start, end, "csv"), media_type="text/csv",
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
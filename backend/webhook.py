@@ -0,0 +1,225 @@
+# Modo webhook del bot: Telegram manda cada update a POST /telegram/webhook
+# de la app FastAPI, en lugar de que main.py haga polling en otro proceso.
+#
+#   BOT_MODE=webhook                activa el modo (webapp arranca el bot al iniciar)
+#   TELEGRAM_WEBHOOK_SECRET=…       obligatorio; Telegram lo manda en el header
+#                                   X-Telegram-Bot-Api-Secret-Token de cada pedido
+#   TELEGRAM_WEBHOOK_URL=https://…  si está, se registra el webhook al arrancar
+#   BOT_WEBHOOK_WORKERS=8           updates procesadas a la vez
+#   BOT_WEBHOOK_QUEUE=256           updates en espera; con la cola llena el
+#                                   endpoint responde 503 y Telegram reintenta
+#   BOT_OFFLINE=1                   no habla con Telegram: las llamadas a la Bot
+#                                   API se responden acá y se registran (pruebas
+#                                   con updates grabadas, bench.webhook_replay)
+#
+# Los handlers son los de main.py, pero en vez de ApiClient (HTTP contra
+# API_URL) usan LocalApi, que llama a db_async en el mismo proceso. El orden
+# por usuario lo sigue dando PerUserUpdateProcessor. Polling queda como
+# respaldo: `python main.py` borra el webhook al arrancar.
+#
+# Con varios workers de gunicorn cada proceso tiene su propia cola; el
+# outbox se comparte (mismo SQLite) y las claves de idempotencia evitan
+# duplicados si dos procesos mandan la misma entrada.
+import asyncio
+import hmac
+import json
+import logging
+import os
+import time
+
+from pydantic import ValidationError
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest
+
+import db_async
+import export
+import main as bot_handlers
+from api_client import ApiError
+from cache import get_read_cache
+from webapp import MAX_BATCH, Expense, export_filename, normalize_ts, resolve_period
+
+WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "")
+WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "")
+WORKERS = int(os.getenv("BOT_WEBHOOK_WORKERS", "8"))
+QUEUE_SIZE = int(os.getenv("BOT_WEBHOOK_QUEUE", "256"))
+OFFLINE = os.getenv("BOT_OFFLINE", "") not in ("", "0")
+
+log = logging.getLogger("gastos.bot")
+
+
+# --- CAPA DE DATOS EN PROCESO ---
+class LocalApi:
+    # La parte de ApiClient que usan el bot y el outbox, sin HTTP. Los errores
+    # salen como ApiError con el mismo status que daría la API, así el outbox
+    # distingue igual los rechazos (4xx, no se reintentan) de las fallas.
+    async def close(self):
+        pass
+
+    async def create_expenses(self, expenses):
+        if not 1 <= len(expenses) <= MAX_BATCH:
+            raise ApiError(f"El lote debe tener entre 1 y {MAX_BATCH} gastos", 422)
+        try:
+            rows = []
+            for data in expenses:
+                row = Expense(**data).dict()
+                row["ts"] = normalize_ts(row["ts"])
+                rows.append(row)
+        except ValidationError as e:
+            raise ApiError(f"Gasto inválido: {e.errors()[0]['msg']}", 422) from e
+        except ValueError as e:
+            raise ApiError(f"Fecha inválida: {e}", 422) from e
+        try:
+            ids, inserted, alerts = await db_async.insert_expenses(rows)
+        except Exception as e:
+            raise ApiError(str(e), 500) from e
+        if inserted:
+            await get_read_cache().bump(*(row["user_id"] for row in rows))
+        return {"ok": True, "ids": ids, "count": len(ids), "duplicates": len(ids) - inserted, "alerts": alerts}
+
+    async def digest(self, user_id, start, end, top=5, timeout=None):
+        # El límite de tiempo lo pone el handler con asyncio.wait_for
+        result = await db_async.digest(user_id, start, end, top)
+        return {"start": start, "end": end, **result}
+
+    async def budgets(self, user_id):
+        return await db_async.budget_status(user_id)
+
+    async def set_budget(self, user_id, category, amount):
+        return await db_async.set_budget(user_id, category, amount)
+
+    async def delete_budget(self, user_id, category):
+        if not await db_async.delete_budget(user_id, category):
+            raise ApiError("No hay presupuesto para esa categoría", 404)
+        return {"ok": True, "message": "Presupuesto eliminado"}
+
+    async def export(self, user_id, fileobj, fmt="csv", start=None, end=None, max_bytes=None):
+        whole_history = start is None
+        if whole_history:
+            start, end = resolve_period("all")
+        size = 0
+        async for chunk in export.export_stream(user_id, start, end, fmt, gzip=True):
+            size += len(chunk)
+            if max_bytes is not None and size > max_bytes:
+                raise ApiError(f"El archivo supera el máximo de {max_bytes // (1024 * 1024)} MB")
+            fileobj.write(chunk)
+        return size, export_filename(start, end, whole_history, fmt, True)
+
+
+# --- BOT API SIN RED ---
+class OfflineRequest(BaseRequest):
+    # Responde las llamadas a la Bot API localmente y las guarda en `calls`
+    # (método, chat y texto). Alcanza para getMe, sendMessage, sendDocument,
+    # sendChatAction y setWebhook, que es lo que usa el bot.
+    def __init__(self):
+        self.calls = []
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+        call = {"method": endpoint, "chat_id": params.get("chat_id"), "text": params.get("text") or params.get("caption")}
+        self.calls.append(call)
+        log.info("bot api (offline)", extra=call)
+        if endpoint == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Gastos", "username": "gastos_offline_bot"}
+        elif endpoint.startswith("send") and endpoint != "sendChatAction":
+            self._message_id += 1
+            result = {
+                "message_id": self._message_id, "date": int(time.time()),
+                "chat": {"id": params.get("chat_id"), "type": "private"},
+                "text": params.get("text"),
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+# --- WEBHOOK ---
+class WebhookBot:
+    def __init__(self, token, secret, workers=WORKERS, queue_size=QUEUE_SIZE, url=WEBHOOK_URL, offline=OFFLINE):
+        if not secret:
+            raise RuntimeError("BOT_MODE=webhook requiere TELEGRAM_WEBHOOK_SECRET")
+        self.secret = secret
+        self.url = url
+        self.workers = workers
+        self.request = OfflineRequest() if offline else None
+        builder = (
+            Application.builder()
+            .token(token or "0:offline")
+            .updater(None)
+            .concurrent_updates(bot_handlers.PerUserUpdateProcessor(workers))
+        )
+        if self.request is not None:
+            builder = builder.request(self.request)
+        self.app = builder.build()
+        bot_handlers.add_handlers(self.app)
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks = []
+
+    @classmethod
+    def from_env(cls):
+        return cls(bot_handlers.TOKEN, WEBHOOK_SECRET)
+
+    async def start(self):
+        await self.app.initialize()
+        await bot_handlers.start_services(self.app, LocalApi())
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        if self.url:
+            await self.app.bot.set_webhook(
+                self.url, secret_token=self.secret, allowed_updates=["message"], max_connections=self.workers,
+            )
+        log.info("bot en modo webhook", extra={"workers": self.workers, "queue": self.queue.maxsize,
+                                               "offline": self.request is not None})
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await bot_handlers.post_shutdown(self.app)
+        await self.app.shutdown()
+
+    def check_secret(self, token):
+        return hmac.compare_digest((token or "").encode(), self.secret.encode())
+
+    def submit(self, payload):
+        # False si la cola está llena; ValueError si el cuerpo no es una update
+        if not isinstance(payload, dict) or "update_id" not in payload:
+            raise ValueError("update inválida")
+        try:
+            update = Update.de_json(payload, self.app.bot)
+        except (TypeError, AttributeError, KeyError) as e:
+            # p. ej. {"update_id": 1, "message": "x"}: un 500 haría que
+            # Telegram la reintente para siempre
+            raise ValueError(f"update inválida: {e}") from e
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def join(self):
+        # Espera a que se procesen todas las updates encoladas
+        await self.queue.join()
+
+    async def _work(self):
+        processor = self.app.update_processor
+        while True:
+            update = await self.queue.get()
+            try:
+                await processor.process_update(update, self.app.process_update(update))
+            except Exception:
+                log.exception("error procesando una update", extra={"update_id": update.update_id})
+            finally:
+                self.queue.task_done()
@@ -1,11 +1,10 @@
 import { useState, useEffect } from 'react';
-import axios from 'axios';
 import { Card } from "@/components/ui/card";
-import { PieChart, Pie, Cell, ResponsiveContainer, BarChart, Bar, XAxis, YAxis, Tooltip } from 'recharts';
-import { Transaction, CategorySpending } from "@/types";
+import { PieChart, Pie, Cell, ResponsiveContainer, ComposedChart, Bar, Line, XAxis, YAxis, Tooltip } from 'recharts';
+import { CategorySpending } from "@/types";
 import { getCategoryColor } from "@/utils/categoryColors";
-import { format, parseISO, isWithinInterval, startOfMonth, endOfMonth, subMonths, subDays } from 'date-fns';
-import { es } from 'date-fns/locale';
+import { format, parseISO } from 'date-fns';
+import { fetchSummary, fetchTimeseries } from "@/lib/api";
 
 type ChartContainerProps = {
   selectedPeriod: "current" | "last" | "90days";
@@ -14,6 +13,7 @@ type ChartContainerProps = {
 interface DailyData {
   date: string;
   amount: number;
+  average: number;
 }
 
 export const ChartContainer: React.FC<ChartContainerProps> = ({ selectedPeriod }) => {
@@ -23,62 +23,32 @@ export const ChartContainer: React.FC<ChartContainerProps> = ({ selectedPeriod }
   const isDarkMode = false; // Ajusta según tu lógica de dark mode
 
   useEffect(() => {
-  const API_URL = "https://entrega-topicos-backend.onrender.com/api/expenses/8323618720";
     const fetchDataAndProcess = async () => {
       setLoading(true);
       try {
-        const response = await axios.get<Transaction[]>(API_URL);
-        const allTransactions = response.data;
+        // El backend filtra por período y agrupa; acá solo se da formato
+        const [byCategory, byDay] = await Promise.all([
+          fetchSummary(selectedPeriod, "category"),
+          fetchTimeseries(selectedPeriod, "day"),
+        ]);
 
-        // --- LÓGICA PARA FILTRAR POR FECHA ---
-        const now = new Date();
-        let start: Date, end: Date;
-
-        if (selectedPeriod === 'current') {
-          start = startOfMonth(now); end = endOfMonth(now);
-        } else if (selectedPeriod === 'last') {
-          const lastMonth = subMonths(now, 1);
-          start = startOfMonth(lastMonth); end = endOfMonth(lastMonth);
-        } else { // 90days
-          start = subDays(now, 90); end = now;
-        }
-
-        const filteredTxs = allTransactions.filter(t => 
-            isWithinInterval(parseISO(t.date), { start, end })
-        );
-        // --- FIN DEL FILTRADO ---
-
-        // Lógica para el gráfico de torta (usa filteredTxs)
-        const categoryTotals: Record<string, number> = {};
-        let grandTotal = 0;
-        filteredTxs.forEach(t => {
-          categoryTotals[t.category] = (categoryTotals[t.category] || 0) + t.amount;
-          grandTotal += t.amount;
-        });
-        const processedCategoryData = Object.entries(categoryTotals)
-          .map(([category, amount]) => ({
-            category,
-            amount,
-            percentage: grandTotal > 0 ? Math.round((amount / grandTotal) * 100) : 0,
-            color: getCategoryColor(category)
-          }))
-          .sort((a, b) => b.amount - a.amount);
+        // Gráfico de torta (ya viene ordenado por monto)
+        const grandTotal = byCategory.total;
+        const processedCategoryData = byCategory.groups.map(group => ({
+          category: group.key as string,
+          amount: group.total,
+          percentage: grandTotal > 0 ? Math.round((group.total / grandTotal) * 100) : 0,
+          color: getCategoryColor(group.key as string)
+        }));
         setCategoryData(processedCategoryData);
 
-        // Lógica para el gráfico de barras (usa filteredTxs y ordena correctamente)
-        const dailyTotals: Record<string, number> = {};
-        filteredTxs.forEach(t => {
-          const day = format(parseISO(t.date), "dd/MM");
-          dailyTotals[day] = (dailyTotals[day] || 0) + t.amount;
-        });
-        const processedDailyData = Object.entries(dailyTotals)
-          .map(([date, amount]) => ({ date, amount }))
-          .sort((a, b) => {
-            const [dayA, monthA] = a.date.split('/');
-            const [dayB, monthB] = b.date.split('/');
-            if (monthA !== monthB) return Number(monthA) - Number(monthB);
-            return Number(dayA) - Number(dayB);
-          });
+        // Gráfico de barras: todos los días del período (0 si no hubo gastos) y media móvil
+        const series = byDay.series[0];
+        const processedDailyData = byDay.buckets.map((bucket, i) => ({
+          date: format(parseISO(bucket), "dd/MM"),
+          amount: series ? series.total[i] : 0,
+          average: series ? series.rolling_avg[i] : 0,
+        }));
         setDailyData(processedDailyData);
 
       } catch (error) {
@@ -123,7 +93,7 @@ export const ChartContainer: React.FC<ChartContainerProps> = ({ selectedPeriod }
       <Card className="p-4 shadow-soft dark:bg-slate-800">
         <h4 className="font-semibold mb-4 text-center dark:text-slate-200">Gasto por Día</h4>
         <ResponsiveContainer width="100%" height={300}>
-          <BarChart data={dailyData}>
+          <ComposedChart data={dailyData}>
             <XAxis dataKey="date" stroke="#888888" fontSize={12} />
             <YAxis stroke="#888888" fontSize={12} tickFormatter={(value) => `$${value/1000}k`} />
             <Tooltip
@@ -133,6 +103,7 @@ export const ChartContainer: React.FC<ChartContainerProps> = ({ selectedPeriod }
                     <div style={{ background: 'rgba(255,255,255,0.95)', color: '#222', border: 'none', boxShadow: 'none', padding: 8, fontWeight: 500, borderRadius: 6 }}>
                       <div>{label}</div>
                       <div>Total : ${payload[0].value.toLocaleString('es-AR')}</div>
+                      {payload[1] && <div>Promedio 7 días : ${payload[1].value.toLocaleString('es-AR')}</div>}
                     </div>
                   );
                 }
@@ -141,7 +112,8 @@ export const ChartContainer: React.FC<ChartContainerProps> = ({ selectedPeriod }
               cursor={{ fill: 'transparent' }}
             />
             <Bar dataKey="amount" fill="hsl(var(--primary))" radius={[4, 4, 0, 0]} />
-          </BarChart>
+            <Line dataKey="average" type="monotone" stroke="#f59e0b" strokeWidth={2} dot={false} />
+          </ComposedChart>
         </ResponsiveContainer>
       </Card>
     </div>
@@ -1,8 +1,7 @@
 import { useState, useEffect } from 'react';
-import axios from 'axios';
 import { Input } from "@/components/ui/input";
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select";
-import { Transaction } from "@/types";
+import { fetchCategories } from "@/lib/api";
 
 interface SearchFiltersProps {
   searchTerm: string;
@@ -26,30 +25,23 @@ export const SearchFilters = ({
   const [availableCategories, setAvailableCategories] = useState<string[]>([]);
   
   useEffect(() => {
-    // Pega aquí la URL de tu API con tu ID de Telegram
-  const API_URL = "https://entrega-topicos-backend.onrender.com/api/expenses/8323618720";
-    
-    const fetchCategories = async () => {
+    const loadCategories = async () => {
       try {
-        const response = await axios.get<Transaction[]>(API_URL);
-        const transactions = response.data;
-        
-        // Creamos una lista de categorías únicas a partir de todas las transacciones
-        const uniqueCategories = [...new Set(transactions.map(t => t.category))];
-        setAvailableCategories(uniqueCategories.sort());
-        
+        // El backend devuelve las categorías distintas (desde el rollup mensual)
+        const categories = await fetchCategories();
+        setAvailableCategories(categories.map(c => c.category).sort());
       } catch (error) {
         console.error("Error al obtener las categorías para los filtros:", error);
       }
     };
     
-    fetchCategories();
+    loadCategories();
   }, []); // Se ejecuta solo una vez
 
   return (
     <div className="grid md:grid-cols-3 gap-4">
       <Input
-        placeholder="Buscar por descripción..."
+        placeholder="Buscar por descripción o categoría..."
         value={searchTerm}
         onChange={(e) => onSearchChange(e.target.value)}
       />
@@ -74,10 +66,11 @@ export const SearchFilters = ({
         </SelectTrigger>
         <SelectContent>
           <SelectItem value="all">Todos los medios</SelectItem>
-          <SelectItem value="credit">Crédito</SelectItem>
-          <SelectItem value="debit">Débito</SelectItem>
-          <SelectItem value="cash">Efectivo</SelectItem>
-          <SelectItem value="transfer">Transferencia</SelectItem>
+          {/* Los valores coinciden con los que guarda el bot (parser.PAYMENT_METHODS) */}
+          <SelectItem value="credito">Crédito</SelectItem>
+          <SelectItem value="debito">Débito</SelectItem>
+          <SelectItem value="efectivo">Efectivo</SelectItem>
+          <SelectItem value="transferencia">Transferencia</SelectItem>
         </SelectContent>
       </Select>
     </div>
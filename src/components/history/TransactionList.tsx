@@ -1,7 +1,8 @@
 import { useState, useEffect } from 'react';
 import axios from 'axios';
 import { Transaction } from "@/types";
-import { format, parseISO, isFuture } from "date-fns";
+import { API_BASE_URL, fetchExpensesPage, searchExpenses } from "@/lib/api";
+import { format, parseISO } from "date-fns";
 import { es } from "date-fns/locale";
 import { Button } from "@/components/ui/button";
 import { Trash2, Pencil } from "lucide-react";
@@ -11,26 +12,51 @@ import { Dialog, DialogTrigger, DialogContent, DialogHeader, DialogFooter } from
 import { Input } from "@/components/ui/input";
 import { Select, SelectTrigger, SelectValue, SelectContent, SelectItem } from "@/components/ui/select";
 
-export const TransactionList = () => {
+const PAGE_SIZE = 50;
+const SEARCH_DEBOUNCE_MS = 300;
+
+interface TransactionListProps {
+  searchTerm?: string;
+  selectedCategory?: string;
+  selectedPayment?: string;
+}
+
+export const TransactionList = ({ searchTerm = "", selectedCategory = "all", selectedPayment = "all" }: TransactionListProps) => {
   const [editTx, setEditTx] = useState<Transaction | null>(null);
   const [editAmount, setEditAmount] = useState("");
   const [editPayment, setEditPayment] = useState("");
   const [saving, setSaving] = useState(false);
   const [transactions, setTransactions] = useState<Transaction[]>([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [query, setQuery] = useState(searchTerm.trim());
+
+  // La búsqueda va al backend: se espera a que el usuario deje de tipear
+  useEffect(() => {
+    const timer = setTimeout(() => setQuery(searchTerm.trim()), SEARCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  // Filtros que resuelve el backend: hasta hoy (sin cuotas futuras), categoría y medio de pago
+  const buildQuery = (cursor: string | null = null) => ({
+    cursor,
+    limit: PAGE_SIZE,
+    end: format(new Date(), "yyyy-MM-dd"),
+    category: selectedCategory !== "all" ? selectedCategory : undefined,
+    payment_method: selectedPayment !== "all" ? selectedPayment : undefined,
+  });
 
-  // --- CONFIGURACIÓN ---
-  const API_BASE_URL = "https://entrega-topicos-backend.onrender.com";
-  const USER_ID = '8323618720';
-  // --------------------
+  const fetchPage = (cursor: string | null = null) =>
+    query ? searchExpenses(query, buildQuery(cursor)) : fetchExpensesPage(buildQuery(cursor));
 
   useEffect(() => {
     const fetchTransactions = async () => {
+      setLoading(true);
       try {
-        const response = await axios.get<Transaction[]>(`${API_BASE_URL}/api/expenses/${USER_ID}`);
-        const allTransactions = response.data;
-        const pastAndPresentTxs = allTransactions.filter(t => !isFuture(parseISO(t.date)));
-        setTransactions(pastAndPresentTxs);
+        const page = await fetchPage();
+        setTransactions(page.items);
+        setNextCursor(page.next_cursor);
       } catch (error) {
         console.error("Error al obtener el historial:", error);
         toast.error("No se pudo cargar el historial.");
@@ -39,7 +65,22 @@ export const TransactionList = () => {
       }
     };
     fetchTransactions();
-  }, []);
+  }, [query, selectedCategory, selectedPayment]);
+
+  const handleLoadMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const page = await fetchPage(nextCursor);
+      setTransactions(current => [...current, ...page.items]);
+      setNextCursor(page.next_cursor);
+    } catch (error) {
+      console.error("Error al obtener más movimientos:", error);
+      toast.error("No se pudieron cargar más movimientos.");
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   const handleDelete = async (id: string) => {
     if (!window.confirm("¿Estás seguro de que quieres eliminar este gasto?")) { return; }
@@ -166,6 +207,13 @@ export const TransactionList = () => {
           </div>
         );
       })}
+      {nextCursor && (
+        <div className="flex justify-center">
+          <Button variant="outline" disabled={loadingMore} onClick={handleLoadMore}>
+            {loadingMore ? "Cargando..." : "Cargar más"}
+          </Button>
+        </div>
+      )}
     </div>
   );
 };
\ No newline at end of file
@@ -1,66 +1,22 @@
 // FILE: src/components/home/InstallmentsCard.tsx (VERSIÓN CORREGIDA)
 import { useState, useEffect } from 'react';
-import axios from 'axios';
-import { Transaction } from "@/types";
+import { UpcomingInstallment } from "@/types";
+import { fetchHomeBundle } from "@/lib/api";
 import { motion } from 'framer-motion';
 import { Card } from '@/components/ui/card';
-import { format, isFuture, isToday, parseISO } from 'date-fns';
+import { format, parseISO } from 'date-fns';
 import { es } from 'date-fns/locale';
 
-interface UpcomingInstallment {
-  id: string;
-  description: string;
-  details: string;
-  date: string;
-  amount: number;
-}
-
 export const InstallmentsCard = () => {
   const [upcoming, setUpcoming] = useState<UpcomingInstallment[]>([]);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-  const API_URL = "https://entrega-topicos-backend.onrender.com/api/expenses/8323618720";
-
     const fetchAndProcess = async () => {
       try {
-        const response = await axios.get<Transaction[]>(API_URL);
-        const allTransactions = response.data;
-
-        const installmentTxs = allTransactions.filter(t => t.installment_plan_id);
-
-        const plans: Record<string, Transaction[]> = {};
-        installmentTxs.forEach(tx => {
-          const planId = tx.installment_plan_id!;
-          if (!plans[planId]) { plans[planId] = []; }
-          plans[planId].push(tx);
-        });
-
-        const nextInstallments: UpcomingInstallment[] = [];
-        Object.values(plans).forEach(planTxs => {
-          // --- LÓGICA CORREGIDA ---
-          // 1. Ordenamos las cuotas de un plan por fecha, de la más vieja a la más nueva
-          const sortedPlanTxs = planTxs.sort((a, b) => new Date(a.date).getTime() - new Date(b.date).getTime());
-          
-          // 2. Buscamos la primera cuota cuya fecha sea hoy o en el futuro
-          const nextTx = sortedPlanTxs.find(tx => {
-            const txDate = parseISO(tx.date);
-            return isToday(txDate) || isFuture(txDate);
-          });
-
-          if (nextTx) {
-            nextInstallments.push({
-              id: nextTx.id,
-              description: nextTx.description || nextTx.category,
-              details: nextTx.installment_details || '',
-              date: nextTx.date,
-              amount: nextTx.amount,
-            });
-          }
-        });
-
-        nextInstallments.sort((a, b) => new Date(a.date).getTime() - new Date(b.date).getTime());
-        setUpcoming(nextInstallments);
+        // El backend devuelve la próxima cuota de cada plan, ordenadas por vencimiento
+        const bundle = await fetchHomeBundle();
+        setUpcoming(bundle.installments);
 
       } catch (error) {
         console.error("Error al procesar las cuotas:", error);
@@ -91,6 +47,7 @@ export const InstallmentsCard = () => {
             </div>
             <p className="text-xs text-muted-foreground dark:text-slate-400">
               {item.details} • Vence: {format(parseISO(item.date), "d 'de' MMMM", { locale: es })}
+              {" "}• Restan ${item.remaining_amount.toLocaleString("es-AR")}
             </p>
           </div>
         ))}
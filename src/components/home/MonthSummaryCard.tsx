@@ -1,31 +1,18 @@
 // FILE: src/components/home/MonthSummaryCard.tsx (CORREGIDO CON FILTRO DE FECHA)
 import { useState, useEffect } from 'react';
-import axios from 'axios';
-import { Transaction } from "@/types";
 import { motion } from "framer-motion";
-import { isThisMonth, parseISO } from 'date-fns'; // <-- 1. IMPORTAMOS LA FUNCIÓN DE FECHA
+import { fetchHomeBundle } from "@/lib/api";
 
 export const MonthSummaryCard = () => {
   const [totalSpent, setTotalSpent] = useState(0);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-  const API_URL = "https://entrega-topicos-backend.onrender.com/api/expenses/8323618720";
-
     const fetchAndCalculate = async () => {
       try {
-        const response = await axios.get<Transaction[]>(API_URL);
-        const allTransactions = response.data;
-
-        // --- 2. FILTRAMOS SOLO LOS GASTOS DE ESTE MES ---
-        const thisMonthTransactions = allTransactions.filter(t => 
-          isThisMonth(parseISO(t.date))
-        );
-
-        // 3. Calculamos el total solo con los gastos filtrados
-        const totalDeEsteMes = thisMonthTransactions.reduce((sum, t) => sum + t.amount, 0);
-        
-        setTotalSpent(totalDeEsteMes);
+        // El total del mes se calcula en el backend
+        const bundle = await fetchHomeBundle();
+        setTotalSpent(bundle.month.total);
 
       } catch (error) {
         console.error("Error al calcular el resumen del mes:", error);
@@ -1,7 +1,6 @@
 import { useEffect, useState } from "react";
-import axios from "axios";
-import { Transaction } from "@/types";
 import { motion } from "framer-motion";
+import { fetchHomeBundle } from "@/lib/api";
 
 const normalizeMethod = (method: string) => {
   const m = method.trim().toLowerCase();
@@ -17,14 +16,12 @@ export const PaymentSummary = () => {
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-  const API_URL = "https://entrega-topicos-backend.onrender.com/api/expenses/8323618720";
-    axios.get<Transaction[]>(API_URL).then(res => {
-      const data = res.data;
+    fetchHomeBundle().then(({ payment_methods: groups }) => {
       const grouped: Record<string, number> = {};
-      data.forEach(tx => {
-        const rawMethod = tx.payment_method || "Sin especificar";
+      groups.forEach(group => {
+        const rawMethod = group.key || "Sin especificar";
         const method = normalizeMethod(rawMethod);
-        grouped[method] = (grouped[method] || 0) + tx.amount;
+        grouped[method] = (grouped[method] || 0) + group.total;
       });
       setSummary(grouped);
       setLoading(false);
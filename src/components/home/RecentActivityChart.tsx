@@ -1,11 +1,10 @@
 import { useState, useEffect } from 'react';
-import axios from 'axios';
-import { Transaction } from "@/types";
 import { Card } from '@/components/ui/card';
 import { motion } from 'framer-motion';
 import { BarChart, Bar, XAxis, YAxis, Tooltip, ResponsiveContainer } from 'recharts';
-import { format, parseISO, subDays, isAfter } from 'date-fns';
+import { format, parseISO } from 'date-fns';
 import { es } from 'date-fns/locale';
+import { fetchTimeseries } from "@/lib/api";
 
 interface DailyTotal {
   name: string;
@@ -17,31 +16,16 @@ export const RecentActivityChart = () => {
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-  const API_URL = "https://entrega-topicos-backend.onrender.com/api/expenses/8323618720";
-
     const fetchDataAndProcess = async () => {
       try {
-        const response = await axios.get<Transaction[]>(API_URL);
-        const allTransactions = response.data;
-        const sevenDaysAgo = subDays(new Date(), 7);
-
-        const recentTxs = allTransactions.filter(t => isAfter(parseISO(t.date), sevenDaysAgo));
-
-        const dailyTotals: Record<string, number> = {};
-        recentTxs.forEach(t => {
-          const dayName = format(parseISO(t.date), "eee", { locale: es });
-          const dateKey = format(parseISO(t.date), "yyyy-MM-dd");
-          const key = `${dateKey}_${dayName}`;
-          dailyTotals[key] = (dailyTotals[key] || 0) + t.amount;
-        });
+        // Los 7 días completos (0 si no hubo gastos), ya ordenados por fecha
+        const { buckets, series } = await fetchTimeseries("7days", "day");
 
-        const chartData = Object.entries(dailyTotals)
-          .map(([key, total]) => ({
-            fullDate: key.split('_')[0],
-            name: key.split('_')[1],
-            total,
-          }))
-          .sort((a, b) => a.fullDate.localeCompare(b.fullDate));
+        const chartData = buckets.map((bucket, i) => ({
+          fullDate: bucket,
+          name: format(parseISO(bucket), "eee", { locale: es }),
+          total: series.length ? series[0].total[i] : 0,
+        }));
 
         setData(chartData);
 
@@ -1,7 +1,7 @@
 import { useState, useEffect } from 'react';
-import axios from 'axios';
 import { Transaction } from "@/types";
-import { format, parseISO, isThisMonth } from "date-fns";
+import { fetchHomeBundle } from "@/lib/api";
+import { format, parseISO } from "date-fns";
 import { es } from "date-fns/locale";
 import { Button } from "@/components/ui/button";
 import { ArrowRight } from "lucide-react";
@@ -18,14 +18,11 @@ export const RecentTransactions = ({ onViewAll }: RecentTransactionsProps) => {
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-  const API_URL = "https://entrega-topicos-backend.onrender.com/api/expenses/8323618720";
-
     const fetchTransactions = async () => {
       try {
-        const response = await axios.get<Transaction[]>(API_URL);
-        const allTransactions = response.data;
-        const thisMonthTransactions = allTransactions.filter(t => isThisMonth(parseISO(t.date)));
-        setTransactions(thisMonthTransactions);
+        // Últimos movimientos del mes, ya ordenados y limitados por el backend
+        const bundle = await fetchHomeBundle();
+        setTransactions(bundle.recent);
       } catch (error) {
         console.error("Error al obtener las transacciones:", error);
       } finally {
@@ -1,6 +1,5 @@
-import { Transaction } from "@/types";
 import { useState, useEffect } from 'react';
-import axios from 'axios';
+import { fetchHomeBundle } from "@/lib/api";
 import { motion } from 'framer-motion';
 import { Card } from "@/components/ui/card";
 
@@ -19,20 +18,17 @@ export const TopCategories = () => {
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-  const API_URL = "https://entrega-topicos-backend.onrender.com/api/expenses/8323618720";
-
     const fetchDataAndProcess = async () => {
       try {
-        const response = await axios.get<Transaction[]>(API_URL);
-        const allTransactions = response.data;
+        const { categories: groups } = await fetchHomeBundle();
 
         const summary: { [key: string]: number } = {};
         CATEGORIAS_A_MOSTRAR.forEach(cat => { summary[cat.toLowerCase()] = 0; });
 
-        allTransactions.forEach(transaction => {
-          const categoryKey = transaction.category.toLowerCase();
+        groups.forEach(group => {
+          const categoryKey = (group.key || "").toLowerCase();
           if (summary.hasOwnProperty(categoryKey)) {
-            summary[categoryKey] += transaction.amount;
+            summary[categoryKey] += group.total;
           }
         });
 
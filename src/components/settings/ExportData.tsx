@@ -1,30 +1,36 @@
 import { Card } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
 import { Download } from "lucide-react";
+import { API_BASE_URL, USER_ID } from "@/lib/api";
 
-export const ExportData = () => {
-  // --- CONFIGURACIÓN ---
-  // Pega la URL BASE de tu API de Replit aquí
-  const API_BASE_URL = "https://entrega-topicos-backend.onrender.com";
-  // --------------------
-
-  // Construimos la URL completa para la exportación
-  const exportUrl = `${API_BASE_URL}/export`;
+// El backend genera el archivo en streaming, así que el tamaño del historial
+// no importa: el navegador va recibiendo los bytes a medida que se leen.
+const exportUrl = (format: "csv" | "jsonl" | "parquet") =>
+  `${API_BASE_URL}/api/users/${USER_ID}/export?format=${format}&period=all`;
 
+export const ExportData = () => {
   return (
     <Card className="p-6 shadow-soft dark:bg-slate-800 dark:border dark:border-slate-700">
       <h3 className="text-lg font-semibold mb-2 dark:text-slate-200">Exportar Datos</h3>
       <p className="text-sm text-muted-foreground mb-4 dark:text-slate-400">
-        Descarga todas tus transacciones en formato CSV para análisis externo o respaldo.
+        Descarga todas tus transacciones en formato CSV para análisis externo o respaldo,
+        o en Parquet si vas a trabajar con pandas, DuckDB o similares.
       </p>
-      
-      {/* El botón ahora está dentro de un enlace (<a>) que apunta a la URL de exportación */}
-      <a href={exportUrl} download>
-        <Button className="w-full md:w-auto">
-          <Download className="w-4 h-4 mr-2" />
-          Exportar a CSV
-        </Button>
-      </a>
+
+      <div className="flex flex-col md:flex-row gap-2">
+        <a href={exportUrl("csv")} download>
+          <Button className="w-full md:w-auto">
+            <Download className="w-4 h-4 mr-2" />
+            Exportar a CSV
+          </Button>
+        </a>
+        <a href={exportUrl("parquet")} download>
+          <Button variant="outline" className="w-full md:w-auto">
+            <Download className="w-4 h-4 mr-2" />
+            Exportar a Parquet
+          </Button>
+        </a>
+      </div>
     </Card>
   );
-};
\ No newline at end of file
+};
@@ -0,0 +1,82 @@
+import axios from 'axios';
+import { CategoryCount, ExpensePage, HomeBundle, SearchPage, SummaryResponse, TimeseriesResponse } from "@/types";
+
+// --- CONFIGURACIÓN ---
+export const API_BASE_URL = "https://entrega-topicos-backend.onrender.com";
+export const USER_ID = "8323618720";
+// --------------------
+
+export type SummaryPeriod = "current" | "last" | "week" | "month" | "7days" | "90days" | "all";
+export type SummaryGroupBy = "category" | "payment_method" | "day" | "month";
+
+// Totales agrupados calculados en el backend (GROUP BY en SQL)
+export const fetchSummary = async (period: SummaryPeriod, groupBy: SummaryGroupBy, limit?: number) => {
+  const response = await axios.get<SummaryResponse>(`${API_BASE_URL}/api/users/${USER_ID}/summary`, {
+    params: { period, group_by: groupBy, limit },
+  });
+  return response.data;
+};
+
+export type TimeseriesGranularity = "day" | "week" | "month";
+
+// Serie de tiempo con todos los buckets (0 donde no hubo gastos), media móvil
+// y diferencia con el bucket anterior, lista para graficar
+export const fetchTimeseries = async (
+  period: SummaryPeriod,
+  granularity: TimeseriesGranularity = "day",
+  breakdown?: "category" | "payment_method",
+) => {
+  const response = await axios.get<TimeseriesResponse>(`${API_BASE_URL}/api/users/${USER_ID}/timeseries`, {
+    params: { period, granularity, breakdown },
+  });
+  return response.data;
+};
+
+export interface ExpenseQuery {
+  cursor?: string | null;
+  limit?: number;
+  start?: string;
+  end?: string;
+  category?: string;
+  payment_method?: string;
+  installment_plan_id?: string;
+}
+
+// Una página del historial (paginación por cursor, filtros del lado del servidor)
+export const fetchExpensesPage = async (query: ExpenseQuery = {}) => {
+  const response = await axios.get<ExpensePage>(`${API_BASE_URL}/api/users/${USER_ID}/expenses`, {
+    params: { ...query, cursor: query.cursor || undefined },
+  });
+  return response.data;
+};
+
+// Búsqueda por texto en el backend (prefijos, sin tildes, ordenada por relevancia)
+export const searchExpenses = async (q: string, query: Omit<ExpenseQuery, "installment_plan_id"> = {}) => {
+  const response = await axios.get<SearchPage>(`${API_BASE_URL}/api/users/${USER_ID}/search`, {
+    params: { ...query, q, cursor: query.cursor || undefined },
+  });
+  return response.data;
+};
+
+// Categorías usadas con cantidad de gastos (sale del rollup mensual)
+export const fetchCategories = async () => {
+  const response = await axios.get<CategoryCount[]>(`${API_BASE_URL}/api/users/${USER_ID}/categories`);
+  return response.data;
+};
+
+// Los widgets de inicio comparten un único pedido al bundle: el primero que
+// monta lo dispara y los demás reusan la misma promesa durante unos segundos.
+const HOME_BUNDLE_TTL_MS = 30_000;
+let homeBundleRequest: { promise: Promise<HomeBundle>; at: number } | null = null;
+
+export const fetchHomeBundle = () => {
+  const now = Date.now();
+  if (!homeBundleRequest || now - homeBundleRequest.at > HOME_BUNDLE_TTL_MS) {
+    const promise = axios
+      .get<HomeBundle>(`${API_BASE_URL}/api/users/${USER_ID}/home`, { params: { period: "all" } })
+      .then(response => response.data);
+    promise.catch(() => { homeBundleRequest = null; });
+    homeBundleRequest = { promise, at: now };
+  }
+  return homeBundleRequest.promise;
+};
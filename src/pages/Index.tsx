@@ -130,7 +130,7 @@ const Index = () => {
               />
             </div>
             <div className="bg-white border border-gray-200 rounded-xl shadow-sm p-6 dark:bg-slate-800 dark:border-slate-700">
-              <TransactionList />
+              <TransactionList searchTerm={searchTerm} selectedCategory={selectedCategory} selectedPayment={selectedPayment} />
             </div>
           </div>
         )}
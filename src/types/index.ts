@@ -18,4 +18,97 @@ export interface CategorySpending {
   amount: number;
   percentage: number;
   color: string;
-}
\ No newline at end of file
+}
+// Respuesta de GET /api/users/{id}/expenses (una página)
+export interface ExpensePage {
+  items: Transaction[];
+  count: number;
+  next_cursor: string | null;
+}
+
+// Respuesta de GET /api/users/{id}/timeseries: un arreglo por métrica,
+// alineado con `buckets`
+export interface TimeseriesSeries {
+  key: string | null;
+  total: number[];
+  count: number[];
+  rolling_avg: number[];
+  delta: (number | null)[];
+}
+
+export interface TimeseriesResponse {
+  start: string;
+  end: string;
+  granularity: "day" | "week" | "month";
+  breakdown: "category" | "payment_method" | null;
+  window: number;
+  buckets: string[];
+  series: TimeseriesSeries[];
+  totals: {
+    total: number;
+    previous_total: number | null;
+    delta: number | null;
+    delta_pct: number | null;
+  };
+}
+
+// Respuesta de GET /api/users/{id}/search (una página, por relevancia)
+export interface SearchPage extends ExpensePage {
+  mode: "fts" | "fuzzy";
+}
+
+// Respuesta de GET /api/users/{id}/categories
+export interface CategoryCount {
+  category: string;
+  count: number;
+  total: number;
+  last_month: string;
+}
+
+// Respuesta de GET /api/users/{id}/summary
+export interface SummaryGroup {
+  key: string | null;
+  total: number;
+  count: number;
+}
+
+export interface UpcomingInstallment {
+  id: string;
+  plan_id: string;
+  description: string;
+  details: string;
+  date: string;
+  amount: number;
+  remaining: number;
+  remaining_amount: number;
+  plan_total: number;
+  installments: number;
+}
+
+// Respuesta de GET /api/users/{id}/home (todos los widgets de inicio)
+export interface HomeBundle {
+  month: {
+    start: string;
+    end: string;
+    total: number;
+    count: number;
+    previous_total: number;
+    delta: number;
+    delta_pct: number | null;
+  };
+  period: { start: string; end: string };
+  categories: SummaryGroup[];
+  payment_methods: SummaryGroup[];
+  recent: Transaction[];
+  installments: UpcomingInstallment[];
+  timings_ms: Record<string, number>;
+}
+
+export interface SummaryResponse {
+  start: string;
+  end: string;
+  group_by: string;
+  total: number;
+  count: number;
+  groups: SummaryGroup[];
+}